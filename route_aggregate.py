@@ -0,0 +1,96 @@
+"""
+Aggregation of co-located orders into shared stops.
+
+Order files often hold several orders for one address, e.g. a few
+consignees in one Katowice building. Orders within radius km of the first
+order of a group become one stop with the summed weight and service time
+and the tightest time window, at the coordinates of that first order, so
+sort2 permutes stops instead of orders. Orders are only merged while the
+window stays non-empty and the stop fits the largest vehicle.
+"""
+import math
+import numpy as np
+from route_distance import EARTH_RADIUS
+from route_index import GridIndex
+from route_store import DEPOT, ROUTE_DTYPE, StopTable
+
+
+def _crowded(lon, lat, radius):
+    # Whether each point may have another within radius km; a point alone
+    # in its 3x3 block of grid cells at least radius wide has none
+    dlat = max(math.degrees(radius / EARTH_RADIUS), 1e-6)
+    dlon = dlat / max(math.cos(math.radians(min(float(np.abs(lat).max()) + dlat, 89.9))), 1e-9)
+    cx = np.floor((lon - lon.min()) / dlon).astype(np.int64) + 1
+    cy = np.floor((lat - lat.min()) / dlat).astype(np.int64) + 1
+    ny = int(cy.max()) + 2
+    keys = cx * ny + cy
+    komorki, liczby = np.unique(keys, return_counts=True)
+    sasiedzi = np.zeros(len(keys), dtype=np.int64)
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            k = keys + dx * ny + dy
+            pos = np.minimum(np.searchsorted(komorki, k), len(komorki) - 1)
+            sasiedzi += np.where(komorki[pos] == k, liczby[pos], 0)
+    return sasiedzi > 1
+
+
+def aggregate_orders(orders, radius, max_weight):
+    """
+    Merge the orders of a StopTable into stops. Returns the StopTable of the
+    stops and for every order row the row of its stop; the depot is row
+    DEPOT of both.
+    """
+    n = len(orders)
+    stop_of = np.full(n, -1, dtype=ROUTE_DTYPE)
+    stop_of[DEPOT] = DEPOT
+    index = GridIndex(orders.lon, orders.lat)
+    crowded = _crowded(orders.lon, orders.lat, radius).tolist()
+    earliest, latest, weight = orders.earliest.tolist(), orders.latest.tolist(), orders.weight.tolist()
+    pierwsze = [DEPOT]
+    for i in range(1, n):
+        if stop_of[i] >= 0:
+            continue
+        stop_of[i] = len(pierwsze)
+        pierwsze.append(i)
+        if not crowded[i]:
+            continue
+        od, do, waga = earliest[i], latest[i], weight[i]
+        # Orders before i already have their stop
+        for j in index.query_radius(orders.lon[i], orders.lat[i], radius, "haversine").tolist():
+            if j <= i or stop_of[j] >= 0:
+                continue
+            if max(od, earliest[j]) > min(do, latest[j]) or waga + weight[j] > max_weight:
+                continue
+            od, do, waga = max(od, earliest[j]), min(do, latest[j]), waga + weight[j]
+            stop_of[j] = stop_of[i]
+
+    m = len(pierwsze)
+    pierwsze = np.array(pierwsze, dtype=np.intp)
+    wagi = np.zeros(m)
+    np.add.at(wagi, stop_of, orders.weight)
+    service = np.zeros(m)
+    np.add.at(service, stop_of, orders.service)
+    od = np.full(m, -np.inf)
+    np.maximum.at(od, stop_of, orders.earliest)
+    do = np.full(m, np.inf)
+    np.minimum.at(do, stop_of, orders.latest)
+    liczby = np.bincount(stop_of, minlength=m)
+
+    stops = StopTable(orders.row(DEPOT))
+    nazwy = [orders.name(p) if c == 1 else f"{orders.name(p)} ({c} orders)"
+             for p, c in zip(pierwsze[1:].tolist(), liczby[1:].tolist())]
+    city = np.array([stops.intern_name(nazwa) for nazwa in nazwy], dtype=np.int32)
+    hour = np.array([stops.intern_hour(orders.hour_text(p)) for p in pierwsze[1:].tolist()], dtype=np.int32)
+    stops.extend([(orders.lon[pierwsze[1:]], orders.lat[pierwsze[1:]], wagi[1:], city, hour,
+                   od[1:], do[1:], service[1:])])
+    return stops, stop_of
+
+
+def order_groups(stop_of, stops):
+    """
+    Orders of every stop as (starts, members): the orders of stop k are
+    members[starts[k]:starts[k + 1]], in file order.
+    """
+    members = np.argsort(stop_of, kind="stable").astype(ROUTE_DTYPE)
+    starts = np.searchsorted(stop_of[members], np.arange(stops + 1))
+    return starts, members
@@ -0,0 +1,267 @@
+"""
+Multi-day batch planning.
+
+Plans every order file of one or more directories or globs, e.g. a week of
+daily CSVs, in parallel worker processes with one RouteEngine per file. Each
+day gets its own report, Trasa_<day>.<ext> where <day> is the date in the
+file name or else the file name itself; files that would share a name are
+told apart by file name and then by number. The batch ends with a combined
+summary of all days in summary.txt and summary.json:
+
+    python route_batch.py orders/ -o reports --workers 4 --roads silesia.npz
+
+With --tour-cache FILE, tours proven optimal on one day are reused on the
+others and by later batches. With a road network the road matrices of all distinct stops of
+the batch are computed once into a RoadAtlas that every worker memory-maps,
+so a stop that repeats across days is routed only once.
+"""
+import argparse
+import datetime
+import glob
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from route_engine import RouteEngine
+from route_export import FORMATS
+from route_roads import RoadAtlas, RoadGraph
+from route_store import read_stops
+
+PATTERNS = ("*.csv", "*.csv.gz")
+# Above this many distinct stops the days compute their own road matrices
+ATLAS_LIMIT = 8000
+EXTENSIONS = {fmt: rozszerzenie for rozszerzenie, fmt in FORMATS.items()}
+
+
+def order_files(patterns):
+    """Order files of directories, globs and file names, sorted and without repeats"""
+    pliki = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for wzor in PATTERNS:
+                pliki.extend(glob.glob(os.path.join(pattern, wzor)))
+        else:
+            pliki.extend(glob.glob(pattern) or ([pattern] if os.path.isfile(pattern) else []))
+    return sorted(set(pliki))
+
+
+def _file_stem(path):
+    # File name without its .csv and .gz extensions
+    nazwa = os.path.basename(path)
+    for rozszerzenie in (".gz", ".csv"):
+        if nazwa.lower().endswith(rozszerzenie):
+            nazwa = nazwa[:-len(rozszerzenie)]
+    return nazwa
+
+
+def day_name(path):
+    """The YYYY-MM-DD date in a file name, or the name without its extensions"""
+    data = re.search(r"\d{4}-\d{2}-\d{2}", os.path.basename(path))
+    if data:
+        return data.group()
+    return _file_stem(path)
+
+
+def day_names(paths):
+    """
+    Unique report names of order files: the day_name of each, the file name
+    when several files have the same date, numbered when even those repeat
+    """
+    dni = [day_name(path) for path in paths]
+    wynik, zajete = [], set()
+    for path, dzien in zip(paths, dni):
+        nazwa = _file_stem(path) if dni.count(dzien) > 1 else dzien
+        unikalna, k = nazwa, 1
+        while unikalna in zajete:
+            k += 1
+            unikalna = f"{nazwa}_{k}"
+        zajete.add(unikalna)
+        wynik.append(unikalna)
+    return wynik
+
+
+def build_atlas(paths, graph, directory, speed, cache_dir=None, workers=1):
+    """RoadAtlas of every distinct stop in the order files, None if there are too many"""
+    lon, lat = [], []
+    for path in paths:
+        table, _ = read_stops([path], RouteEngine().depot)
+        lon.append(table.lon)
+        lat.append(table.lat)
+    lon, lat = np.concatenate(lon), np.concatenate(lat)
+    if len(np.unique(np.column_stack((lon, lat)), axis=0)) > ATLAS_LIMIT:
+        return None
+    return RoadAtlas.build(graph, lon, lat, directory, speed, cache_dir, workers)
+
+
+def plan_day(path, output_dir, options, day=None):
+    """
+    Plan one order file and write its report, Trasa_<day>, in a worker
+    process; returns the day's summary. day defaults to day_name(path).
+    """
+    start = time.perf_counter()
+    engine = RouteEngine()
+    engine.workers = options['day_workers']
+    engine.solver_mode = options['mode']
+    engine.split_mode = options['split']
+    engine.time_budget = options['time_budget']
+    engine.aggregate_radius = options['aggregate']
+    engine.tour_cache_path = options['tour_cache']
+    if options['roads']:
+        if options['atlas']:
+            engine.road_atlas = RoadAtlas(options['atlas'])
+        engine.load_road_graph(options['roads'])
+    count = engine.load_csv(path)
+    if not count and engine.load_errors:
+        _, linia, powod = engine.load_errors[0]
+        raise ValueError(f"line {linia}: {powod}")
+    engine.process_all_routes()
+
+    day = day or day_name(path)
+    raport = engine.export_routes(os.path.join(output_dir, f"Trasa_{day}{EXTENSIONS[options['format']]}"),
+                                  options['format'])
+    drivers = engine.calculate_driver_stats()
+    return {
+        'day': day,
+        'file': path,
+        'report': raport,
+        'stops': count,
+        'skipped': len(engine.load_errors),
+        'aggregation': engine.aggregation,
+        'vehicles': len(drivers),
+        'routes': {name: sum(1 for d in drivers if d['category'] == name) for name in "ABC"},
+        'weight': sum(d['weight'] for d in drivers),
+        'total_km': engine.total_distance(),
+        'proven_optimal': sum(1 for d in drivers if d['optimal']),
+        'tours_cached': engine.last_run.counters.get("sub-routes cached", 0),
+        'seconds': round(time.perf_counter() - start, 3)
+    }
+
+
+def plan_batch(paths, output_dir, mode="exact", split="sequential", time_budget=2.0,
+               workers=None, roads=None, fmt="text", progress=None, aggregate=None, tour_cache=None):
+    """
+    Plan the order files concurrently, writing a report per day to
+    output_dir; returns the summaries of the days in file order, failed
+    days as {'day', 'file', 'error'}. progress(summary) is called as each
+    day finishes. aggregate merges each day's orders within that many km
+    into one stop. tour_cache is the tour cache file the days share, None
+    plans every day without one.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    cpus = os.cpu_count() or 1
+    workers = max(min(workers or cpus, len(paths)), 1)
+    options = {
+        'mode': mode,
+        'split': split,
+        'time_budget': time_budget,
+        # CPUs left over when there are fewer days than CPUs go to sort2
+        'day_workers': max(cpus // workers, 1),
+        'roads': roads,
+        'atlas': None,
+        'format': fmt,
+        'aggregate': aggregate,
+        'tour_cache': tour_cache
+    }
+
+    with tempfile.TemporaryDirectory(prefix="route_atlas_") as katalog:
+        if roads:
+            engine = RouteEngine()
+            atlas = build_atlas(paths, RoadGraph.load(roads), katalog, engine.average_speed,
+                                engine.road_cache_dir, cpus)
+            options['atlas'] = atlas and atlas.directory
+
+        # Days with the same date must not overwrite each other's report
+        dni = dict(zip(paths, day_names(paths)))
+        wyniki = {}
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            zadania = {pool.submit(plan_day, path, output_dir, options, dni[path]): path for path in paths}
+            for zadanie in as_completed(zadania):
+                path = zadania[zadanie]
+                try:
+                    wynik = zadanie.result()
+                except Exception as e:
+                    wynik = {'day': dni[path], 'file': path, 'error': str(e)}
+                wyniki[path] = wynik
+                if progress is not None:
+                    progress(wynik)
+    return [wyniki[path] for path in paths]
+
+
+def summary_text(days):
+    """The combined summary of a batch as a table with a total row"""
+    linie = ["=== Route Management System Batch Summary ===",
+             f"Generated on: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", "",
+             f"{'Day':<12} {'Stops':>7} {'A':>4} {'B':>4} {'C':>4} {'Vehicles':>8} "
+             f"{'Weight kg':>11} {'Distance km':>12} {'Optimal':>8} {'Seconds':>8}"]
+    udane = [d for d in days if 'error' not in d]
+    for d in days:
+        if 'error' in d:
+            linie.append(f"{d['day']:<12} failed: {d['error']}")
+            continue
+        linie.append(f"{d['day']:<12} {d['stops']:>7} {d['routes']['A']:>4} {d['routes']['B']:>4} "
+                     f"{d['routes']['C']:>4} {d['vehicles']:>8} {d['weight']:>11.0f} {d['total_km']:>12.2f} "
+                     f"{d['proven_optimal']:>8} {d['seconds']:>8.2f}")
+    linie.append(f"{'Total':<12} {sum(d['stops'] for d in udane):>7} "
+                 + " ".join(f"{sum(d['routes'][name] for d in udane):>4}" for name in "ABC")
+                 + f" {sum(d['vehicles'] for d in udane):>8} {sum(d['weight'] for d in udane):>11.0f} "
+                 f"{sum(d['total_km'] for d in udane):>12.2f} {sum(d['proven_optimal'] for d in udane):>8} "
+                 f"{sum(d['seconds'] for d in udane):>8.2f}")
+    return "\n".join(linie) + "\n"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Plan many daily order files at once")
+    parser.add_argument("orders", nargs="+",
+                        help="directories of CSV or CSV.gz order files, globs or file names")
+    parser.add_argument("-o", "--output", default=".", help="directory for the reports and the summary")
+    parser.add_argument("--format", choices=sorted(EXTENSIONS), default="text",
+                        help="format of the daily reports")
+    parser.add_argument("--mode", choices=["exact", "local"], default="exact",
+                        help="sub-route optimizer")
+    parser.add_argument("--time-budget", type=float, default=2.0,
+                        help="seconds for local search over all routes of a day")
+    parser.add_argument("--split", choices=["sequential", "sweep", "savings"], default="sequential",
+                        help="how categories are split into vehicles")
+    parser.add_argument("--workers", type=int, help="days planned at once (default: CPU count)")
+    parser.add_argument("--aggregate", type=float, metavar="KM",
+                        help="merge orders within KM of each other into one stop (0: same coordinates only)")
+    parser.add_argument("--roads", metavar="GRAPH",
+                        help="road network .npz from route_roads.py; distances and drive times follow the roads")
+    parser.add_argument("--tour-cache", metavar="FILE",
+                        help="remember optimal tours across days and batches in FILE (default: off)")
+    args = parser.parse_args(argv)
+    if args.aggregate is not None and args.aggregate < 0:
+        parser.error("--aggregate takes a distance of 0 km or more")
+
+    paths = order_files(args.orders)
+    if not paths:
+        print(f"No order files in {', '.join(args.orders)}", file=sys.stderr)
+        return 1
+    print(f"Planning {len(paths)} days")
+
+    def progress(day):
+        if 'error' in day:
+            print(f"{day['day']}: failed: {day['error']}", file=sys.stderr)
+        else:
+            print(f"{day['day']}: {day['vehicles']} vehicles, {day['total_km']:.2f} km "
+                  f"in {day['seconds']:.2f} s -> {day['report']}")
+
+    days = plan_batch(paths, args.output, args.mode, args.split, args.time_budget,
+                      args.workers, args.roads, args.format, progress, args.aggregate,
+                      args.tour_cache)
+    tekst = summary_text(days)
+    with open(os.path.join(args.output, "summary.txt"), "w", encoding='utf-8') as plik:
+        plik.write(tekst)
+    with open(os.path.join(args.output, "summary.json"), "w", encoding='utf-8') as plik:
+        json.dump({'generated': datetime.datetime.now().isoformat(timespec='seconds'), 'days': days}, plik, indent=2)
+    print(tekst, end="")
+    print(f"Summary saved to {os.path.join(args.output, 'summary.txt')} and summary.json")
+    return 1 if any('error' in day for day in days) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
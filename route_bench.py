@@ -0,0 +1,181 @@
+"""
+Benchmarks of the planning pipeline on synthetic stops around Spodek.
+
+Every stage of RouteEngine (kategoryzacja, sort1, podziel, sort2, driver
+stats, the report file and the Statistics text) is timed headlessly for
+each distribution, size and algorithm, with the peak Python memory of the
+load, of the whole plan and of each later stage, and the plans are compared
+on total km and vehicle count. Loading and planning go through the engine's
+own _load and _plan, so the bench measures exactly what a run does. Results
+are written as JSON so runs can be diffed:
+
+    python route_bench.py --sizes 10 100 1000 --split sequential sweep -o bench.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from route_engine import RouteEngine
+from route_profile import RunProfile
+from route_store import StopTable
+
+DISTRIBUTIONS = ("uniform", "clustered", "heavy")
+STAGES = ("load", "kategoryzacja", "sort1", "podziel", "sort2",
+          "calculate_driver_stats", "save_all_routes", "stats_report")
+PLAN_STAGES = ("kategoryzacja", "sort1", "podziel", "sort2")
+
+
+def synthetic_stops(distribution, size, depot, seed=0, radius=1.2):
+    """
+    Reproducible StopTable of size stops within about radius degrees of the
+    depot. "clustered" puts them around a few towns, "heavy" adds 2% of
+    orders heavier than most vehicles can carry.
+    """
+    rng = np.random.default_rng([seed, DISTRIBUTIONS.index(distribution), size])
+    table = StopTable(depot)
+    x0, y0 = depot[0], depot[1]
+
+    if distribution == "clustered":
+        miasta = max(3, size // 200)
+        srodki = rng.uniform(-radius, radius, (miasta, 2))
+        miasto = rng.integers(0, miasta, size)
+        lon = x0 + srodki[miasto, 0] + rng.normal(0, 0.03, size)
+        lat = y0 + srodki[miasto, 1] + rng.normal(0, 0.03, size)
+        nazwy = np.array([table.intern_name(f"Town {k + 1}") for k in range(miasta)], dtype=np.int32)
+        city = nazwy[miasto]
+    else:
+        lon = x0 + rng.uniform(-radius, radius, size)
+        lat = y0 + rng.uniform(-radius, radius, size)
+        city = np.array([table.intern_name(f"Stop {k + 1}") for k in range(size)], dtype=np.int32)
+
+    weight = np.round(rng.uniform(5, 800, size))
+    if distribution == "heavy":
+        ciezkie = rng.random(size) < 0.02
+        weight[ciezkie] = np.round(rng.uniform(2000, 9000, int(ciezkie.sum())))
+
+    godziny = np.array([table.intern_hour("6:00"), table.intern_hour("8:00")], dtype=np.int32)
+    hour = godziny[(rng.random(size) < 0.1).astype(np.intp)]
+    table.extend([(lon, lat, weight, city, hour, np.full(size, np.nan),
+                   np.full(size, np.inf), np.zeros(size))])
+    return table
+
+
+def _measure(stats, stage, memory, func, *args, **kwargs):
+    if memory:
+        tracemalloc.reset_peak()
+        start_mem = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    wynik = func(*args, **kwargs)
+    stats[stage] = {'seconds': round(time.perf_counter() - start, 6)}
+    if memory:
+        stats[stage]['peak_mb'] = round((tracemalloc.get_traced_memory()[1] - start_mem) / 2**20, 3)
+    return wynik
+
+
+def run_case(table, split_mode, solver_mode, time_budget=2.0, workers=None, memory=True, report_dir=None):
+    """Plan one stop table stage by stage, returns the timings and the plan quality"""
+    engine = RouteEngine()
+    engine.tour_cache_path = None
+    engine.split_mode = split_mode
+    engine.solver_mode = solver_mode
+    engine.time_budget = time_budget
+    if workers:
+        engine.workers = workers
+    stats = {}
+    plan = {}
+
+    def plan_stages():
+        # The stages of one _plan, timed by the engine itself
+        engine.run_profile = RunProfile()
+        try:
+            engine._plan(split_mode)
+        finally:
+            engine.run_profile, run = None, engine.run_profile
+        for stage in PLAN_STAGES:
+            stats[stage] = {'seconds': round(run.stages.get(stage, 0.0), 6)}
+
+    if memory:
+        tracemalloc.start()
+    try:
+        _measure(stats, "load", memory, engine._load, table)
+        _measure(plan, "plan", memory, plan_stages)
+
+        driver_stats = _measure(stats, "calculate_driver_stats", memory, engine.calculate_driver_stats)
+        with tempfile.TemporaryDirectory(dir=report_dir) as katalog:
+            _measure(stats, "save_all_routes", memory, engine.save_all_routes,
+                     os.path.join(katalog, "Trasa.txt"))
+        _measure(stats, "stats_report", memory, engine.stats_report)
+    finally:
+        if memory:
+            tracemalloc.stop()
+
+    return {
+        'split': split_mode,
+        'solver': solver_mode,
+        'stages': stats,
+        'plan_peak_mb': plan['plan'].get('peak_mb'),
+        'seconds': round(sum(s['seconds'] for s in stats.values()), 6),
+        'total_km': round(sum(s['distance'] for s in driver_stats), 2),
+        'vehicles': len(driver_stats),
+        'proven_optimal': sum(1 for r in engine.sort2_report if r['optimal'])
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the route planning pipeline on synthetic stops")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000, 100000],
+                        help="numbers of stops")
+    parser.add_argument("--distributions", nargs="+", choices=DISTRIBUTIONS, default=list(DISTRIBUTIONS))
+    parser.add_argument("--split", nargs="+", choices=["sequential", "sweep", "savings"],
+                        default=["sequential", "sweep", "savings"], help="split modes to compare")
+    parser.add_argument("--mode", nargs="+", choices=["exact", "local"], default=["local"],
+                        help="sub-route optimizers to compare")
+    parser.add_argument("--time-budget", type=float, default=2.0,
+                        help="seconds for local search over all routes")
+    parser.add_argument("--workers", type=int, help="optimizer processes (default: CPU count)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", action="store_true",
+                        help="skip peak memory tracking, which slows pure Python stages down")
+    parser.add_argument("-o", "--output",
+                        help="results file (default: bench_<date and time>.json in the current directory)")
+    args = parser.parse_args(argv)
+
+    depot = RouteEngine().depot
+    wyniki = {
+        'generated': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'seed': args.seed,
+        'time_budget': args.time_budget,
+        'runs': []
+    }
+    for distribution in args.distributions:
+        for size in args.sizes:
+            table = synthetic_stops(distribution, size, depot, args.seed)
+            for split_mode in args.split:
+                for solver_mode in args.mode:
+                    run = run_case(table, split_mode, solver_mode, args.time_budget,
+                                   args.workers, not args.no_memory)
+                    run.update({'distribution': distribution, 'size': size})
+                    wyniki['runs'].append(run)
+                    print(f"{distribution:>9} {size:>7} {split_mode:>10} {solver_mode:>5}: "
+                          f"{run['seconds']:9.3f} s  {run['total_km']:>12.2f} km  "
+                          f"{run['vehicles']:>6} vehicles")
+
+    nazwa_pliku = args.output or f"bench_{datetime.datetime.now():%Y-%m-%d_%H%M%S}.json"
+    with open(nazwa_pliku, "w", encoding='utf-8') as plik:
+        json.dump(wyniki, plik, indent=2)
+    print(f"Results saved to {nazwa_pliku}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
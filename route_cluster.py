@@ -0,0 +1,99 @@
+"""
+Capacity-feasible geographic splitting of one category into sub-routes.
+
+Alternatives to the sequential cut of RouteEngine.podziel. Both return lists
+of sub-routes as lists of positions into the weights given, every sub-route
+within capacity (a single stop heavier than capacity gets a route of its own).
+"""
+import numpy as np
+
+
+def sweep_split(angles, weights, capacity):
+    """
+    Sweep stops by polar angle around the depot, cutting when the capacity
+    would be exceeded. The sweep starts at the widest angular gap so no
+    cluster straddles two far-apart directions.
+    """
+    n = len(angles)
+    if n == 0:
+        return []
+    order = np.argsort(angles, kind="stable")
+    sorted_angles = np.asarray(angles)[order]
+    gaps = np.diff(np.append(sorted_angles, sorted_angles[0] + 2 * np.pi))
+    start = (int(np.argmax(gaps)) + 1) % n
+    order = np.roll(order, -start)
+
+    podlisty = []
+    aktualna = []
+    suma = 0
+    for i in order:
+        i = int(i)
+        if aktualna and suma + weights[i] > capacity:
+            podlisty.append(aktualna)
+            aktualna = []
+            suma = 0
+        aktualna.append(i)
+        suma += weights[i]
+    if aktualna:
+        podlisty.append(aktualna)
+    return podlisty
+
+
+def savings_split(dist, weights, capacity):
+    """
+    Clarke-Wright parallel savings. dist is a square matrix with the depot at
+    index 0 and the stops at 1..n in the order of weights. Sub-routes are
+    returned in the merged driving order.
+    """
+    dist = np.asarray(dist, dtype=float)
+    n = len(weights)
+    rows, cols = np.triu_indices(n, k=1)
+    return savings_split_pairs(dist[0, 1:], rows, cols, dist[rows + 1, cols + 1], weights, capacity)
+
+
+def savings_split_pairs(depot_dist, rows, cols, pair_dist, weights, capacity):
+    """
+    Clarke-Wright savings over candidate pairs only, e.g. each stop with its
+    nearest neighbours, for categories too large for a full matrix.
+    depot_dist[i] is the depot distance of stop i and pair_dist[k] the
+    distance between stops rows[k] and cols[k].
+    """
+    n = len(weights)
+    if n == 0:
+        return []
+
+    routes = {i: [i] for i in range(n)}
+    route_of = list(range(n))
+    load = {i: weights[i] for i in range(n)}
+
+    # Savings of serving i and j in one tour instead of two, best first
+    depot_dist = np.asarray(depot_dist, dtype=float)
+    rows = np.asarray(rows, dtype=np.intp)
+    cols = np.asarray(cols, dtype=np.intp)
+    values = depot_dist[rows] + depot_dist[cols] - np.asarray(pair_dist, dtype=float)
+    keep = values > 0
+    rows, cols, values = rows[keep], cols[keep], values[keep]
+    ranking = np.argsort(-values, kind="stable")
+
+    for k in ranking:
+        i, j = int(rows[k]), int(cols[k])
+        ri, rj = route_of[i], route_of[j]
+        if ri == rj or load[ri] + load[rj] > capacity:
+            continue
+        a, b = routes[ri], routes[rj]
+        # Both stops must be at an end of their routes to be joined
+        if a[-1] != i:
+            if a[0] != i:
+                continue
+            a.reverse()
+        if b[0] != j:
+            if b[-1] != j:
+                continue
+            b.reverse()
+        a.extend(b)
+        load[ri] += load.pop(rj)
+        del routes[rj]
+        for stop in b:
+            route_of[stop] = ri
+
+    return [routes[r] for r in sorted(routes)]
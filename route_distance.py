@@ -0,0 +1,109 @@
+"""
+Vectorized distances between stops.
+
+Coordinates are passed as separate longitude/latitude arrays, like the
+(longitude, latitude, ...) stop tuples. Two metrics are supported:
+"haversine" in kilometres and "euclidean" in raw degrees (the metric sort2
+has always optimized).
+"""
+import numpy as np
+
+EARTH_RADIUS = 6371  # km
+# Metrics computed from coordinates alone, road ones need the road graph
+COORDINATE_METRICS = ("haversine", "euclidean")
+
+
+def pair_distances(lon1, lat1, lon2, lat2, metric="haversine"):
+    """Element-wise distances, arguments broadcast like numpy arrays"""
+    if metric not in COORDINATE_METRICS:
+        raise ValueError(f"{metric} distances cannot be computed from coordinates")
+    if metric == "euclidean":
+        return np.hypot(lon1 - lon2, lat1 - lat2)
+    lon1, lat1, lon2, lat2 = map(np.radians, (lon1, lat1, lon2, lat2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def leg_distances(lon, lat, metric="haversine"):
+    """Distances between consecutive points of a route"""
+    lon = np.asarray(lon, dtype=float)
+    lat = np.asarray(lat, dtype=float)
+    return pair_distances(lon[:-1], lat[:-1], lon[1:], lat[1:], metric)
+
+
+def distance_matrix(lon, lat, metric="haversine"):
+    """Square matrix of distances between all points"""
+    lon = np.asarray(lon, dtype=float)
+    lat = np.asarray(lat, dtype=float)
+    return pair_distances(lon[:, None], lat[:, None], lon[None, :], lat[None, :], metric)
+
+
+class DistanceMatrix:
+    """
+    Distances between the Spodek depot (index 0) and all loaded stops.
+    Full matrices are built once for up to full_limit points; for larger
+    inputs the blocks that are asked for are computed on demand.
+    """
+
+    def __init__(self, lon, lat, full_limit=4000):
+        self.lon = np.asarray(lon, dtype=float)
+        self.lat = np.asarray(lat, dtype=float)
+        self.full_limit = full_limit
+        self.matrices = {}
+        # Metrics whose matrices were dropped because extend could not grow them
+        self.stale = set()
+        if len(self.lon) <= full_limit:
+            for metric in ("haversine", "euclidean"):
+                self.matrices[metric] = distance_matrix(self.lon, self.lat, metric)
+
+    @classmethod
+    def from_matrices(cls, lon, lat, matrices, full_limit=4000):
+        """Distances with matrices already computed, e.g. restored from a session"""
+        distances = cls(np.zeros(0), np.zeros(0), full_limit)
+        distances.lon = np.asarray(lon, dtype=float)
+        distances.lat = np.asarray(lat, dtype=float)
+        distances.matrices = dict(matrices)
+        return distances
+
+    def __len__(self):
+        return len(self.lon)
+
+    def extend(self, lon, lat):
+        """
+        Append points. Full matrices only get the new rows and columns, or
+        are dropped once the points outgrow full_limit. Road matrices cannot
+        be grown from coordinates, they are dropped and marked stale.
+        """
+        old = len(self.lon)
+        self.lon = np.concatenate((self.lon, np.asarray(lon, dtype=float)))
+        self.lat = np.concatenate((self.lat, np.asarray(lat, dtype=float)))
+        n = len(self.lon)
+        for metric in [m for m in self.matrices if m not in COORDINATE_METRICS]:
+            del self.matrices[metric]
+            self.stale.add(metric)
+        if n > self.full_limit:
+            self.matrices = {}
+            return
+        for metric, matrix in self.matrices.items():
+            cols = pair_distances(self.lon[:, None], self.lat[:, None],
+                                  self.lon[None, old:], self.lat[None, old:], metric)
+            grown = np.empty((n, n))
+            grown[:old, :old] = matrix
+            grown[:, old:] = cols
+            grown[old:, :] = cols.T
+            self.matrices[metric] = grown
+
+    def block(self, idx, metric="haversine"):
+        """Sub-matrix for the given point indices, in that order"""
+        idx = np.asarray(idx, dtype=np.intp)
+        if metric in self.matrices:
+            return self.matrices[metric][np.ix_(idx, idx)]
+        return distance_matrix(self.lon[idx], self.lat[idx], metric)
+
+    def legs(self, idx, metric="haversine"):
+        """Distances between consecutive point indices of a route"""
+        idx = np.asarray(idx, dtype=np.intp)
+        if metric in self.matrices:
+            return self.matrices[metric][idx[:-1], idx[1:]]
+        return leg_distances(self.lon[idx], self.lat[idx], metric)
@@ -0,0 +1,1320 @@
+"""
+Headless route planning engine.
+
+RouteEngine holds the whole kategoryzacja -> sort1 -> podziel -> sort2
+pipeline without any GUI; RouteManager in route_manager.py adds the Tk
+interface on top of it. Run this module directly to plan from the command
+line:
+
+    python route_engine.py orders.csv -o Trasa.txt --mode local --time-budget 2
+"""
+import argparse
+import datetime
+import hashlib
+import math
+import os
+import sys
+import time
+from contextlib import nullcontext
+import numpy as np
+from route_aggregate import aggregate_orders, order_groups
+from route_distance import COORDINATE_METRICS, DistanceMatrix, distance_matrix, leg_distances, pair_distances
+from route_cluster import savings_split, savings_split_pairs, sweep_split
+from route_export import export, format_for
+from route_index import GridIndex
+from route_memo import TourCache
+from route_plot import render_files
+from route_profile import RunProfile
+from route_session import read_session, write_session
+from route_roads import RoadGraph, road_matrices
+from route_schedule import KATOWICE_RUSH_HOURS, RouteSchedule, SpeedProfile, schedule_routes
+from route_store import DEPOT, ROUTE_DTYPE, TABLE_COLUMNS, StopTable, read_records, read_stops
+from route_solver import nearest_neighbour, solve, solve_parallel, tour_length
+
+# Schedules are kept in whole microseconds since midnight, the resolution of
+# the timedelta arithmetic arrival times were first computed with
+US_PER_MINUTE = 60 * 10**6
+
+
+def _route_stat(weight, length):
+    return {
+        'weight': weight,
+        'length': length,
+        'schedule': None,
+        'arrivals': None,
+        'maps_url': None,
+        'text': None
+    }
+
+
+def format_times(times):
+    """"HH:MM" texts of times in microseconds since midnight"""
+    minutes = (np.asarray(times) // US_PER_MINUTE).astype(np.int64)
+    return [f"{h:02d}:{m:02d}" for h, m in zip((minutes // 60 % 24).tolist(), (minutes % 60).tolist())]
+
+
+class RouteEngine:
+    def __init__(self):
+        self.kategoriaA = []
+        self.kategoriaB = []
+        self.kategoriaC = []
+        self.routes = np.zeros(0, dtype=ROUTE_DTYPE)
+        # Update center coordinates to Spodek's location
+        self.center = (50.266247, 19.027401)  # Katowice Spodek coordinates
+        self.depot = (19.027401, 50.266247, 0, "Spodek")
+
+        # Loaded stops live in one columnar table with the depot at index
+        # DEPOT; routes, categories and sub-routes are lists of stop indices
+        self.stops = StopTable(self.depot)
+        self.load_errors = []
+        # With aggregate_radius in km, loading merges orders that close into
+        # one stop (route_aggregate): orders keeps the loaded rows, order_stop
+        # the stop of each and aggregation the shrink; reports list every
+        # order of a stop. None keeps one stop per order and orders is stops
+        self.aggregate_radius = None
+        self.orders = self.stops
+        self.order_stop = None
+        self.aggregation = None
+        self._order_groups = None
+
+        # Distances between loaded stops, built by load_csv with the depot
+        # at index 0; sort2 optimizes in optimize_metric
+        self.distances = None
+        self.optimize_metric = "euclidean"
+        # Reported km and drive times use distance_metric: "haversine", or
+        # "road" once a road graph is loaded and its matrices fit in memory;
+        # road matrices are cached per stop set in road_cache_dir
+        self.distance_metric = "haversine"
+        self.road_graph = None
+        self.road_graph_path = None
+        # A RoadAtlas shared by several runs, e.g. the days of a batch, is
+        # sliced instead of running Dijkstra when it has all loaded stops
+        self.road_atlas = None
+        self.road_cache_dir = os.path.join(os.path.expanduser("~"), ".cache", "route_manager", "roads")
+        # Spatial index over the same points, built by the first stop query
+        # after the stops change, see spatial_index
+        self.index = None
+
+        # Sub-routes up to held_karp_limit stops are solved by bitmask DP,
+        # up to exact_limit by branch and bound, larger ones heuristically
+        self.held_karp_limit = 15
+        self.exact_limit = 20
+        # "exact" or "local"; local search stops when the time budget (seconds
+        # for a whole Process run) or the per-route budget runs out
+        self.solver_mode = "exact"
+        self.time_budget = 2.0
+        self.route_time_budget = 2.0
+        # Sub-routes are fanned out to a process pool of this many workers,
+        # unless they are all shorter than parallel_min_stops
+        self.workers = os.cpu_count() or 1
+        self.parallel_min_stops = 10
+        self.route_reports = {'A': [], 'B': [], 'C': []}
+        # "sequential" cuts the sort1 order (podziel); "sweep" and "savings"
+        # build geographically compact clusters (podziel_geo) and, with
+        # compare_split, are reported against the sequential split; that
+        # plans twice, so it is off unless asked for
+        self.split_mode = "sequential"
+        self.compare_split = False
+        self.split_report = None
+        # Above savings_full_limit stops the savings split only considers
+        # each stop's savings_neighbours nearest neighbours
+        self.savings_full_limit = 1000
+        self.savings_neighbours = 20
+        # Vehicle capacity in kg of each category, used by podziel and when
+        # late orders are inserted
+        self.capacities = {'A': 500, 'B': 1500, 'C': 10000}
+        self.cancelled = False
+        # Proven-optimal tours are remembered across runs in this file, at
+        # most tour_cache_size of them; None turns the cache off. It is read
+        # once and kept open, see tour_cache
+        self.tour_cache_path = os.path.join(os.path.expanduser("~"), ".cache", "route_manager", "tours.json")
+        self.tour_cache_size = 10000
+        self._tour_cache = None
+        # Vehicles leave the depot at day_start (minutes after midnight) and
+        # drive at average_speed km/h, or at their category's speed in
+        # category_speeds; speed_profile gives the share of that speed in
+        # each hour of the day, e.g. route_schedule.KATOWICE_RUSH_HOURS
+        self.day_start = 6 * 60
+        self.average_speed = 50
+        self.category_speeds = {}
+        self.speed_profile = None
+        # Stage timings and counters of the running process_all_routes and
+        # of the last finished one; profile_runs adds a cProfile, and
+        # write_run_log appends last_run to run_log_path as a JSON line
+        self.run_profile = None
+        self.last_run = None
+        self.profile_runs = False
+        self.run_log_path = None
+        # Maps show at most label_limit stop labels at a time
+        self.label_limit = 200
+        # Per-route stats keyed by (category, route index), see route_cache
+        self._route_stats = {}
+
+    def haversine_distance(self, lat1, lon1, lat2, lon2):
+        """
+        Calculate distance between two points on Earth using Haversine formula.
+        Returns distance in kilometers.
+        """
+        R = 6371  # Earth's radius in kilometers
+
+        # Convert to radians
+        lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+        
+        # Haversine formula
+        dlat = lat2 - lat1
+        dlon = lon2 - lon1
+        a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
+        c = 2 * math.asin(math.sqrt(a))
+        
+        return R * c
+
+    def calculate_driver_stats(self):
+        stats = []
+        self.compute_schedules()
+        
+        for category, name in [(self.kategoriaA, "A"), (self.kategoriaB, "B"), (self.kategoriaC, "C")]:
+            reports = self.route_reports[name]
+            for i, route in enumerate(category):
+                if len(route) == 0:
+                    continue
+                
+                cache = self.route_cache(name, i)
+                late = len(self.route_late(name, i))
+                stats.append({
+                    'category': name,
+                    'driver': i+1,
+                    'weight': cache['weight'],
+                    'distance': round(cache['length'], 2),  # Round to 2 decimal places
+                    # A route that misses a latest time is no optimal plan
+                    'optimal': i < len(reports) and reports[i]['optimal'] and not late,
+                    'late': late
+                })
+        
+        return stats
+
+    def category_routes(self, name):
+        return {'A': self.kategoriaA, 'B': self.kategoriaB, 'C': self.kategoriaC}[name]
+
+    def route_cache(self, name, i):
+        """
+        Cached weight and length of route i of a category. Arrival times,
+        maps link and display text are filled in on first use and dropped
+        whenever the route is edited.
+        """
+        cache = self._route_stats.get((name, i))
+        if cache is None:
+            route = self.category_routes(name)[i]
+            idx = np.asarray(route, dtype=np.intp)
+            cache = self._route_stats[(name, i)] = _route_stat(
+                float(self.stops.weight[idx[idx != DEPOT]].sum()), float(self.route_legs(route).sum()))
+        return cache
+
+    def route_schedule(self, name, i):
+        cache = self.route_cache(name, i)
+        if cache['schedule'] is None:
+            cache['schedule'] = self.schedule(self.category_routes(name)[i], name)
+        return cache['schedule']
+
+    def compute_schedules(self, keys=None):
+        """
+        Schedule the routes of the given (category, index) keys, by default
+        all non-empty routes, in one vectorized pass; schedules already
+        cached are kept. Returns {key: RouteSchedule}.
+        """
+        if keys is None:
+            keys = [(name, i) for name in "ABC"
+                    for i, route in enumerate(self.category_routes(name)) if len(route)]
+        brak = [key for key in keys if self.route_cache(*key)['schedule'] is None]
+        if brak:
+            travel, earliest, latest, service = [], [], [], []
+            for name, i in brak:
+                route = self.category_routes(name)[i]
+                idx = np.asarray(route, dtype=np.intp)
+                travel.append(self.route_travel_times(route, name))
+                earliest.append(self.stops.earliest[idx] * US_PER_MINUTE)
+                latest.append(self.stops.latest[idx] * US_PER_MINUTE)
+                service.append(self.stops.service[idx] * US_PER_MINUTE)
+            schedules = schedule_routes(travel, earliest, latest, service,
+                                        self.day_start * US_PER_MINUTE, self._speed_profile())
+            for key, schedule in zip(brak, schedules):
+                self.route_cache(*key)['schedule'] = schedule
+        return {key: self.route_cache(*key)['schedule'] for key in keys}
+
+    def route_arrivals(self, name, i):
+        cache = self.route_cache(name, i)
+        if cache['arrivals'] is None:
+            cache['arrivals'] = format_times(self.route_schedule(name, i).begin)
+        return cache['arrivals']
+
+    def route_late(self, name, i):
+        """Positions of a route whose service starts after their latest time"""
+        return self.route_schedule(name, i).late().tolist()
+
+    def route_end(self, name, i):
+        """Time the vehicle of a route is back at the depot"""
+        return self.route_arrivals(name, i)[-1]
+
+    def route_maps_url(self, name, i):
+        cache = self.route_cache(name, i)
+        if cache['maps_url'] is None:
+            cache['maps_url'] = self.generate_maps_url(self.category_routes(name)[i])
+        return cache['maps_url']
+
+    def invalidate_route(self, name, i):
+        """Forget the cached stats of one edited route"""
+        self._route_stats.pop((name, i), None)
+
+    def invalidate_stats(self):
+        self._route_stats.clear()
+
+    def swap_stops(self, name, route_idx, p, q):
+        """
+        Swap the stops at positions p and q of a route in place. The cached
+        length is updated from the at most four legs that changed.
+        """
+        route = self.category_routes(name)[route_idx]
+        if p > q:
+            p, q = q, p
+        legs = sorted(k for k in {p - 1, p, q - 1, q} if 0 <= k < len(route) - 1)
+        
+        def length():
+            return sum(float(self.route_legs(route[k:k+2]).sum()) for k in legs)
+        
+        cache = self._route_stats.get((name, route_idx))
+        before = length()
+        route[p], route[q] = route[q], route[p]
+        if cache is not None:
+            cache['length'] += length() - before
+            cache['schedule'] = cache['arrivals'] = cache['maps_url'] = cache['text'] = None
+
+    def generate_maps_url(self, route):
+        """Generate Google Maps URL for a given route with return to starting point"""
+        if len(route) == 0:
+            return ""
+        
+        # Start with base URL
+        url = "https://www.google.com/maps/dir/"
+        
+        # Store starting point coordinates (Spodek location)
+        start_point = "50.266247,19.027401"  # Spodek coordinates
+        
+        # Add starting point
+        url += f"{start_point}/"
+        
+        # Add each waypoint
+        for i in route.tolist():
+            # Skip Spodek points as they're just markers
+            if i != DEPOT:
+                # Google Maps expects coordinates as "lat,lng"
+                url += f"{float(self.stops.lat[i])},{float(self.stops.lon[i])}/"
+        
+        # Add return to starting point
+        url += f"{start_point}/"
+        
+        return url
+
+    def build_distance_matrix(self):
+        """Precompute distances between the depot (index 0) and all loaded stops"""
+        self.distances = DistanceMatrix(self.stops.lon, self.stops.lat)
+        if self.road_graph is not None:
+            self.build_road_matrix()
+
+    def load_road_graph(self, path):
+        """Drive on a road network from now on, see route_roads"""
+        self.road_graph = RoadGraph.load(path)
+        self.road_graph_path = os.path.abspath(path)
+        if self._precomputed(self.distances):
+            self.build_road_matrix()
+        return self.road_graph
+
+    def build_road_matrix(self):
+        """
+        Road km and minutes between all loaded stops. Too many stops for full
+        matrices fall back to straight-line distances.
+        """
+        if not self.distances.matrices:
+            self.distance_metric = "haversine"
+            self.optimize_metric = "euclidean"
+            return False
+        wspolne = None
+        if self.road_atlas is not None:
+            wspolne = self.road_atlas.matrices(self.road_graph, self.stops.lon, self.stops.lat,
+                                               self.average_speed)
+        km, minutes = wspolne or road_matrices(self.road_graph, self.stops.lon, self.stops.lat,
+                                               self.average_speed, self.road_cache_dir, self.workers)
+        self.distances.matrices["road"] = km
+        self.distances.matrices["road_time"] = minutes
+        self.distances.stale.clear()
+        self.distance_metric = self.optimize_metric = "road"
+        # Cached route lengths were measured in the previous metric
+        self.invalidate_stats()
+        return True
+
+    def tour_cache(self):
+        """The open TourCache of tour_cache_path for optimize_metric, None when it is off"""
+        if self.tour_cache_path is None:
+            return None
+        tag = self._metric_tag(self.optimize_metric)
+        cache = self._tour_cache
+        if cache is None or cache.path != self.tour_cache_path or cache.metric != tag:
+            cache = self._tour_cache = TourCache(self.tour_cache_path, tag, self.tour_cache_size)
+        return cache
+
+    def _metric_tag(self, metric):
+        # Road distances are only comparable on the same graph
+        if metric.startswith("road") and self.road_graph is not None:
+            return f"{metric}:{self.road_graph.digest}"
+        return metric
+
+    def spatial_index(self):
+        """Spatial index over the depot (index 0) and all loaded stops"""
+        if self.index is None:
+            self.index = GridIndex(self.stops.lon, self.stops.lat)
+        return self.index
+
+    def stops_within(self, lon, lat, radius_km):
+        """Indices of loaded stops within radius_km of a point"""
+        idx = self.spatial_index().query_radius(lon, lat, radius_km, "haversine")
+        return [int(i) for i in idx if i != DEPOT]
+
+    def nearest_stops(self, lon, lat, k):
+        """Indices of the k loaded stops closest to a point, closest first"""
+        idx = self.spatial_index().query_knn(lon, lat, k + 1, "haversine")
+        return [int(i) for i in idx if i != DEPOT][:k]
+
+    def stops_in_box(self, lon_min, lat_min, lon_max, lat_max):
+        """Indices of loaded stops inside a longitude/latitude box"""
+        idx = self.spatial_index().query_box(lon_min, lat_min, lon_max, lat_max)
+        return [int(i) for i in idx if i != DEPOT]
+
+    def _precomputed(self, structure):
+        return structure is not None and len(structure) == len(self.stops)
+
+    def distance_block(self, punkty, metric=None):
+        """Distance matrix between the given stop indices"""
+        metric = metric or self.distance_metric
+        self._count("distance evaluations", len(punkty) ** 2)
+        if self._precomputed(self.distances):
+            return self.distances.block(punkty, metric)
+        idx = np.asarray(punkty, dtype=np.intp)
+        return distance_matrix(self.stops.lon[idx], self.stops.lat[idx], metric)
+
+    def route_legs(self, route, metric=None):
+        """Distances of consecutive legs of a route"""
+        metric = metric or self.distance_metric
+        if len(route) < 2:
+            return np.zeros(0)
+        self._count("distance evaluations", len(route) - 1)
+        if self._precomputed(self.distances):
+            return self.distances.legs(route, metric)
+        idx = np.asarray(route, dtype=np.intp)
+        return leg_distances(self.stops.lon[idx], self.stops.lat[idx], metric)
+
+    def _center_distances(self, lista):
+        idx = np.asarray(lista, dtype=np.intp)
+        return pair_distances(self.stops.lon[idx], self.stops.lat[idx],
+                              self.center[0], self.center[1], "euclidean")
+
+    def odleglosc(self, tupple1, tupple2):
+        return math.sqrt((tupple1[0] - tupple2[0])**2 + (tupple1[1] - tupple2[1])**2)
+
+    def _center_rings(self, lista, promienie):
+        # For each radius, whether each stop lies within it from self.center.
+        # The rings span the whole service area, so one vectorized pass over
+        # the stops beats any index lookup
+        dystanse = self._center_distances(lista)
+        return [dystanse <= r for r in promienie]
+
+    def _category_masks(self, idx):
+        # Which of the stops belong to category A and which to B, the rest is C
+        waga = self.stops.weight[idx]
+        w25, w50, w120 = self._center_rings(idx, (25, 50, 120))
+        
+        a = (0 <= waga) & (waga <= 100) & w50
+        b = ~a & (100 < waga) & (waga <= 700) & ~w25 & w120
+        return a, b
+
+    def kategoryzacja(self, lista):
+        idx = np.asarray(lista, dtype=ROUTE_DTYPE)
+        if len(idx) == 0:
+            self.kategoriaA, self.kategoriaB, self.kategoriaC = idx, idx, idx
+            return
+        
+        a, b = self._category_masks(idx)
+        self.kategoriaA = idx[a]
+        self.kategoriaB = idx[b]
+        self.kategoriaC = idx[~a & ~b]
+
+    def sort1(self, lista):
+        idx = np.asarray(lista, dtype=ROUTE_DTYPE)
+        if len(idx) == 0:
+            return idx
+        
+        dystanse = self._center_distances(idx)
+        
+        # Points that cannot be served at departure time are time
+        # constrained, sort both groups by distance from center
+        time_constrained = self.stops.earliest[idx] > self.day_start
+        kolejnosc = np.lexsort((dystanse, time_constrained))
+        
+        # Time unconstrained points first, constrained ones at the end to
+        # ensure they're visited later
+        return idx[kolejnosc]
+
+    def vehicle_speed(self, name=None):
+        """km/h of the vehicles of a category"""
+        return self.category_speeds.get(name, self.average_speed)
+
+    def _speed_profile(self):
+        if self.speed_profile is None:
+            return None
+        return SpeedProfile(self.speed_profile, 60 * US_PER_MINUTE)
+
+    def travel_times(self, distances, name=None):
+        """Driving times in microseconds for distances in km, at full speed"""
+        return np.round(np.asarray(distances) / self.vehicle_speed(name) * (60 * US_PER_MINUTE))
+
+    def _road_travel_times(self, minutes, name=None):
+        # Road times are for average_speed vehicles, slower ones take longer
+        return np.round(np.asarray(minutes) * US_PER_MINUTE * (self.average_speed / self.vehicle_speed(name)))
+
+    def _road_times(self):
+        return (self.distance_metric == "road" and self._precomputed(self.distances)
+                and "road_time" in self.distances.matrices)
+
+    def route_travel_times(self, route, name=None):
+        """Driving times in microseconds of the legs of a route, at full speed"""
+        if self._road_times() and len(route) > 1:
+            return self._road_travel_times(self.distances.legs(route, "road_time"), name)
+        return self.travel_times(self.route_legs(route), name)
+
+    def _legs_via(self, punkty, punkt, metric=None):
+        # Distances from each of punkty to punkt and from punkt back to each
+        metric = metric or self.distance_metric
+        idx = np.asarray(punkty, dtype=np.intp)
+        if self._precomputed(self.distances) and metric in self.distances.matrices:
+            macierz = self.distances.matrices[metric]
+            return macierz[idx, punkt], macierz[punkt, idx]
+        d = pair_distances(self.stops.lon[idx], self.stops.lat[idx],
+                           self.stops.lon[punkt], self.stops.lat[punkt], metric)
+        return d, d
+
+    def schedule(self, route, name=None):
+        """Time-window schedule of a route of a category, in microseconds since midnight"""
+        idx = np.asarray(route, dtype=np.intp)
+        return RouteSchedule(self.route_travel_times(route, name),
+                             self.stops.earliest[idx] * US_PER_MINUTE,
+                             self.stops.latest[idx] * US_PER_MINUTE,
+                             self.stops.service[idx] * US_PER_MINUTE,
+                             self.day_start * US_PER_MINUTE,
+                             self._speed_profile())
+
+    def calculate_arrival_time(self, route, name=None):
+        """Calculate estimated arrival times for each point in route"""
+        # Service start, after waiting for the earliest time if too early
+        return format_times(self.schedule(route, name).begin)
+
+    def podziel(self, lista, max_waga):
+        idx = np.asarray(lista, dtype=ROUTE_DTYPE)
+        if len(idx) == 0:
+            return []
+        
+        # Positions where a new sub-route starts; the sub-routes are then
+        # views of one array
+        granice = []
+        suma_wag = 0
+        for nr, waga in enumerate(self.stops.weight[idx].tolist()):
+            if suma_wag + waga <= max_waga:
+                suma_wag += waga
+            else:
+                granice.append(nr)
+                suma_wag = waga
+        
+        return np.split(idx, granice)
+
+    def podziel_geo(self, lista, max_waga, mode="sweep"):
+        """Split into capacity-feasible, geographically compact sub-routes"""
+        idx = np.asarray(lista, dtype=ROUTE_DTYPE)
+        if len(idx) == 0:
+            return []
+        
+        wagi = self.stops.weight[idx].tolist()
+        if mode == "savings" and len(idx) > self.savings_full_limit:
+            grupy = self._savings_neighbours(idx, wagi, max_waga)
+        elif mode == "savings":
+            dist = self.distance_block(np.insert(idx, 0, DEPOT), self.optimize_metric)
+            grupy = savings_split(dist, wagi, max_waga)
+        else:
+            # Polar angle around Spodek on a locally flattened map
+            lon = self.stops.lon[idx] - self.depot[0]
+            lat = self.stops.lat[idx] - self.depot[1]
+            katy = np.arctan2(lat, lon * math.cos(math.radians(self.depot[1])))
+            grupy = sweep_split(katy, wagi, max_waga)
+        
+        return [idx[np.asarray(grupa, dtype=np.intp)] for grupa in grupy]
+
+    def _savings_neighbours(self, idx, wagi, max_waga):
+        lon = self.stops.lon[idx]
+        lat = self.stops.lat[idx]
+        metric = self.optimize_metric
+        # Road neighbours are looked up by straight-line distance
+        po_prostej = metric in COORDINATE_METRICS
+        indeks = GridIndex(lon, lat)
+        rows, cols = [], []
+        for i in range(len(idx)):
+            sasiedzi = indeks.query_knn(lon[i], lat[i], self.savings_neighbours,
+                                        metric if po_prostej else "haversine", exclude=i)
+            rows.extend([i] * len(sasiedzi))
+            cols.extend(sasiedzi.tolist())
+        rows = np.array(rows, dtype=np.intp)
+        cols = np.array(cols, dtype=np.intp)
+        if po_prostej:
+            pary = pair_distances(lon[rows], lat[rows], lon[cols], lat[cols], metric)
+            depot = pair_distances(lon, lat, self.depot[0], self.depot[1], metric)
+        else:
+            macierz = self.distances.matrices[metric]
+            pary = macierz[idx[rows], idx[cols]]
+            depot = macierz[DEPOT, idx]
+        self._count("distance evaluations", len(rows) + len(lon))
+        return savings_split_pairs(depot, rows, cols, pary, wagi, max_waga)
+
+    def _solver_windows(self, punkty, name=None):
+        # Time windows of a sub-route for the solver, in minutes with driving
+        # at full speed; None when no stop has a latest time
+        idx = np.asarray(punkty, dtype=np.intp)
+        if not np.isfinite(self.stops.latest[idx]).any():
+            return None
+        if self._road_times():
+            travel = self.distance_block(idx, "road_time") * (self.average_speed / self.vehicle_speed(name))
+        else:
+            travel = self.distance_block(idx) / self.vehicle_speed(name) * 60
+        return (travel.tolist(), self.stops.earliest[idx].tolist(), self.stops.latest[idx].tolist(),
+                self.stops.service[idx].tolist(), float(self.day_start))
+
+    def sort2(self, lista, mode=None, time_budget=None, progress=None, cancel=None, names=None):
+        """
+        Optimize the order of every sub-route. progress(done, total, km) is
+        called after each sub-route with the length of the plan so far; once
+        the cancel event is set the remaining sub-routes get a nearest-
+        neighbour order and the best routes found so far are returned. names holds
+        the category of each sub-route, for the speed its time windows are
+        checked at.
+        """
+        self.sort2_report = []
+        if len(lista) == 0:
+            return []
+        
+        if time_budget is None:
+            time_budget = self.time_budget
+        should_stop = cancel.is_set if cancel is not None else None
+        options = {
+            'mode': mode or self.solver_mode,
+            'held_karp_limit': self.held_karp_limit,
+            'exact_limit': self.exact_limit
+        }
+        
+        start_point = DEPOT
+        punkty = [np.insert(np.asarray(podlista, dtype=ROUTE_DTYPE), 0, start_point) for podlista in lista]
+        dists = [self.distance_block(p, self.optimize_metric).tolist() for p in punkty]
+        if names is None:
+            names = [None] * len(punkty)
+        windows = [self._solver_windows(p, name) for p, name in zip(punkty, names)]
+        
+        wyniki = [None] * len(dists)
+        km = [float(self.route_legs(np.append(p, start_point)).sum()) for p in punkty]
+        
+        def gotowe(nr, wynik):
+            wyniki[nr] = wynik
+            trasa = punkty[nr][[0] + wynik['tour'] + [0]]
+            km[nr] = float(self.route_legs(trasa).sum())
+            if progress is not None:
+                progress(len(wyniki) - wyniki.count(None), len(wyniki), sum(km))
+        
+        # Sub-routes solved on an earlier run are taken from the tour cache;
+        # their best order depends on the windows, so ones with latest
+        # times are always solved
+        cache = self.tour_cache()
+        nowe = []
+        for nr, p in enumerate(punkty):
+            tour = None
+            if cache is not None and windows[nr] is None:
+                tour = cache.get(self.stops.lon[p], self.stops.lat[p])
+            if tour is None:
+                nowe.append(nr)
+            else:
+                gotowe(nr, {'tour': tour, 'length': tour_length(dists[nr], tour),
+                            'method': 'cached', 'optimal': True})
+        
+        workers = min(self.workers, len(nowe))
+        if workers > 1 and max(len(lista[nr]) for nr in nowe) >= self.parallel_min_stops:
+            budget = min(self.route_time_budget, time_budget * workers / len(nowe))
+            for k, wynik in solve_parallel([dists[nr] for nr in nowe], workers, [budget] * len(nowe),
+                                           should_stop, [windows[nr] for nr in nowe], **options):
+                gotowe(nowe[k], wynik)
+        else:
+            deadline = time.perf_counter() + time_budget
+            for k, nr in enumerate(nowe):
+                if should_stop is not None and should_stop():
+                    break
+                # Share what is left of the budget among the remaining routes
+                share = max(deadline - time.perf_counter(), 0) / (len(nowe) - k)
+                gotowe(nr, solve(dists[nr], time_budget=min(share, self.route_time_budget),
+                                 should_stop=should_stop, windows=windows[nr], **options))
+        
+        self._count("sub-routes solved", sum(1 for nr in nowe if wyniki[nr] is not None))
+        self._count("sub-routes cached", len(punkty) - len(nowe))
+        self._count("tours evaluated", sum(wyniki[nr].get('evaluated', 0) for nr in nowe
+                                           if wyniki[nr] is not None))
+        if cache is not None:
+            for nr in nowe:
+                if wyniki[nr] is not None and wyniki[nr]['optimal'] and windows[nr] is None:
+                    cache.put(self.stops.lon[punkty[nr]], self.stops.lat[punkty[nr]], wyniki[nr]['tour'])
+            try:
+                cache.save()
+            except OSError:
+                pass
+        
+        najlepsze = []
+        for podlista, dist, wynik in zip(punkty, dists, wyniki):
+            if wynik is None:
+                # Cancelled before it was solved, or dropped from the pool
+                # while being solved: the greedy tour beats the split order
+                tour = nearest_neighbour(dist)
+                wynik = {'tour': tour, 'length': tour_length(dist, tour),
+                         'method': 'cancelled', 'optimal': False}
+            # Position 0 of podlista is the depot, so it closes the tour too
+            najlepsze.append(podlista[[0] + wynik['tour'] + [0]])
+            self.sort2_report.append({
+                'stops': len(podlista) - 1,
+                'method': wynik['method'],
+                'optimal': wynik['optimal'],
+                'length': wynik['length'],
+                'history': wynik.get('history', [])
+            })
+        
+        return najlepsze
+
+    def load_csv(self, filenames):
+        """
+        Read stops from one or more CSV files, plain or gzip'd, with longitude,
+        latitude, weight, city and hour columns and optional earliest, latest
+        and service time window columns. Bad rows are skipped and recorded in
+        load_errors.
+        """
+        if isinstance(filenames, (str, os.PathLike)):
+            filenames = [filenames]
+        table, self.load_errors = read_stops(filenames, self.depot)
+        return self._load(table)
+
+    def load_records(self, records):
+        """
+        Read stops from dicts with the CSV column names as keys, e.g. a JSON
+        request body; bad records are recorded in load_errors.
+        """
+        table, self.load_errors = read_records(records, self.depot)
+        return self._load(table)
+
+    def _load(self, table):
+        # Loaded orders replace the previous ones and their plan, whose
+        # routes index the old table; returns how many orders there are
+        self.orders = self.stops = table
+        self.kategoriaA, self.kategoriaB, self.kategoriaC = [], [], []
+        self.route_reports = {'A': [], 'B': [], 'C': []}
+        self.split_report = None
+        self.cancelled = False
+        self.order_stop = self.aggregation = self._order_groups = None
+        if self.aggregate_radius is not None:
+            self.aggregate()
+        self.routes = np.arange(1, len(self.stops), dtype=ROUTE_DTYPE)
+        self.invalidate_stats()
+        self.build_distance_matrix()
+        self.index = None
+        return len(self.orders) - 1
+
+    def aggregate(self):
+        """Merge the loaded orders within aggregate_radius km into stops, returns the shrink"""
+        self.stops, self.order_stop = aggregate_orders(self.orders, self.aggregate_radius,
+                                                       max(self.capacities.values()))
+        self._group_orders()
+        return self.aggregation
+
+    def _group_orders(self):
+        self._order_groups = order_groups(self.order_stop, len(self.stops))
+        self.aggregation = {
+            'radius': self.aggregate_radius,
+            'orders': len(self.orders) - 1,
+            'stops': len(self.stops) - 1
+        }
+
+    def stop_orders(self, point):
+        """Order rows of a stop, in file order"""
+        if self._order_groups is None:
+            return [point]
+        starts, members = self._order_groups
+        return members[starts[point]:starts[point + 1]].tolist()
+
+    def route_orders(self, name, i):
+        """(position, order row, arrival) of every order a route delivers"""
+        route = self.category_routes(name)[i]
+        for j, (point, arrival) in enumerate(zip(route.tolist(), self.route_arrivals(name, i))):
+            if point != DEPOT:
+                for order in self.stop_orders(point):
+                    yield j, order, arrival
+
+    def aggregation_summary(self):
+        a = self.aggregation
+        mniej = 100 * (1 - a['stops'] / a['orders']) if a['orders'] else 0.0
+        return (f"{a['orders']} orders in {a['stops']} stops within {a['radius']} km "
+                f"({mniej:.1f}% fewer)")
+
+    def process_all_routes(self, progress=None, cancel=None):
+        """
+        Categorize, split and optimize all loaded stops. progress and cancel
+        are passed on to sort2; after a cancel self.cancelled is set and the
+        categories hold the best routes found so far.
+        """
+        self.split_report = None
+        self.run_profile = RunProfile(self.profile_runs)
+        self.run_profile.start()
+        try:
+            if self.split_mode != "sequential" and self.compare_split:
+                self._plan("sequential", progress, cancel)
+                with self._stage("stats"):
+                    sekwencyjny = self.total_distance()
+            
+            self._plan(self.split_mode, progress, cancel)
+            self.cancelled = cancel is not None and cancel.is_set()
+            
+            if self.split_mode != "sequential" and self.compare_split and not self.cancelled:
+                with self._stage("stats"):
+                    total = self.total_distance()
+                self.split_report = {
+                    'mode': self.split_mode,
+                    'distance': total,
+                    'sequential': sekwencyjny,
+                    'difference': round(total - sekwencyjny, 2)
+                }
+        finally:
+            self.run_profile.stop()
+            self.last_run, self.run_profile = self.run_profile, None
+
+    def _stage(self, name):
+        if self.run_profile is None:
+            return nullcontext()
+        return self.run_profile.stage(name)
+
+    def _count(self, name, n=1):
+        if self.run_profile is not None:
+            self.run_profile.count(name, n)
+
+    def write_run_log(self, path=None):
+        """Append the last run to the JSON lines run log, returns its path"""
+        path = path or self.run_log_path
+        if self.last_run is None or path is None:
+            return None
+        self.last_run.save(path)
+        return path
+
+    def _plan(self, split_mode, progress=None, cancel=None):
+        with self._stage("kategoryzacja"):
+            self.kategoryzacja(self.routes)
+        
+        def podziel(lista, max_waga):
+            if split_mode == "sequential":
+                return self.podziel(lista, max_waga)
+            return self.podziel_geo(lista, max_waga, split_mode)
+        
+        # Sort and split every category, then optimize all sub-routes in one
+        # sort2 call so they share the time budget and the worker pool
+        with self._stage("sort1"):
+            posortowane = [self.sort1(k) for k in (self.kategoriaA, self.kategoriaB, self.kategoriaC)]
+        with self._stage("podziel"):
+            self.kategoriaA = podziel(posortowane[0], self.capacities['A'])
+            self.kategoriaB = podziel(posortowane[1], self.capacities['B'])
+            self.kategoriaC = podziel(posortowane[2], self.capacities['C'])
+        
+        with self._stage("sort2"):
+            names = ['A'] * len(self.kategoriaA) + ['B'] * len(self.kategoriaB) + ['C'] * len(self.kategoriaC)
+            trasy = self.sort2(self.kategoriaA + self.kategoriaB + self.kategoriaC,
+                               progress=progress, cancel=cancel, names=names)
+        a = len(self.kategoriaA)
+        b = a + len(self.kategoriaB)
+        self.kategoriaA, self.route_reports['A'] = trasy[:a], self.sort2_report[:a]
+        self.kategoriaB, self.route_reports['B'] = trasy[a:b], self.sort2_report[a:b]
+        self.kategoriaC, self.route_reports['C'] = trasy[b:], self.sort2_report[b:]
+        self.invalidate_stats()
+
+    def insert_csv(self, filenames):
+        """
+        Add late orders from CSV files to the planned routes without
+        reprocessing, see insert_stops. Bad rows are recorded in load_errors.
+        """
+        if isinstance(filenames, (str, os.PathLike)):
+            filenames = [filenames]
+        nowe, self.load_errors = read_stops(filenames, self.depot)
+        return self.insert_stops(self.add_stops(nowe))
+
+    def add_stops(self, table):
+        """Append the stops of a StopTable to the loaded ones, returns their indices"""
+        rozszerz = self._precomputed(self.distances)
+        indeksy = self.stops.append_table(table)
+        if self.order_stop is not None:
+            # Late orders are not merged, each gets a stop of its own
+            self.orders.append_table(table)
+            self.order_stop = np.concatenate((self.order_stop, indeksy))
+            self._group_orders()
+        if rozszerz:
+            self.distances.extend(self.stops.lon[indeksy], self.stops.lat[indeksy])
+            if self.road_graph is not None:
+                self.build_road_matrix()
+            elif self.distance_metric in self.distances.stale:
+                # Without the graph the new stops have no road distances, the
+                # whole plan is measured in straight lines until it is loaded
+                self.distance_metric = "haversine"
+                self.optimize_metric = "euclidean"
+                self.invalidate_stats()
+        else:
+            self.build_distance_matrix()
+        self.index = None
+        self.routes = np.concatenate((self.routes, indeksy))
+        return indeksy
+
+    def insert_stops(self, punkty):
+        """
+        Insert stops one by one into their category's routes at the cheapest
+        position of a route with enough capacity left and no time window
+        broken; a new route is only opened when there is none. Returns the added km per (category, route index).
+        """
+        delty = {}
+        if len(punkty) == 0:
+            return delty
+        idx = np.asarray(punkty, dtype=np.intp)
+        a, b = self._category_masks(idx)
+        for punkt, w_a, w_b in zip(idx.tolist(), a.tolist(), b.tolist()):
+            name = 'A' if w_a else 'B' if w_b else 'C'
+            i, delta = self.insert_stop(name, punkt)
+            delty[(name, i)] = delty.get((name, i), 0.0) + delta
+        return delty
+
+    def insert_stop(self, name, punkt):
+        """
+        Cheapest insertion of one stop that keeps the route within capacity
+        and time windows, returns (route index, km added)
+        """
+        trasy = self.category_routes(name)
+        waga = float(self.stops.weight[punkt])
+        najlepsza = None
+        for i, trasa in enumerate(trasy):
+            cache = self.route_cache(name, i)
+            if cache['weight'] + waga > self.capacities[name]:
+                continue
+            # Extra length of visiting punkt between each pair of neighbours
+            do, od = self._legs_via(trasa, punkt)
+            delty = do[:-1] + od[1:] - self.route_legs(trasa)
+            # Positions where every stop still starts within its time window
+            if self._road_times():
+                czas_do, czas_od = (self._road_travel_times(t, name) for t in self._legs_via(trasa, punkt, "road_time"))
+            else:
+                czas_do, czas_od = self.travel_times(do, name), self.travel_times(od, name)
+            mozliwe = self.route_schedule(name, i).insertion_feasible(
+                self.stops.earliest[punkt] * US_PER_MINUTE, self.stops.latest[punkt] * US_PER_MINUTE,
+                self.stops.service[punkt] * US_PER_MINUTE, czas_do[:-1], czas_od[1:])
+            if not mozliwe.any():
+                continue
+            delty = np.where(mozliwe, delty, np.inf)
+            pozycja = int(np.argmin(delty))
+            if najlepsza is None or delty[pozycja] < najlepsza[2]:
+                najlepsza = (i, pozycja + 1, float(delty[pozycja]))
+        
+        if najlepsza is None:
+            trasy.append(np.array([DEPOT, punkt, DEPOT], dtype=ROUTE_DTYPE))
+            i = len(trasy) - 1
+            self.route_reports[name].append({
+                'stops': 1,
+                'method': 'insertion',
+                'optimal': True,
+                'length': float(self.route_legs(trasy[i], self.optimize_metric).sum()),
+                'history': []
+            })
+            return i, self.route_cache(name, i)['length']
+        
+        i, pozycja, delta = najlepsza
+        trasy[i] = np.insert(trasy[i], pozycja, punkt)
+        cache = self.route_cache(name, i)
+        cache['weight'] += waga
+        cache['length'] += delta
+        cache['schedule'] = cache['arrivals'] = cache['maps_url'] = cache['text'] = None
+        if i < len(self.route_reports[name]):
+            raport = self.route_reports[name][i]
+            raport['stops'] += 1
+            raport['optimal'] = False
+            raport['length'] = float(self.route_legs(trasy[i], self.optimize_metric).sum())
+        return i, delta
+
+    def total_distance(self):
+        return round(sum(stat['distance'] for stat in self.calculate_driver_stats()), 2)
+
+    def optimality_summary(self):
+        reports = [r for c in "ABC" for r in self.route_reports[c]]
+        stats = self.calculate_driver_stats()
+        proven = sum(1 for stat in stats if stat['optimal'])
+        summary = f"{proven}/{len(reports)} routes proven optimal"
+        late = sum(stat['late'] for stat in stats)
+        if late:
+            summary += f", {late} stops served late"
+        return summary
+
+    def split_summary(self):
+        if not self.split_report:
+            return ""
+        r = self.split_report
+        return (f"{r['mode']} split: {r['distance']} km vs {r['sequential']} km "
+                f"sequential ({r['difference']:+.2f} km)")
+
+    def stats_report(self):
+        """Text of the Statistics tab with every driver's details"""
+        self.compute_schedules()
+        parts = [self.stats_overview(), "Driver Details:\n"]
+        for stat in self.calculate_driver_stats():
+            parts.append(self._driver_text(stat))
+        return "".join(parts)
+
+    def stats_overview(self):
+        """Route counts and the last run's timings, without the drivers"""
+        parts = [f"""Route Statistics:
+
+Total Routes: {len(self.routes)}
+Category A Routes: {len(self.kategoriaA)}
+Category B Routes: {len(self.kategoriaB)}
+Category C Routes: {len(self.kategoriaC)}
+
+Center Point: {self.center}
+
+"""]
+        if self.aggregation is not None:
+            parts.append(f"Aggregation: {self.aggregation_summary()}\n\n")
+        if self.last_run is not None:
+            parts.append(self._run_text())
+        return "".join(parts)
+
+    def _run_text(self):
+        run = self.last_run
+        lines = [f"Last Run: {run.seconds:.2f} s\n"]
+        for name, seconds in sorted(run.stages.items(), key=lambda etap: -etap[1]):
+            lines.append(f"- {name}: {seconds:.3f} s\n")
+        for name, n in run.counters.items():
+            lines.append(f"- {name}: {n:,}\n")
+        if run.functions:
+            lines.append("Profile (cumulative time):\n")
+            for funkcja in run.functions[:10]:
+                lines.append(f"- {funkcja['function']}: {funkcja['cumtime']:.3f} s "
+                             f"in {funkcja['calls']} calls\n")
+        lines.append("\n")
+        return "".join(lines)
+
+    def _driver_text(self, stat):
+        # The text of a route is cached with its stats until it is edited
+        category = stat['category']
+        i = stat['driver'] - 1
+        cache = self.route_cache(category, i)
+        if cache['text'] is None:
+            lines = [f"""
+Category {category} Driver #{stat['driver']}:
+- Total Weight: {stat['weight']} kg
+- Total Distance: {stat['distance']} km
+- Proven Optimal: {'yes' if stat['optimal'] else 'no'}
+""", "Estimated arrival times:\n"]
+            if stat['late']:
+                lines.insert(1, f"- Late Stops: {stat['late']}\n")
+            late = set(self.route_late(category, i))
+            for j, order, time in self.route_orders(category, i):
+                lines.append(f"- {self.orders.name(order)}: {time}{' LATE' if j in late else ''}\n")
+            lines.append(f"Route Link: {self.route_maps_url(category, i)}\n")
+            cache['text'] = "".join(lines)
+        return cache['text']
+
+    def save_all_routes(self, nazwa_pliku=None):
+        if nazwa_pliku is None:
+            # Create filename with current date in the same directory as tadam.py
+            current_dir = os.path.dirname(os.path.abspath(__file__))
+            nazwa_pliku = os.path.join(current_dir, f"Trasa_{datetime.date.today()}.txt")
+        
+        return self.export_routes(nazwa_pliku, "text")
+
+    def export_routes(self, nazwa_pliku, fmt=None):
+        """
+        Write all routes as text, csv, json or geojson, by default the format
+        the file extension names. Returns the file name.
+        """
+        return export(nazwa_pliku, self.report_header(), self.route_records(), fmt)
+
+    def render_maps(self, prefix, fmt="png"):
+        """Write a PNG or SVG map per category without opening a window, returns the files"""
+        categories = {'A': self.kategoriaA, 'B': self.kategoriaB, 'C': self.kategoriaC}
+        return render_files(prefix, self.stops, categories, self.depot, fmt, self.label_limit)
+
+    def save_session(self, directory):
+        """
+        Snapshot the loaded stops, the plan with its cached stats and the
+        distance matrices to directory, see route_session. Returns the
+        manifest.
+        """
+        arrays = {}
+        for prefix, table in (("stops", self.stops), ("orders", self.orders)):
+            if prefix == "orders" and self.order_stop is None:
+                continue
+            for column, array in table.columns().items():
+                arrays[f"{prefix}.{column}"] = array
+            arrays[f"{prefix}.names"] = np.array(table.names, dtype=str)
+            arrays[f"{prefix}.hours"] = np.array(table.hours, dtype=str)
+        if self.order_stop is not None:
+            arrays["order_stop"] = self.order_stop
+        if self.distances is not None:
+            for metric, matrix in self.distances.matrices.items():
+                arrays[f"matrix.{metric}"] = matrix
+        stable = list(arrays)
+
+        # Stops and matrices change together, the plan on every edit
+        skrot = hashlib.blake2b(digest_size=16)
+        for name in stable:
+            if not name.startswith("matrix."):
+                skrot.update(name.encode())
+                skrot.update(np.ascontiguousarray(arrays[name]).tobytes())
+        metryki = sorted(self.distances.matrices) if self.distances is not None else []
+        skrot.update(" ".join(self._metric_tag(metric) for metric in metryki).encode())
+
+        trasy = [trasa for name in "ABC" for trasa in self.category_routes(name)]
+        stats = [self.route_cache(name, i) for name in "ABC" for i in range(len(self.category_routes(name)))]
+        arrays["loaded"] = self.routes
+        arrays["routes"] = (np.concatenate(trasy).astype(ROUTE_DTYPE) if trasy
+                            else np.zeros(0, dtype=ROUTE_DTYPE))
+        arrays["route_sizes"] = np.array([len(trasa) for trasa in trasy], dtype=np.int64)
+        arrays["route_weight"] = np.array([stat['weight'] for stat in stats], dtype=float)
+        arrays["route_length"] = np.array([stat['length'] for stat in stats], dtype=float)
+
+        meta = {
+            'digest': skrot.hexdigest(),
+            'categories': [len(self.kategoriaA), len(self.kategoriaB), len(self.kategoriaC)],
+            'route_reports': self.route_reports,
+            'split_report': self.split_report,
+            'cancelled': self.cancelled,
+            'last_run': self.last_run and self.last_run.to_dict(),
+            'aggregation': self.aggregation,
+            'full_limit': self.distances.full_limit if self.distances is not None else None,
+            'distance_metric': self.distance_metric,
+            'optimize_metric': self.optimize_metric,
+            'road_graph': self.road_graph and {'path': self.road_graph_path, 'digest': self.road_graph.digest},
+            'settings': {
+                'capacities': self.capacities,
+                'day_start': self.day_start,
+                'average_speed': self.average_speed,
+                'category_speeds': self.category_speeds,
+                'speed_profile': None if self.speed_profile is None else list(self.speed_profile),
+                'aggregate_radius': self.aggregate_radius,
+                'solver_mode': self.solver_mode,
+                'split_mode': self.split_mode,
+                'compare_split': self.compare_split,
+                'time_budget': self.time_budget
+            }
+        }
+        return write_session(directory, arrays, meta, stable)
+
+    def load_session(self, directory):
+        """Restore a save_session snapshot in place of the loaded stops and plan"""
+        arrays, meta = read_session(directory)
+        tables = {}
+        for prefix in ("stops", "orders"):
+            if f"{prefix}.names" in arrays:
+                tables[prefix] = StopTable.from_columns(
+                    arrays[f"{prefix}.names"].tolist(), arrays[f"{prefix}.hours"].tolist(),
+                    {column: arrays[f"{prefix}.{column}"] for column in TABLE_COLUMNS})
+        self.stops = tables["stops"]
+        self.orders = tables.get("orders", self.stops)
+        self.order_stop = arrays.get("order_stop")
+        self._order_groups = None if self.order_stop is None else order_groups(self.order_stop, len(self.stops))
+        self.aggregation = meta['aggregation']
+        self.load_errors = []
+
+        for name, value in meta['settings'].items():
+            setattr(self, name, value)
+        self.road_graph = self.road_graph_path = None
+        if meta['road_graph'] is not None and os.path.exists(meta['road_graph']['path']):
+            graph = RoadGraph.load(meta['road_graph']['path'])
+            if graph.digest == meta['road_graph']['digest']:
+                self.road_graph, self.road_graph_path = graph, meta['road_graph']['path']
+        macierze = {name[len("matrix."):]: array for name, array in arrays.items() if name.startswith("matrix.")}
+        self.distances = DistanceMatrix.from_matrices(self.stops.lon, self.stops.lat, macierze,
+                                                      meta['full_limit'] or 4000)
+        self.distance_metric = meta['distance_metric']
+        self.optimize_metric = meta['optimize_metric']
+        self.index = None
+
+        self.routes = arrays["loaded"]
+        granice = np.cumsum(arrays["route_sizes"])[:-1]
+        trasy = np.split(arrays["routes"], granice) if len(arrays["route_sizes"]) else []
+        a, b, _ = meta['categories']
+        self.kategoriaA, self.kategoriaB, self.kategoriaC = trasy[:a], trasy[a:a + b], trasy[a + b:]
+        self.route_reports = meta['route_reports']
+        self.split_report = meta['split_report']
+        self.cancelled = meta['cancelled']
+        self.last_run = meta['last_run'] and RunProfile.from_dict(meta['last_run'])
+        self.invalidate_stats()
+        klucze = [(name, i) for name in "ABC" for i in range(len(self.category_routes(name)))]
+        for key, weight, length in zip(klucze, arrays["route_weight"].tolist(), arrays["route_length"].tolist()):
+            self._route_stats[key] = _route_stat(weight, length)
+        return len(self.orders) - 1
+
+    def report_header(self):
+        return {
+            'generated': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'total_routes': len(self.routes),
+            'categories': {'A': len(self.kategoriaA), 'B': len(self.kategoriaB), 'C': len(self.kategoriaC)},
+            'center': self.center,
+            'depot': self.depot,
+            'aggregation': self.aggregation and self.aggregation_summary()
+        }
+
+    def route_records(self):
+        """One dict per non-empty route, category by category, from the cached stats"""
+        self.compute_schedules()
+        for name in "ABC":
+            reports = self.route_reports[name]
+            for i, route in enumerate(self.category_routes(name)):
+                if len(route) == 0:
+                    continue
+                cache = self.route_cache(name, i)
+                late = set(self.route_late(name, i))
+                stops = []
+                for j, order, arrival in self.route_orders(name, i):
+                    stops.append({
+                        'position': j,
+                        'city': self.orders.name(order),
+                        'longitude': float(self.orders.lon[order]),
+                        'latitude': float(self.orders.lat[order]),
+                        'weight': float(self.orders.weight[order]),
+                        'arrival': arrival,
+                        'late': j in late
+                    })
+                yield {
+                    'category': name,
+                    'driver': i + 1,
+                    'weight': cache['weight'],
+                    'distance': round(cache['length'], 2),
+                    'optimal': i < len(reports) and reports[i]['optimal'] and not late,
+                    'late_stops': len(late),
+                    'maps_url': self.route_maps_url(name, i),
+                    'stops': stops
+                }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Plan delivery routes from a CSV file without the GUI")
+    parser.add_argument("csv", nargs="*",
+                        help="orders files (CSV or CSV.gz) with longitude, latitude, weight, city and hour columns")
+    parser.add_argument("--session", metavar="DIR",
+                        help="report on a plan saved with --save-session instead of planning orders files")
+    parser.add_argument("--save-session", metavar="DIR",
+                        help="snapshot the plan to this directory, to be reopened by --session or the GUI")
+    parser.add_argument("-o", "--output",
+                        help="report file (default: Trasa_<date>.txt in the current directory)")
+    parser.add_argument("--mode", choices=["exact", "local"], default="exact",
+                        help="sub-route optimizer")
+    parser.add_argument("--time-budget", type=float, default=2.0,
+                        help="seconds for local search over all routes")
+    parser.add_argument("--workers", type=int, help="optimizer processes (default: CPU count)")
+    parser.add_argument("--split", choices=["sequential", "sweep", "savings"], default="sequential",
+                        help="how categories are split into vehicles")
+    parser.add_argument("--compare-split", action="store_true",
+                        help="also plan the sequential split and report the km difference (plans twice)")
+    parser.add_argument("--export", nargs="+", default=[], metavar="FILE",
+                        help="also export the routes to these .txt, .csv, .json or .geojson files")
+    parser.add_argument("--roads", metavar="GRAPH",
+                        help="road network .npz from route_roads.py; distances and drive times follow the roads")
+    parser.add_argument("--aggregate", type=float, metavar="KM",
+                        help="merge orders within KM of each other into one stop (0: same coordinates only)")
+    parser.add_argument("--speed", nargs="+", default=[], metavar="CATEGORY=KMH",
+                        help="vehicle speed of a category, e.g. C=40 (default: 50 km/h)")
+    parser.add_argument("--rush-hours", action="store_true",
+                        help="slow down driving in the Katowice morning and afternoon rush hours")
+    parser.add_argument("--maps", metavar="PREFIX",
+                        help="draw a map per category to PREFIX_<category>.<format>")
+    parser.add_argument("--map-format", choices=["png", "svg"], default="png")
+    parser.add_argument("--run-log", help="append stage timings and counters of the run to this JSON lines file")
+    parser.add_argument("--profile", metavar="PROF_FILE",
+                        help="cProfile the run, write the raw stats here and the top functions to the run log")
+    args = parser.parse_args(argv)
+    if bool(args.csv) == bool(args.session):
+        parser.error("give either orders files or --session")
+
+    engine = RouteEngine()
+    engine.solver_mode = args.mode
+    engine.time_budget = args.time_budget
+    engine.split_mode = args.split
+    engine.compare_split = args.compare_split
+    if args.workers:
+        engine.workers = args.workers
+    engine.run_log_path = args.run_log
+    engine.profile_runs = bool(args.profile)
+    if args.aggregate is not None:
+        if args.aggregate < 0:
+            parser.error("--aggregate takes a distance of 0 km or more")
+        engine.aggregate_radius = args.aggregate
+    for speed in args.speed:
+        name, _, kmh = speed.partition("=")
+        try:
+            if name not in ("A", "B", "C") or float(kmh) <= 0:
+                raise ValueError
+        except ValueError:
+            parser.error(f"--speed takes CATEGORY=KMH with a positive speed, not {speed}")
+        engine.category_speeds[name] = float(kmh)
+    if args.rush_hours:
+        engine.speed_profile = KATOWICE_RUSH_HOURS
+
+    def stage(name):
+        # A restored plan was not run now, its last_run stays as saved
+        return nullcontext() if args.session else engine.last_run.stage(name)
+
+    if args.session:
+        count = engine.load_session(args.session)
+        print(f"Restored {count} routes from session {args.session}")
+    else:
+        if args.roads:
+            engine.load_road_graph(args.roads)
+        count = engine.load_csv(args.csv)
+        print(f"Loaded {count} routes from {', '.join(args.csv)}")
+        if engine.aggregation is not None:
+            print(f"Aggregated {engine.aggregation_summary()}")
+        for plik, linia, powod in engine.load_errors:
+            print(f"Skipped {plik}:{linia}: {powod}", file=sys.stderr)
+        engine.process_all_routes()
+        print(f"Routes processed successfully! ({engine.optimality_summary()})")
+        if engine.split_report:
+            print(engine.split_summary())
+    with stage("save_all_routes"):
+        nazwa_pliku = engine.save_all_routes(args.output or f"Trasa_{datetime.date.today()}.txt")
+    print(f"Routes and statistics saved to {nazwa_pliku}")
+    for plik in args.export:
+        with stage("export"):
+            engine.export_routes(plik)
+        print(f"Routes exported as {format_for(plik)} to {plik}")
+    if args.maps:
+        with stage("maps"):
+            pliki = engine.render_maps(args.maps, args.map_format)
+        print(f"Maps saved to {', '.join(pliki)}")
+    if not args.session:
+        # After the report, export and map stages, which belong to the run too
+        print(engine.last_run.summary())
+    if args.save_session:
+        engine.save_session(args.save_session)
+        print(f"Session saved to {args.save_session}")
+    if args.session:
+        return 0
+    if args.profile:
+        engine.last_run.dump(args.profile)
+    if engine.write_run_log():
+        print(f"Run log appended to {engine.run_log_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
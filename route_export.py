@@ -0,0 +1,132 @@
+"""
+Streaming export of planned routes.
+
+RouteEngine.route_records yields one dict per route, built from the cached
+route stats, and every writer here consumes them one at a time, so even
+thousands of routes never sit in memory as one document. Formats:
+
+    text     the classic Trasa report
+    csv      one row per stop
+    json     {"generated", "center", "routes": [...]}
+    geojson  a FeatureCollection with a LineString per route and a Point
+             per stop
+"""
+import csv
+import json
+from itertools import groupby
+
+FORMATS = {".txt": "text", ".csv": "csv", ".json": "json", ".geojson": "geojson"}
+
+
+def format_for(path):
+    """Export format of a file name, by its extension; text if unknown"""
+    for rozszerzenie, fmt in FORMATS.items():
+        if str(path).lower().endswith(rozszerzenie):
+            return fmt
+    return "text"
+
+
+def write_text(plik, header, records):
+    plik.write("=== Route Management System Report ===\n")
+    plik.write(f"Generated on: {header['generated']}\n\n")
+    plik.write(f"Total Routes: {header['total_routes']}\n")
+    for name, count in header['categories'].items():
+        plik.write(f"Category {name} Routes: {count}\n")
+    plik.write(f"Center Point (Spodek): {header['center']}\n")
+    if header.get('aggregation'):
+        plik.write(f"Orders: {header['aggregation']}\n")
+    plik.write("\n")
+
+    # Records come grouped by category, every category gets its heading
+    grupy = groupby(records, key=lambda record: record['category'])
+    grupa = next(grupy, None)
+    for name in header['categories']:
+        plik.write(f"\n=== Category {name} Routes ===\n")
+        if grupa is None or grupa[0] != name:
+            continue
+        for record in grupa[1]:
+            plik.write(f"\nDriver #{record['driver']}:\n")
+            plik.write(f"Total Weight: {record['weight']} kg\n")
+            plik.write(f"Total Distance: {record['distance']} km\n")
+            if record['late_stops']:
+                plik.write(f"Late Stops: {record['late_stops']}\n")
+            plik.write("Estimated arrival times:\n")
+            for stop in record['stops']:
+                plik.write(f"- {stop['city']}: {stop['arrival']}{' LATE' if stop['late'] else ''}\n")
+            plik.write("\nRoute sequence:\n")
+            for stop in record['stops']:
+                plik.write(f"{stop['position']}. {stop['city']} - Weight: {stop['weight']}kg\n")
+            plik.write(f"\nGoogle Maps Link:\n{record['maps_url']}\n")
+            plik.write("\n" + "-"*50 + "\n")
+        grupa = next(grupy, None)
+
+
+def write_csv(plik, header, records):
+    writer = csv.writer(plik, lineterminator="\n")
+    writer.writerow(["category", "driver", "position", "city", "longitude", "latitude",
+                     "weight", "arrival", "route_weight", "route_distance", "late"])
+    for record in records:
+        for stop in record['stops']:
+            writer.writerow([record['category'], record['driver'], stop['position'], stop['city'],
+                             stop['longitude'], stop['latitude'], stop['weight'], stop['arrival'],
+                             record['weight'], record['distance'], int(stop['late'])])
+
+
+def write_json(plik, header, records):
+    plik.write('{"generated": %s, "center": %s, "routes": [' % (
+        json.dumps(header['generated']), json.dumps(list(header['center']))))
+    for nr, record in enumerate(records):
+        plik.write(",\n" if nr else "\n")
+        json.dump(record, plik)
+    plik.write("\n]}\n")
+
+
+def write_geojson(plik, header, records):
+    plik.write('{"type": "FeatureCollection", "features": [')
+    depot = [header['depot'][0], header['depot'][1]]
+    nr = 0
+    for record in records:
+        wspolrzedne = [depot] + [[s['longitude'], s['latitude']] for s in record['stops']] + [depot]
+        features = [{
+            'type': 'Feature',
+            'geometry': {'type': 'LineString', 'coordinates': wspolrzedne},
+            'properties': {
+                'category': record['category'],
+                'driver': record['driver'],
+                'weight': record['weight'],
+                'distance_km': record['distance'],
+                'optimal': record['optimal'],
+                'stops': len(record['stops']),
+                'late_stops': record['late_stops']
+            }
+        }]
+        for stop in record['stops']:
+            features.append({
+                'type': 'Feature',
+                'geometry': {'type': 'Point', 'coordinates': [stop['longitude'], stop['latitude']]},
+                'properties': {
+                    'category': record['category'],
+                    'driver': record['driver'],
+                    'position': stop['position'],
+                    'city': stop['city'],
+                    'weight': stop['weight'],
+                    'arrival': stop['arrival'],
+                    'late': stop['late']
+                }
+            })
+        for feature in features:
+            plik.write(",\n" if nr else "\n")
+            json.dump(feature, plik)
+            nr += 1
+    plik.write("\n]}\n")
+
+
+WRITERS = {"text": write_text, "csv": write_csv, "json": write_json, "geojson": write_geojson}
+
+
+def export(path, header, records, fmt=None):
+    """Stream records to path in fmt, by default the one its extension names"""
+    writer = WRITERS[fmt or format_for(path)]
+    with open(path, "w", encoding='utf-8') as plik:
+        writer(plik, header, records)
+    return path
@@ -0,0 +1,120 @@
+"""
+Uniform grid spatial index over stop coordinates.
+
+Points are bucketed into square cells in (longitude, latitude) degrees,
+sized so that each cell holds a few points on average. Queries scan only
+the cells that can contain matches and then filter by exact distance with
+the same functions as route_distance, so results agree with the distance
+matrices to the last bit.
+"""
+import math
+import numpy as np
+from route_distance import EARTH_RADIUS, pair_distances
+
+
+class GridIndex:
+    def __init__(self, lon, lat, points_per_cell=4):
+        self.lon = np.asarray(lon, dtype=float)
+        self.lat = np.asarray(lat, dtype=float)
+        n = len(self.lon)
+        if n == 0:
+            self.origin = (0.0, 0.0)
+            self.cell = 1.0
+            self.shape = (0, 0)
+            self.order = np.zeros(0, dtype=np.intp)
+            self.buckets = {}
+            return
+
+        self.origin = (float(self.lon.min()), float(self.lat.min()))
+        width = float(self.lon.max()) - self.origin[0]
+        height = float(self.lat.max()) - self.origin[1]
+        area = max(width * height, 1e-12)
+        self.cell = max(math.sqrt(area * points_per_cell / n), width / 4096, height / 4096, 1e-9)
+        self.shape = (int(width / self.cell) + 1, int(height / self.cell) + 1)
+
+        cx, cy = self._cells(self.lon, self.lat)
+        keys = cx * self.shape[1] + cy
+        self.order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[self.order]
+        boundaries = np.flatnonzero(np.diff(sorted_keys)) + 1
+        starts = np.concatenate(([0], boundaries))
+        ends = np.concatenate((boundaries, [n]))
+        self.buckets = {int(sorted_keys[s]): (int(s), int(e)) for s, e in zip(starts, ends)}
+
+    def __len__(self):
+        return len(self.lon)
+
+    def _cells(self, lon, lat):
+        cx = np.clip(((lon - self.origin[0]) / self.cell).astype(np.intp), 0, self.shape[0] - 1)
+        cy = np.clip(((lat - self.origin[1]) / self.cell).astype(np.intp), 0, self.shape[1] - 1)
+        return cx, cy
+
+    def _candidates(self, lon_min, lat_min, lon_max, lat_max):
+        # Points of every cell overlapping the box, or all points when the
+        # box covers more cells than there are points
+        nx, ny = self.shape
+        x0 = max(int(math.floor((lon_min - self.origin[0]) / self.cell)), 0)
+        y0 = max(int(math.floor((lat_min - self.origin[1]) / self.cell)), 0)
+        x1 = min(int(math.floor((lon_max - self.origin[0]) / self.cell)), nx - 1)
+        y1 = min(int(math.floor((lat_max - self.origin[1]) / self.cell)), ny - 1)
+        if x0 > x1 or y0 > y1:
+            return np.zeros(0, dtype=np.intp)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > len(self.lon):
+            return np.arange(len(self.lon))
+        parts = []
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                bucket = self.buckets.get(x * ny + y)
+                if bucket:
+                    parts.append(self.order[bucket[0]:bucket[1]])
+        if not parts:
+            return np.zeros(0, dtype=np.intp)
+        return np.sort(np.concatenate(parts))
+
+    def query_box(self, lon_min, lat_min, lon_max, lat_max):
+        """Indices of points inside the box, borders included"""
+        idx = self._candidates(lon_min, lat_min, lon_max, lat_max)
+        lon, lat = self.lon[idx], self.lat[idx]
+        mask = (lon >= lon_min) & (lon <= lon_max) & (lat >= lat_min) & (lat <= lat_max)
+        return idx[mask]
+
+    def query_radius(self, lon, lat, radius, metric="euclidean"):
+        """
+        Indices of points within radius of (lon, lat), border included.
+        radius is in degrees for "euclidean" and kilometres for "haversine".
+        """
+        if metric == "haversine":
+            dlat = math.degrees(radius / EARTH_RADIUS)
+            coslat = math.cos(math.radians(min(abs(lat) + dlat, 89.9)))
+            dlon = min(dlat / max(coslat, 1e-9), 180.0)
+        else:
+            dlat = dlon = radius
+        idx = self._candidates(lon - dlon, lat - dlat, lon + dlon, lat + dlat)
+        d = pair_distances(self.lon[idx], self.lat[idx], lon, lat, metric)
+        return idx[d <= radius]
+
+    def query_knn(self, lon, lat, k, metric="euclidean", exclude=None):
+        """Indices of the k nearest points, closest first"""
+        n = len(self.lon)
+        k = min(k, n - (exclude is not None))
+        if k <= 0:
+            return np.zeros(0, dtype=np.intp)
+        # Grow a square window until it holds k points and the farthest of
+        # them is closer than anything that could lie outside the window
+        half = self.cell
+        while True:
+            idx = self._candidates(lon - half, lat - half, lon + half, lat + half)
+            if exclude is not None:
+                idx = idx[idx != exclude]
+            covers_all = len(idx) >= n - (exclude is not None)
+            if len(idx) >= k:
+                d = pair_distances(self.lon[idx], self.lat[idx], lon, lat, metric)
+                nearest = np.argsort(d, kind="stable")[:k]
+                reach = d[nearest[-1]]
+                if metric == "haversine":
+                    reach = math.degrees(reach / EARTH_RADIUS) / max(math.cos(math.radians(lat)), 1e-9)
+                if covers_all or reach <= half:
+                    return idx[nearest]
+            elif covers_all:
+                return idx
+            half *= 2
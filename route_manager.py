@@ -1,20 +1,40 @@
+import os
+import queue
+import threading
 import tkinter as tk
+import numpy as np
 from tkinter import filedialog, ttk, messagebox
-import datetime
-import matplotlib.pyplot as plt
-import math
-import csv
-from itertools import permutations
-
-class RouteManager:
+from route_engine import RouteEngine
+from route_plot import draw_routes
+from route_session import read_manifest
+from route_store import DEPOT
+
+# Columns of the driver table on the Statistics tab: title and width
+STATS_COLUMNS = {
+    'weight': ("Weight kg", 80),
+    'distance': ("Distance km", 90),
+    'end': ("Back at", 70),
+    'late': ("Late", 50),
+    'optimal': ("Optimal", 60)
+}
+
+class RouteManager(RouteEngine):
     def __init__(self):
-        self.kategoriaA = []
-        self.kategoriaB = []
-        self.kategoriaC = []
-        self.routes = []
-        # Update center coordinates to Spodek's location
-        self.center = (50.266247, 19.027401)  # Katowice Spodek coordinates
-        
+        super().__init__()
+
+        # Processing runs on a worker thread that reports through this queue
+        self.worker = None
+        self.cancel_event = None
+        self.progress_queue = queue.Queue()
+        # Every run's timings go to a JSON lines log; plotting when a run
+        # finishes can be switched off
+        self.run_log_path = os.path.join(os.path.expanduser("~"), ".cache", "route_manager", "runs.jsonl")
+        self.plot_when_done = True
+        # The plan is snapshotted here after every run, late orders insert
+        # and applied manual edit, so Open Session brings it back after a
+        # restart or crash
+        self.session_path = os.path.join(os.path.expanduser("~"), ".cache", "route_manager", "session")
+
         # GUI Setup
         self.root = tk.Tk()
         self.root.title("Route Manager Pro")
@@ -69,6 +89,8 @@ class RouteManager:
         # Notebook centered
         notebook = ttk.Notebook(main_container)
         notebook.grid(row=1, column=0, sticky="nsew")
+        notebook.bind('<<NotebookTabChanged>>', self._stats_tab_shown)
+        self.notebook = notebook
         
         # Configure main_container grid weights
         main_container.grid_rowconfigure(1, weight=1)
@@ -107,16 +129,102 @@ class RouteManager:
                   style='Action.TButton',
                   command=self.save_all_routes).grid(row=0, column=1, padx=3, pady=2)
         
-        ttk.Button(buttons_frame,
-                  text="⚙️ Process",
-                  style='Action.TButton',
-                  command=self.process_all_routes).grid(row=1, column=0, padx=3, pady=2)
+        self.process_button = ttk.Button(buttons_frame,
+                                         text="⚙️ Process",
+                                         style='Action.TButton',
+                                         command=self.process_all_routes)
+        self.process_button.grid(row=1, column=0, padx=3, pady=2)
         
         ttk.Button(buttons_frame,
                   text="📊 Plot",
                   style='Action.TButton',
                   command=self.plot_detailed_routes).grid(row=1, column=1, padx=3, pady=2)
 
+        self.cancel_button = ttk.Button(buttons_frame,
+                                        text="✖ Cancel",
+                                        style='Action.TButton',
+                                        state="disabled",
+                                        command=self.cancel_processing)
+        self.cancel_button.grid(row=2, column=1, padx=3, pady=2)
+
+        ttk.Button(buttons_frame,
+                  text="➕ Late Orders",
+                  style='Action.TButton',
+                  command=self.insert_csv).grid(row=2, column=0, padx=3, pady=2)
+
+        ttk.Button(buttons_frame,
+                  text="📤 Export",
+                  style='Action.TButton',
+                  command=self.export_routes).grid(row=3, column=0, padx=3, pady=2)
+
+        ttk.Button(buttons_frame,
+                  text="🛣 Road Network",
+                  style='Action.TButton',
+                  command=self.load_road_graph).grid(row=3, column=1, padx=3, pady=2)
+
+        ttk.Button(buttons_frame,
+                  text="💼 Save Session",
+                  style='Action.TButton',
+                  command=self.save_session).grid(row=4, column=0, padx=3, pady=2)
+
+        ttk.Button(buttons_frame,
+                  text="🗂 Open Session",
+                  style='Action.TButton',
+                  command=self.load_session).grid(row=4, column=1, padx=3, pady=2)
+
+        # Optimizer selection
+        mode_frame = ttk.Frame(control_frame)
+        mode_frame.grid(row=1, column=0, pady=5)
+        ttk.Label(mode_frame, text="Optimizer:").grid(row=0, column=0, padx=5)
+        self.solver_var = tk.StringVar(value=self.solver_mode)
+        solver_combo = ttk.Combobox(mode_frame,
+                                    textvariable=self.solver_var,
+                                    values=["exact", "local"],
+                                    state="readonly",
+                                    width=8)
+        solver_combo.grid(row=0, column=1, padx=5)
+        solver_combo.bind('<<ComboboxSelected>>',
+                          lambda event: setattr(self, 'solver_mode', self.solver_var.get()))
+
+        ttk.Label(mode_frame, text="Split:").grid(row=0, column=2, padx=5)
+        self.split_var = tk.StringVar(value=self.split_mode)
+        split_combo = ttk.Combobox(mode_frame,
+                                   textvariable=self.split_var,
+                                   values=["sequential", "sweep", "savings"],
+                                   state="readonly",
+                                   width=10)
+        split_combo.grid(row=0, column=3, padx=5)
+        split_combo.bind('<<ComboboxSelected>>',
+                         lambda event: setattr(self, 'split_mode', self.split_var.get()))
+
+        self.plot_var = tk.BooleanVar(value=self.plot_when_done)
+        ttk.Checkbutton(mode_frame,
+                        text="Plot when done",
+                        variable=self.plot_var,
+                        command=lambda: setattr(self, 'plot_when_done', self.plot_var.get())
+                        ).grid(row=1, column=0, columnspan=2, padx=5, sticky="w")
+        self.profile_var = tk.BooleanVar(value=self.profile_runs)
+        ttk.Checkbutton(mode_frame,
+                        text="Profile",
+                        variable=self.profile_var,
+                        command=lambda: setattr(self, 'profile_runs', self.profile_var.get())
+                        ).grid(row=1, column=2, columnspan=2, padx=5, sticky="w")
+        # Takes effect on the next Load CSV
+        self.aggregate_var = tk.BooleanVar(value=self.aggregate_radius is not None)
+        ttk.Checkbutton(mode_frame,
+                        text="Merge orders at one address",
+                        variable=self.aggregate_var,
+                        command=lambda: setattr(self, 'aggregate_radius',
+                                                0.0 if self.aggregate_var.get() else None)
+                        ).grid(row=2, column=0, columnspan=4, padx=5, sticky="w")
+        # Plans a sweep or savings split twice, see RouteEngine.compare_split
+        self.compare_var = tk.BooleanVar(value=self.compare_split)
+        ttk.Checkbutton(mode_frame,
+                        text="Compare with sequential split",
+                        variable=self.compare_var,
+                        command=lambda: setattr(self, 'compare_split', self.compare_var.get())
+                        ).grid(row=3, column=0, columnspan=4, padx=5, sticky="w")
+
         # Results frame centered
         results_frame = ttk.LabelFrame(data_tab,
                                      text="Results",
@@ -153,13 +261,42 @@ class RouteManager:
                                    style='Card.TLabelframe',
                                    padding="15")
         stats_frame.grid(row=0, column=0, sticky="nsew", padx=5, pady=5)
-        
+        stats_tab.grid_rowconfigure(0, weight=1)
+        stats_tab.grid_columnconfigure(0, weight=1)
+        stats_frame.grid_rowconfigure(1, weight=1)
+        stats_frame.grid_columnconfigure(0, weight=1)
+        self.stats_tab = stats_tab
+        
+        # Totals and the last run on top, one row per driver below; a
+        # driver's stops and link are only filled in when it is expanded
         self.stats_text = tk.Text(stats_frame,
-                                height=20,
+                                height=6,
                                 font=('Consolas', 10),
                                 bg='#fafafa',
                                 wrap=tk.WORD)
-        self.stats_text.grid(row=0, column=0, sticky="nsew")
+        self.stats_text.grid(row=0, column=0, columnspan=2, sticky="nsew", pady=(0, 10))
+        
+        self.stats_tree = ttk.Treeview(stats_frame,
+                                       columns=STATS_COLUMNS,
+                                       height=12)
+        self.stats_tree.heading('#0', text="Route",
+                                command=lambda: self.sort_stats('category'))
+        self.stats_tree.column('#0', width=160, stretch=True)
+        for column, (title, width) in STATS_COLUMNS.items():
+            self.stats_tree.heading(column, text=title,
+                                    command=lambda c=column: self.sort_stats(c))
+            self.stats_tree.column(column, width=width, anchor="e", stretch=False)
+        self.stats_tree.bind('<<TreeviewOpen>>', self._expand_driver)
+        scrollbar = ttk.Scrollbar(stats_frame,
+                                 orient="vertical",
+                                 command=self.stats_tree.yview)
+        self.stats_tree.configure(yscrollcommand=scrollbar.set)
+        
+        self.stats_tree.grid(row=1, column=0, sticky="nsew")
+        scrollbar.grid(row=1, column=1, sticky="ns")
+        self.stats_rows = []
+        self.stats_sort = ('category', False)
+        self.stats_stale = True
 
         # Route Ordering Tab
         order_tab = ttk.Frame(notebook, padding="15")
@@ -226,9 +363,21 @@ class RouteManager:
                    text="Apply Changes",
                    command=self.apply_city_changes).grid(row=0, column=2, padx=5)
 
+        # Buttons that read or change the plan, the settings a run reads and
+        # the route selectors are off while a run owns the plan
+        self.plan_widgets = [widget for widget in (buttons_frame.winfo_children() + mode_frame.winfo_children()
+                                                   + [category_combo, self.route_combo] + btn_frame.winfo_children())
+                             if widget not in (self.process_button, self.cancel_button)
+                             and not isinstance(widget, ttk.Label)]
+
         # Status bar with custom style
         self.status_var = tk.StringVar()
         self.status_var.set("Ready")
+        try:
+            if read_manifest(self.session_path) is not None:
+                self.status_var.set("Ready - Open Session restores the last plan")
+        except (OSError, ValueError):
+            pass
         status_bar = ttk.Label(main_container,
                              textvariable=self.status_var,
                              relief="sunken",
@@ -239,350 +388,292 @@ class RouteManager:
     def update_display(self, text):
         self.result_text.delete(1.0, tk.END)
         self.result_text.insert(tk.END, text)
-        self.update_stats()
-
-    def haversine_distance(self, lat1, lon1, lat2, lon2):
-        """
-        Calculate distance between two points on Earth using Haversine formula.
-        Returns distance in kilometers.
-        """
-        R = 6371  # Earth's radius in kilometers
-
-        # Convert to radians
-        lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
-        
-        # Haversine formula
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
-        a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
-        c = 2 * math.asin(math.sqrt(a))
-        
-        return R * c
-
-    def calculate_driver_stats(self):
-        stats = []
-        
-        for category, name in [(self.kategoriaA, "A"), (self.kategoriaB, "B"), (self.kategoriaC, "C")]:
-            for i, route in enumerate(category):
-                if not route:
-                    continue
-                    
-                total_weight = sum(point[2] for point in route if point[3] != "Spodek")
-                
-                total_distance = 0
-                for j in range(len(route)-1):
-                    lat1, lon1 = route[j][1], route[j][0]
-                    lat2, lon2 = route[j+1][1], route[j+1][0]
-                    total_distance += self.haversine_distance(lat1, lon1, lat2, lon2)
-                
-                stats.append({
-                    'category': name,
-                    'driver': i+1,
-                    'weight': total_weight,
-                    'distance': round(total_distance, 2)  # Round to 2 decimal places
-                })
-        
-        return stats
-
-    def generate_maps_url(self, route):
-        """Generate Google Maps URL for a given route with return to starting point"""
-        if not route:
-            return ""
-        
-        # Start with base URL
-        url = "https://www.google.com/maps/dir/"
-        
-        # Store starting point coordinates (Spodek location)
-        start_point = "50.266247,19.027401"  # Spodek coordinates
-        
-        # Add starting point
-        url += f"{start_point}/"
-        
-        # Add each waypoint
-        for point in route:
-            # Skip Spodek points as they're just markers
-            if point[3] != "Spodek":
-                # Google Maps expects coordinates as "lat,lng"
-                url += f"{point[1]},{point[0]}/"
-        
-        # Add return to starting point
-        url += f"{start_point}/"
-        
-        return url
 
     def update_stats(self):
-        driver_stats = self.calculate_driver_stats()
-        
-        stats = f"""Route Statistics:
-
-Total Routes: {len(self.routes)}
-Category A Routes: {len(self.kategoriaA)}
-Category B Routes: {len(self.kategoriaB)}
-Category C Routes: {len(self.kategoriaC)}
-
-Center Point: {self.center}
-
-Driver Details:
-"""
-        
-        for stat in driver_stats:
-            category = stat['category']
-            driver_num = stat['driver']
-            
-            route = None
-            if category == 'A' and len(self.kategoriaA) > driver_num-1:
-                route = self.kategoriaA[driver_num-1]
-            elif category == 'B' and len(self.kategoriaB) > driver_num-1:
-                route = self.kategoriaB[driver_num-1]
-            elif category == 'C' and len(self.kategoriaC) > driver_num-1:
-                route = self.kategoriaC[driver_num-1]
-            
-            stats += f"""
-Category {category} Driver #{driver_num}:
-- Total Weight: {stat['weight']} kg
-- Total Distance: {stat['distance']} km
-"""
-            if route:
-                arrival_times = self.calculate_arrival_time(route)
-                stats += "Estimated arrival times:\n"
-                for point, time in zip(route, arrival_times):
-                    if point[3] != "Spodek":
-                        stats += f"- {point[3]}: {time}\n"
-                
-                maps_url = self.generate_maps_url(route)
-                stats += f"Route Link: {maps_url}\n"
-        
+        # Routes changed; the Statistics tab is rebuilt now if it is showing,
+        # otherwise when it is next opened
+        self.stats_stale = True
+        if self.notebook.select() == str(self.stats_tab):
+            self.refresh_stats()
+
+    def _stats_tab_shown(self, event=None):
+        if self.stats_stale and self.notebook.select() == str(self.stats_tab):
+            self.refresh_stats()
+
+    def refresh_stats(self):
+        if self._busy():
+            # The worker is still building the plan; _process_finished
+            # refreshes the tab once it is handed back
+            self.stats_stale = True
+            return
+        self.stats_stale = False
         self.stats_text.delete(1.0, tk.END)
-        self.stats_text.insert(tk.END, stats)
+        self.stats_text.insert(tk.END, self.stats_overview())
+        
+        self.stats_rows = []
+        self.compute_schedules()
+        for stat in self.calculate_driver_stats():
+            row = dict(stat)
+            row['end'] = self.route_end(stat['category'], stat['driver'] - 1)
+            self.stats_rows.append(row)
+        
+        self.stats_tree.delete(*self.stats_tree.get_children())
+        for row in self.stats_rows:
+            iid = f"{row['category']}:{row['driver']}"
+            self.stats_tree.insert('', tk.END, iid=iid,
+                                   text=f"Category {row['category']} Driver #{row['driver']}",
+                                   values=(row['weight'], f"{row['distance']:.2f}", row['end'],
+                                           row['late'], 'yes' if row['optimal'] else 'no'))
+            # Placeholder so the driver can be expanded, see _expand_driver
+            self.stats_tree.insert(iid, tk.END, iid=f"{iid}:*")
+        column, reverse = self.stats_sort
+        self.sort_stats(column, reverse)
+
+    def sort_stats(self, column, reverse=None):
+        """Reorder the driver rows by a column; clicking it again reverses the order"""
+        if reverse is None:
+            reverse = self.stats_sort == (column, False)
+        self.stats_sort = (column, reverse)
+        if column == 'category':
+            klucz = lambda row: (row['category'], row['driver'])
+        else:
+            klucz = lambda row: (row[column], row['category'], row['driver'])
+        for nr, row in enumerate(sorted(self.stats_rows, key=klucz, reverse=reverse)):
+            self.stats_tree.move(f"{row['category']}:{row['driver']}", '', nr)
+
+    def _expand_driver(self, event=None):
+        iid = self.stats_tree.focus()
+        if self._busy() or not self.stats_tree.exists(f"{iid}:*"):
+            return
+        self.stats_tree.delete(f"{iid}:*")
+        category, driver = iid.split(":")
+        i = int(driver) - 1
+        late = set(self.route_late(category, i))
+        for j, order, arrival in self.route_orders(category, i):
+            self.stats_tree.insert(iid, tk.END,
+                                   text=f"{j}. {self.orders.name(order)}",
+                                   values=(float(self.orders.weight[order]), "", arrival,
+                                           "yes" if j in late else "", ""))
+        self.stats_tree.insert(iid, tk.END, text=f"Route Link: {self.route_maps_url(category, i)}")
 
     def update_status(self, text):
         self.status_var.set(text)
         self.root.update_idletasks()
 
-    def odleglosc(self, tupple1, tupple2):
-        return math.sqrt((tupple1[0] - tupple2[0])**2 + (tupple1[1] - tupple2[1])**2)
-
-    def kategoryzacja(self, lista):
-        self.kategoriaA.clear()
-        self.kategoriaB.clear()
-        self.kategoriaC.clear()
-        
-        for krotka in lista:
-            dystans = self.odleglosc(krotka[:2], self.center)
-            waga = krotka[2]
-            
-            if 0 <= waga <= 100 and 0 <= dystans <= 50:
-                self.kategoriaA.append(krotka)
-            elif 100 < waga <= 700 and 25 < dystans <= 120:
-                self.kategoriaB.append(krotka)
-            else:
-                self.kategoriaC.append(krotka)
-
-    def sort1(self, lista):
-        if len(lista) == 0:
-            return []
-        
-        # First, separate points with and without time constraints
-        time_constrained = []
-        no_constraints = []
-        
-        for point in lista:
-            # Check if point has hour information (position 4 in tuple)
-            if len(point) > 4 and point[4] == "8:00":
-                time_constrained.append(point)
-            else:
-                no_constraints.append(point)
-        
-        # Sort time constrained points by distance from center
-        time_constrained = sorted(time_constrained, 
-                                key=lambda x: self.odleglosc(x[:2], self.center))
-        
-        # Sort unconstrained points by distance
-        no_constraints = sorted(no_constraints, 
-                              key=lambda x: self.odleglosc(x[:2], self.center))
-        
-        # Start with time unconstrained points
-        result = no_constraints
-        
-        # Add time constrained points at the end to ensure they're visited later
-        result.extend(time_constrained)
-        
-        return result
-
-    def calculate_arrival_time(self, route):
-        """Calculate estimated arrival times for each point in route"""
-        AVERAGE_SPEED = 50  # km/h
-        current_time = datetime.datetime.strptime("6:00", "%H:%M")  # Start at 6:00
-        arrival_times = []
-        
-        for i in range(len(route)):
-            if i > 0:
-                # Calculate travel time from previous point
-                distance = self.haversine_distance(
-                    route[i-1][1], route[i-1][0],  # prev point
-                    route[i][1], route[i][0]        # current point
-                )
-                travel_time = datetime.timedelta(hours=distance/AVERAGE_SPEED)
-                current_time += travel_time
-            
-            # Check if we arrive too early at time-constrained point
-            if len(route[i]) > 4 and route[i][4] == "8:00":
-                target_time = datetime.datetime.strptime("8:00", "%H:%M")
-                if current_time < target_time:
-                    current_time = target_time
-                    
-            arrival_times.append(current_time.strftime("%H:%M"))
-        
-        return arrival_times
-
-    def podziel(self, lista, max_waga):
-        if len(lista) == 0:
-            return []
-        
-        podlisty = []
-        aktualna_podlista = []
-        suma_wag = 0
-        
-        for krotka in lista:
-            if suma_wag + krotka[2] <= max_waga:
-                aktualna_podlista.append(krotka)
-                suma_wag += krotka[2]
-            else:
-                podlisty.append(list(aktualna_podlista))
-                aktualna_podlista = [krotka]
-                suma_wag = krotka[2]
-        
-        if aktualna_podlista:
-            podlisty.append(list(aktualna_podlista))
-        
-        return podlisty
-
-    def sort2(self, lista):
-        if len(lista) == 0:
-            return []
-        
-        najlepsze = []
-        # Update start point to Spodek coordinates
-        start_point = (19.027401, 50.266247, 0, "Spodek")
-        
-        for podlista in lista:
-            min_dist = float('inf')
-            najkrotsza = None
-            permutacje = permutations(podlista)
-            
-            for perm in permutacje:
-                perm = [start_point] + list(perm) + [start_point]
-                dlugosc = sum(self.odleglosc(perm[i][:2], perm[i+1][:2]) for i in range(len(perm)-1))
-                if dlugosc < min_dist:
-                    min_dist = dlugosc
-                    najkrotsza = perm
-            
-            najlepsze.append(najkrotsza)
-        
-        return najlepsze
-
-    def load_csv(self):
-        filename = filedialog.askopenfilename(
-            filetypes=[("CSV Files", "*.csv"), ("All Files", "*.*")])
-        if filename:
-            self.routes.clear()
-            with open(filename, 'r') as file:
-                csv_reader = csv.DictReader(file)
-                for row in csv_reader:
-                    self.routes.append((
-                        float(row['longitude']),
-                        float(row['latitude']),
-                        float(row['weight']),
-                        row['city'],
-                        row['hour']
-                    ))
-            self.update_display(f"Loaded {len(self.routes)} routes from {filename}")
+    def _busy(self):
+        # The worker thread owns the stops and routes until its result is taken in
+        return self.worker is not None and self.worker.is_alive()
+
+    def _set_running(self, running):
+        self.process_button.state(['disabled' if running else '!disabled'])
+        self.cancel_button.state(['!disabled' if running else 'disabled'])
+        for widget in self.plan_widgets:
+            widget.state(['disabled' if running else '!disabled'])
+
+    def load_csv(self, filenames=None):
+        if self._busy():
+            return
+        if filenames is None:
+            filenames = filedialog.askopenfilenames(
+                filetypes=[("CSV Files", "*.csv *.csv.gz"), ("All Files", "*.*")])
+        if isinstance(filenames, str):
+            filenames = [filenames]
+        if filenames:
+            super().load_csv(filenames)
+            message = f"Loaded {len(self.orders) - 1} routes from {', '.join(filenames)}"
+            if self.aggregation is not None:
+                message += f"\nAggregated {self.aggregation_summary()}"
+            if self.load_errors:
+                message += f"\nSkipped {len(self.load_errors)} bad rows:"
+                for plik, linia, powod in self.load_errors[:20]:
+                    message += f"\n- {plik}:{linia}: {powod}"
+            self.update_display(message)
+            self.update_stats()
+            self.update_route_selector()
+
+    def insert_csv(self, filenames=None):
+        if self._busy():
+            return
+        if filenames is None:
+            filenames = filedialog.askopenfilenames(
+                filetypes=[("CSV Files", "*.csv *.csv.gz"), ("All Files", "*.*")])
+        if isinstance(filenames, str):
+            filenames = [filenames]
+        if filenames:
+            delty = super().insert_csv(filenames)
+            message = f"Inserted late orders from {', '.join(filenames)}"
+            if self.distances is not None and self.distances.stale:
+                message += "\nRoad distances are stale without the road network, load it to measure roads again"
+            for (category, i), delta in sorted(delty.items()):
+                message += f"\n- Category {category} Driver #{i+1}: +{delta:.2f} km"
+            if self.load_errors:
+                message += f"\nSkipped {len(self.load_errors)} bad rows:"
+                for plik, linia, powod in self.load_errors[:20]:
+                    message += f"\n- {plik}:{linia}: {powod}"
+            self.update_display(message)
+            self.update_stats()
+            self.update_route_selector()
+            self._autosave()
 
     def process_all_routes(self):
-        self.kategoryzacja(self.routes)
-        
-        # Process category A
-        self.kategoriaA = self.sort1(self.kategoriaA)
-        self.kategoriaA = self.podziel(self.kategoriaA, 500)
-        self.kategoriaA = self.sort2(self.kategoriaA)
-        
-        # Process category B
-        self.kategoriaB = self.sort1(self.kategoriaB)
-        self.kategoriaB = self.podziel(self.kategoriaB, 1500)
-        self.kategoriaB = self.sort2(self.kategoriaB)
-        
-        # Process category C
-        self.kategoriaC = self.sort1(self.kategoriaC)
-        self.kategoriaC = self.podziel(self.kategoriaC, 10000)
-        self.kategoriaC = self.sort2(self.kategoriaC)
+        if self._busy():
+            return
         
-        self.update_display("Routes processed successfully!")
-        self.plot_detailed_routes()
+        self.cancel_event = threading.Event()
+        self._set_running(True)
+        self.update_status("Processing...")
+        
+        self.worker = threading.Thread(target=self._process_worker, daemon=True)
+        self.worker.start()
+        self.root.after(100, self._poll_progress)
+
+    def _process_worker(self):
+        # Runs off the Tk thread, so it only talks to the GUI via the queue
+        try:
+            super().process_all_routes(
+                progress=lambda *stan: self.progress_queue.put(('progress', stan)),
+                cancel=self.cancel_event)
+            self.progress_queue.put(('done', None))
+        except Exception as e:
+            self.progress_queue.put(('error', e))
+
+    def _poll_progress(self):
+        try:
+            while True:
+                rodzaj, dane = self.progress_queue.get_nowait()
+                if rodzaj == 'progress':
+                    done, total, km = dane
+                    self.update_status(f"Optimizing sub-routes: {done}/{total} done, "
+                                       f"plan {km:.1f} km")
+                elif rodzaj == 'done':
+                    self._process_finished()
+                    return
+                else:
+                    self.worker = None
+                    self._set_running(False)
+                    self.update_status("Processing failed")
+                    messagebox.showerror("Processing failed", str(dane))
+                    return
+        except queue.Empty:
+            pass
+        self.root.after(100, self._poll_progress)
+
+    def _process_finished(self):
+        # The worker has handed the plan back even if its thread is still exiting
+        self.worker = None
+        self._set_running(False)
+        
+        if self.cancelled:
+            message = "Processing cancelled, showing the best routes found so far"
+        else:
+            message = "Routes processed successfully!"
+        message += f" ({self.optimality_summary()})"
+        if self.split_report:
+            message += "\n" + self.split_summary()
+        with self.last_run.stage("update_stats"):
+            self.update_display(message)
+            self.update_stats()
+        if self.plot_when_done:
+            with self.last_run.stage("plot"):
+                self.plot_detailed_routes()
+        self.update_status(self.last_run.summary())
+        try:
+            self.write_run_log()
+        except OSError:
+            pass
+        self._autosave()
+
+    def cancel_processing(self):
+        if self.cancel_event is not None and self._busy():
+            self.cancel_event.set()
+            self.update_status("Cancelling...")
 
     def save_all_routes(self):
-        import os
-        
-        # Create filename with current date in the same directory as tadam.py
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        nazwa_pliku = os.path.join(current_dir, f"Trasa_{datetime.date.today()}.txt")
-        
-        # Get driver statistics
-        driver_stats = self.calculate_driver_stats()
-        
-        with open(nazwa_pliku, "w", encoding='utf-8') as plik:
-            # Write general statistics
-            plik.write("=== Route Management System Report ===\n")
-            plik.write(f"Generated on: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-            plik.write(f"Total Routes: {len(self.routes)}\n")
-            plik.write(f"Category A Routes: {len(self.kategoriaA)}\n")
-            plik.write(f"Category B Routes: {len(self.kategoriaB)}\n")
-            plik.write(f"Category C Routes: {len(self.kategoriaC)}\n")
-            plik.write(f"Center Point (Spodek): {self.center}\n\n")
-            
-            # Write detailed route information for each category
-            for category, name in [(self.kategoriaA, "A"), (self.kategoriaB, "B"), (self.kategoriaC, "C")]:
-                plik.write(f"\n=== Category {name} Routes ===\n")
-                
-                for i, route in enumerate(category):
-                    # Get stats for this route
-                    stat = next((s for s in driver_stats if s['category'] == name and s['driver'] == i+1), None)
-                    if stat:
-                        plik.write(f"\nDriver #{i+1}:\n")
-                        plik.write(f"Total Weight: {stat['weight']} kg\n")
-                        plik.write(f"Total Distance: {stat['distance']} km\n")
-                        
-                        # Add arrival times
-                        arrival_times = self.calculate_arrival_time(route)
-                        plik.write("Estimated arrival times:\n")
-                        for point, time in zip(route, arrival_times):
-                            if point[3] != "Spodek":
-                                plik.write(f"- {point[3]}: {time}\n")
-                        
-                        # Add route points
-                        plik.write("\nRoute sequence:\n")
-                        for j, point in enumerate(route):
-                            if point[3] != "Spodek":
-                                plik.write(f"{j}. {point[3]} - Weight: {point[2]}kg\n")
-                        
-                        # Add Google Maps link
-                        maps_url = self.generate_maps_url(route)
-                        plik.write(f"\nGoogle Maps Link:\n{maps_url}\n")
-                        plik.write("\n" + "-"*50 + "\n")
-            
-            self.update_display(f"Routes and statistics saved to {nazwa_pliku}")
+        if self._busy():
+            return
+        nazwa_pliku = super().save_all_routes()
+        self.update_display(f"Routes and statistics saved to {nazwa_pliku}")
+
+    def save_session(self, directory=None):
+        if self._busy():
+            return
+        if directory is None:
+            directory = filedialog.askdirectory(title="Save session to", mustexist=False)
+        if directory:
+            super().save_session(directory)
+            self.update_display(f"Session saved to {directory}")
+
+    def load_session(self, directory=None):
+        if self._busy():
+            return
+        if directory is None:
+            directory = filedialog.askdirectory(title="Open session", initialdir=self.session_path)
+        if directory:
+            try:
+                count = super().load_session(directory)
+            except (OSError, ValueError) as e:
+                messagebox.showerror("Open Session", str(e))
+                return
+            # The session brings its own settings, the controls show them
+            self.solver_var.set(self.solver_mode)
+            self.split_var.set(self.split_mode)
+            self.aggregate_var.set(self.aggregate_radius is not None)
+            self.compare_var.set(self.compare_split)
+            message = f"Restored {count} routes from session {directory}"
+            if self.aggregation is not None:
+                message += f"\nAggregated {self.aggregation_summary()}"
+            self.update_display(message)
+            self.update_stats()
+            self.update_route_selector()
+
+    def _autosave(self):
+        try:
+            super().save_session(self.session_path)
+        except (OSError, ValueError) as e:
+            self.update_status(f"Autosave to {self.session_path} failed: {e}")
+
+    def load_road_graph(self, path=None):
+        if self._busy():
+            return
+        if path is None:
+            path = filedialog.askopenfilename(
+                filetypes=[("Road Graph", "*.npz"), ("All Files", "*.*")])
+        if path:
+            graph = super().load_road_graph(path)
+            message = f"Loaded road network with {len(graph)} junctions from {path}"
+            if self._precomputed(self.distances) and self.distance_metric != "road":
+                message += "\nToo many stops for road matrices, using straight-line distances"
+            self.update_display(message)
+            self.update_stats()
+
+    def export_routes(self, nazwa_pliku=None, fmt=None):
+        if self._busy():
+            return
+        if nazwa_pliku is None:
+            nazwa_pliku = filedialog.asksaveasfilename(
+                defaultextension=".geojson",
+                filetypes=[("GeoJSON", "*.geojson"), ("JSON", "*.json"),
+                           ("CSV Files", "*.csv"), ("Text Report", "*.txt")])
+        if nazwa_pliku:
+            super().export_routes(nazwa_pliku, fmt)
+            self.update_display(f"Routes exported to {nazwa_pliku}")
 
     def plot_routes(self):
+        if self._busy():
+            return
+        import matplotlib.pyplot as plt
+
         plt.figure(figsize=(10, 8))
         
         # Plot categories with different colors
-        if self.kategoriaA:
-            x, y, _, _, _ = zip(*self.kategoriaA)
+        if len(self.kategoriaA):
+            x, y = self._category_points(self.kategoriaA)
             plt.scatter(x, y, c='green', label='Category A')
-        if self.kategoriaB:
-            x, y, _, _, _ = zip(*self.kategoriaB)
+        if len(self.kategoriaB):
+            x, y = self._category_points(self.kategoriaB)
             plt.scatter(x, y, c='blue', label='Category B')
-        if self.kategoriaC:
-            x, y, _, _, _ = zip(*self.kategoriaC)
+        if len(self.kategoriaC):
+            x, y = self._category_points(self.kategoriaC)
             plt.scatter(x, y, c='red', label='Category C')
 
         plt.scatter(self.center[0], self.center[1], c='black', marker='*', s=200, label='Center')
@@ -593,57 +684,28 @@ Category {category} Driver #{driver_num}:
         plt.grid(True)
         plt.show()
 
+    def _category_points(self, kategoria):
+        # Works for categorized stops as well as for processed routes
+        idx = np.hstack(kategoria).astype(np.intp)
+        idx = idx[idx != DEPOT]
+        return self.stops.lon[idx], self.stops.lat[idx]
+
     def plot_detailed_routes(self):
-        plt.figure(figsize=(12, 8))
-        colors = ['g', 'b', 'r']
-        categories = [self.kategoriaA, self.kategoriaB, self.kategoriaC]
-        
-        # Track min/max coordinates for auto-scaling
-        all_x = []
-        all_y = []
-        
-        for cat_idx, category in enumerate(categories):
-            for i, route in enumerate(category):
-                x = [point[0] for point in route]
-                y = [point[1] for point in route]
-                all_x.extend(x)
-                all_y.extend(y)
-                plt.plot(x, y, f'{colors[cat_idx]}-o', label=f'Cat {["A","B","C"][cat_idx]} Route {i+1}')
-                
-                for j, point in enumerate(route):
-                    if len(point) >= 4 and point[3] != "Spodek":
-                        plt.text(point[0], point[1], 
-                                f'{j}, {point[3]}', 
-                                fontsize=9,
-                                verticalalignment='bottom',
-                                horizontalalignment='right')
-                    elif point[3] == "Spodek":
-                        plt.text(point[0], point[1],
-                                'Spodek',
-                                fontsize=9,
-                                verticalalignment='bottom',
-                                horizontalalignment='right')
+        if self._busy():
+            return
+        import matplotlib.pyplot as plt
 
-        plt.scatter(self.center[0], self.center[1], c='black', marker='*', s=200, label='Center')
-        
-        # Auto-scale the plot with padding
-        if all_x and all_y:
-            x_min, x_max = min(all_x), max(all_x)
-            y_min, y_max = min(all_y), max(all_y)
-            x_padding = (x_max - x_min) * 0.1
-            y_padding = (y_max - y_min) * 0.1
-            plt.xlim(x_min - x_padding, x_max + x_padding)
-            plt.ylim(y_min - y_padding, y_max + y_padding)
-
-        plt.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
-        plt.title('Detailed Routes')
-        plt.xlabel('Longitude')
-        plt.ylabel('Latitude')
-        plt.grid(True)
-        plt.tight_layout()  # Adjust layout to prevent text cutoff
-        plt.show()
+        fig, ax = plt.subplots(figsize=(12, 8))
+        categories = {'A': self.kategoriaA, 'B': self.kategoriaB, 'C': self.kategoriaC}
+        # The figure keeps the label culler alive for zoom updates
+        fig.route_labels = draw_routes(ax, self.stops, categories, self.depot, self.label_limit)
+        ax.set_title('Detailed Routes')
+        fig.tight_layout()  # Adjust layout to prevent text cutoff
+        plt.show(block=False)
 
     def update_route_selector(self, event=None):
+        if self._busy():
+            return
         category = self.category_var.get()
         routes = self._get_current_category()
         
@@ -658,6 +720,8 @@ Category {category} Driver #{driver_num}:
             self.cities_listbox.delete(0, tk.END)
 
     def update_cities_list(self, event=None):
+        if self._busy():
+            return
         self.cities_listbox.delete(0, tk.END)
         
         category = self.category_var.get()
@@ -669,11 +733,13 @@ Category {category} Driver #{driver_num}:
         route_idx = int(self.route_var.get().split()[-1]) - 1
         if 0 <= route_idx < len(routes):
             route = routes[route_idx]
-            for point in route:
-                if point[3] != "Spodek":
-                    self.cities_listbox.insert(tk.END, point[3])
+            for point in route.tolist():
+                if point != DEPOT:
+                    self.cities_listbox.insert(tk.END, self.stops.name(point))
 
     def move_city_up(self):
+        if self._busy():
+            return
         selected = self.cities_listbox.curselection()
         if not selected or selected[0] == 0:
             return
@@ -681,42 +747,39 @@ Category {category} Driver #{driver_num}:
         idx = selected[0]
         category = self.category_var.get()
         route_idx = int(self.route_var.get().split()[-1]) - 1
-        routes = self._get_current_category()
-        
-        route = [p for p in routes[route_idx] if p[3] != "Spodek"]
-        
-        # Swap cities
-        route[idx], route[idx-1] = route[idx-1], route[idx]
         
-        start_point = (19.28, 50.59, 0, "Spodek")
-        routes[route_idx] = [start_point] + route + [start_point]
+        # Swap cities, position 0 of the route is the depot
+        self.swap_stops(category, route_idx, idx + 1, idx)
+        self._mark_not_optimal(route_idx)
         
         # Update display
         self.update_cities_list()
         self.cities_listbox.selection_set(idx-1)
 
     def move_city_down(self):
+        if self._busy():
+            return
         selected = self.cities_listbox.curselection()
         if not selected or selected[0] >= self.cities_listbox.size() - 1:
             return
         
         idx = selected[0]
+        category = self.category_var.get()
         route_idx = int(self.route_var.get().split()[-1]) - 1
-        routes = self._get_current_category()
-        
-        route = [p for p in routes[route_idx] if p[3] != "Spodek"]
-        route[idx], route[idx+1] = route[idx+1], route[idx]
         
-        start_point = (19.28, 50.59, 0, "Spodek")
-        routes[route_idx] = [start_point] + route + [start_point]
+        self.swap_stops(category, route_idx, idx + 1, idx + 2)
+        self._mark_not_optimal(route_idx)
         
         # Update display
         self.update_cities_list()
         self.cities_listbox.selection_set(idx+1)
 
     def apply_city_changes(self):
+        if self._busy():
+            return
         self.update_stats()
         self.update_display("City order updated successfully!")
+        self._autosave()
 
     def update_route_list(self, event=None):
         self.route_listbox.delete(0, tk.END)
@@ -731,40 +794,52 @@ Category {category} Driver #{driver_num}:
             routes = self.kategoriaC
         
         for i, route in enumerate(routes):
-            cities = [point[3] for point in route if point[3] != "Spodek"]
+            cities = [self.stops.name(point) for point in route.tolist() if point != DEPOT]
             self.route_listbox.insert(tk.END, f"Route {i+1}: {' -> '.join(cities)}")
 
     def move_route_up(self):
+        if self._busy():
+            return
         selected = self.route_listbox.curselection()
         if not selected or selected[0] == 0:
             return
         
         idx = selected[0]
-        category = self.category_var.get()
-        routes = self._get_current_category()
-        
-        # Swap routes
-        routes[idx], routes[idx-1] = routes[idx-1], routes[idx]
+        self._swap_routes(idx, idx - 1)
         
         # Update display
         self.update_route_list()
         self.route_listbox.selection_set(idx-1)
 
     def move_route_down(self):
+        if self._busy():
+            return
         selected = self.route_listbox.curselection()
         if not selected or selected[0] >= self.route_listbox.size() - 1:
             return
         
         idx = selected[0]
-        routes = self._get_current_category()
-        
-        # Swap routes
-        routes[idx], routes[idx+1] = routes[idx+1], routes[idx]
+        self._swap_routes(idx, idx + 1)
         
         # Update display
         self.update_route_list()
         self.route_listbox.selection_set(idx+1)
 
+    def _swap_routes(self, i, j):
+        # Reports and cached stats are by route index, they move along
+        category = self.category_var.get()
+        routes = self._get_current_category()
+        routes[i], routes[j] = routes[j], routes[i]
+        reports = self.route_reports[category]
+        if max(i, j) < len(reports):
+            reports[i], reports[j] = reports[j], reports[i]
+        stats = [self._route_stats.pop((category, k), None) for k in (i, j)]
+        for k, stat in zip((j, i), stats):
+            if stat is not None:
+                # The text names the driver by number
+                stat['text'] = None
+                self._route_stats[(category, k)] = stat
+
     def _get_current_category(self):
         category = self.category_var.get()
         if category == "A":
@@ -773,9 +848,21 @@ Category {category} Driver #{driver_num}:
             return self.kategoriaB
         return self.kategoriaC
 
+    def _mark_not_optimal(self, route_idx):
+        # A manually reordered route is no longer the proven optimum
+        reports = self.route_reports[self.category_var.get()]
+        if route_idx < len(reports):
+            reports[route_idx]['optimal'] = False
+        cache = self._route_stats.get((self.category_var.get(), route_idx))
+        if cache is not None:
+            cache['text'] = None
+
     def apply_route_changes(self):
+        if self._busy():
+            return
         self.update_stats()
         self.update_display("Route order updated successfully!")
+        self._autosave()
 
     def run(self):
         self.root.mainloop()
@@ -0,0 +1,134 @@
+"""
+On-disk cache of proven-optimal sub-route tours.
+
+A sub-route is keyed by a hash of the depot and the sorted stop coordinates,
+so the same stops found in any order hit the same entry. Tours are stored as
+positions into that sorted order and mapped back to the caller's order on
+lookup. The cache belongs to one distance metric and empties itself when
+opened for another one; above max_entries the least recently used tours are
+dropped. Lookups only reorder the tours in memory, so a run served wholly
+from the cache does not write the file; the order is saved with the next
+new tour. Saving merges in the tours other processes saved meanwhile, under
+an exclusive lock on <path>.lock so concurrent saves do not lose each
+other's tours.
+"""
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from contextlib import contextmanager
+import numpy as np
+
+VERSION = 1
+
+
+def stop_key(lon, lat):
+    """
+    Hash of a sub-route given as coordinates with the depot first, and the
+    positions of its stops in canonical (sorted) order
+    """
+    lon = np.asarray(lon, dtype=float)
+    lat = np.asarray(lat, dtype=float)
+    order = np.lexsort((lat[1:], lon[1:])) + 1
+    punkty = np.concatenate(([lon[0], lat[0]], np.column_stack((lon[order], lat[order])).ravel()))
+    return hashlib.blake2b(punkty.tobytes(), digest_size=16).hexdigest(), order
+
+
+@contextmanager
+def _file_lock(path):
+    # Exclusive lock held by one process at a time, blocking until it is free
+    with open(path, "a+b") as plik:
+        try:
+            import fcntl
+        except ImportError:
+            # Windows; LK_LOCK gives up with OSError after about 10 s
+            import msvcrt
+            plik.seek(0)
+            msvcrt.locking(plik.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                plik.seek(0)
+                msvcrt.locking(plik.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(plik.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(plik.fileno(), fcntl.LOCK_UN)
+
+
+class TourCache:
+    def __init__(self, path, metric, max_entries=10000):
+        self.path = path
+        self.metric = metric
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.changed = False
+        try:
+            with open(path, encoding='utf-8') as plik:
+                dane = json.load(plik)
+        except (OSError, ValueError):
+            return
+        if dane.get('version') == VERSION and dane.get('metric') == metric:
+            self.entries.update(dane.get('tours', []))
+        else:
+            # Tours optimal in another metric are not worth keeping
+            self.changed = True
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, lon, lat):
+        """Cached tour for a sub-route, as stop positions 1..n like the solvers return, or None"""
+        key, order = stop_key(lon, lat)
+        tour = self.entries.get(key)
+        if tour is None or len(tour) != len(order):
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return [int(order[pozycja - 1]) for pozycja in tour]
+
+    def put(self, lon, lat, tour):
+        key, order = stop_key(lon, lat)
+        pozycje = np.empty(len(order) + 1, dtype=np.intp)
+        pozycje[order] = np.arange(1, len(order) + 1)
+        self.entries[key] = [int(pozycje[i]) for i in tour]
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        self.changed = True
+
+    def save(self):
+        """Write the cache back if it changed, atomically replacing the file"""
+        if not self.changed:
+            return
+        katalog = os.path.dirname(self.path)
+        if katalog:
+            os.makedirs(katalog, exist_ok=True)
+        with _file_lock(f"{self.path}.lock"):
+            self._merge_and_write()
+        self.changed = False
+
+    def _merge_and_write(self):
+        # Keep the tours other processes saved since this cache was opened,
+        # ours count as the most recently used
+        try:
+            with open(self.path, encoding='utf-8') as plik:
+                dane = json.load(plik)
+        except (OSError, ValueError):
+            dane = {}
+        if dane.get('version') == VERSION and dane.get('metric') == self.metric:
+            nasze = self.entries
+            self.entries = OrderedDict((key, tour) for key, tour in dane.get('tours', []) if key not in nasze)
+            self.entries.update(nasze)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        tymczasowy = f"{self.path}.{os.getpid()}.tmp"
+        with open(tymczasowy, "w", encoding='utf-8') as plik:
+            json.dump({'version': VERSION, 'metric': self.metric,
+                       'tours': list(self.entries.items())}, plik)
+        os.replace(tymczasowy, self.path)
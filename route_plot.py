@@ -0,0 +1,135 @@
+"""
+Batched matplotlib rendering of planned routes.
+
+Each category is drawn as one LineCollection for all its routes and one
+scatter for all its stops, so the artist count does not grow with the
+number of routes. Stop labels are culled to the visible area and thinned to
+at most label_limit, again whenever the view is zoomed or panned.
+render_files draws one image per category off-screen, without pyplot or a
+window, for headless runs.
+"""
+import numpy as np
+from route_store import DEPOT
+
+COLORS = {'A': 'green', 'B': 'blue', 'C': 'red'}
+
+
+def _segments(stops, routes):
+    return [np.column_stack((stops.lon[route], stops.lat[route])) for route in routes if len(route) > 1]
+
+
+def _stop_points(stops, routes):
+    # Every stop of the routes with its position in the route, depot left out
+    routes = [route for route in routes if len(route)]
+    if not routes:
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+    idx = np.concatenate(routes).astype(np.intp)
+    pozycje = np.concatenate([np.arange(len(route)) for route in routes])
+    przystanki = idx != DEPOT
+    return idx[przystanki], pozycje[przystanki]
+
+
+class LabelCuller:
+    """
+    Keeps at most limit stop labels on an axes: only stops inside the view,
+    and when there are more of those, one per cell of a grid over the view.
+    """
+
+    def __init__(self, ax, x, y, texts, limit=200, fontsize=9):
+        self.ax = ax
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.texts = texts
+        self.limit = limit
+        self.fontsize = fontsize
+        self.artists = []
+        ax.callbacks.connect('xlim_changed', self.update)
+        ax.callbacks.connect('ylim_changed', self.update)
+        self.update()
+
+    def visible(self):
+        x0, x1 = sorted(self.ax.get_xlim())
+        y0, y1 = sorted(self.ax.get_ylim())
+        widoczne = np.flatnonzero((self.x >= x0) & (self.x <= x1) & (self.y >= y0) & (self.y <= y1))
+        if len(widoczne) <= self.limit:
+            return widoczne
+        strona = max(int(np.sqrt(self.limit)), 1)
+        cx = np.minimum(((self.x[widoczne] - x0) / max(x1 - x0, 1e-12) * strona).astype(np.intp), strona - 1)
+        cy = np.minimum(((self.y[widoczne] - y0) / max(y1 - y0, 1e-12) * strona).astype(np.intp), strona - 1)
+        _, pierwsze = np.unique(cx * strona + cy, return_index=True)
+        return widoczne[np.sort(pierwsze)]
+
+    def update(self, ax=None):
+        for artist in self.artists:
+            artist.remove()
+        self.artists = [self.ax.text(self.x[i], self.y[i], self.texts[i],
+                                     fontsize=self.fontsize,
+                                     verticalalignment='bottom',
+                                     horizontalalignment='right')
+                        for i in self.visible().tolist()]
+
+
+def draw_routes(ax, stops, categories, depot, label_limit=200):
+    """
+    Draw {name: routes} on ax, returns the LabelCuller; it has to be kept
+    alive as long as the axes is shown for zooming to update the labels.
+    """
+    from matplotlib.collections import LineCollection
+
+    etykiety_x, etykiety_y, etykiety = [], [], []
+    wszystkie = [np.array([depot[0]]), np.array([depot[1]])]
+    for name, routes in categories.items():
+        if not routes:
+            continue
+        segments = _segments(stops, routes)
+        ax.add_collection(LineCollection(segments, colors=COLORS.get(name, 'gray'), linewidths=1,
+                                         label=f'Category {name} ({len(routes)} routes)'))
+        idx, pozycje = _stop_points(stops, routes)
+        ax.scatter(stops.lon[idx], stops.lat[idx], c=COLORS.get(name, 'gray'), s=12, zorder=3)
+        wszystkie[0] = np.concatenate((wszystkie[0], stops.lon[idx]))
+        wszystkie[1] = np.concatenate((wszystkie[1], stops.lat[idx]))
+        etykiety_x.append(stops.lon[idx])
+        etykiety_y.append(stops.lat[idx])
+        etykiety.extend(f'{j}, {stops.name(p)}' for j, p in zip(pozycje.tolist(), idx.tolist()))
+
+    ax.scatter(depot[0], depot[1], c='black', marker='*', s=200, zorder=4, label='Spodek')
+    ax.text(depot[0], depot[1], 'Spodek', fontsize=9, verticalalignment='bottom', horizontalalignment='right')
+
+    # Auto-scale the plot with padding
+    x, y = wszystkie
+    x_padding = (x.max() - x.min()) * 0.1 or 0.01
+    y_padding = (y.max() - y.min()) * 0.1 or 0.01
+    ax.set_xlim(x.min() - x_padding, x.max() + x_padding)
+    ax.set_ylim(y.min() - y_padding, y.max() + y_padding)
+    ax.set_xlabel('Longitude')
+    ax.set_ylabel('Latitude')
+    ax.grid(True)
+    ax.legend(loc='upper left')
+
+    if etykiety:
+        return LabelCuller(ax, np.concatenate(etykiety_x), np.concatenate(etykiety_y), etykiety, label_limit)
+    return None
+
+
+def render_files(prefix, stops, categories, depot, fmt="png", label_limit=200, dpi=150):
+    """
+    Write one image per non-empty category to <prefix>_<name>.<fmt> without
+    opening a window, returns the file names.
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    pliki = []
+    for name, routes in categories.items():
+        if not routes:
+            continue
+        fig = Figure(figsize=(12, 8))
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot()
+        draw_routes(ax, stops, {name: routes}, depot, label_limit)
+        ax.set_title(f'Category {name} Routes')
+        fig.tight_layout()
+        nazwa_pliku = f"{prefix}_{name}.{fmt}"
+        fig.savefig(nazwa_pliku, format=fmt, dpi=dpi)
+        pliki.append(nazwa_pliku)
+    return pliki
@@ -0,0 +1,111 @@
+"""
+Instrumentation of a planning run.
+
+A RunProfile collects the wall time of each named stage, counters such as
+sub-routes solved or distances evaluated and, optionally, a cProfile of the
+thread doing the run. Stages timed after stop, e.g. writing the report or
+the maps, still count towards the run's seconds. It is turned into a plain dict for the JSON run log
+and into a one-line summary for the status bar.
+"""
+import cProfile
+import datetime
+import json
+import os
+import pstats
+import time
+from contextlib import contextmanager
+
+TOP_FUNCTIONS = 25
+
+
+class RunProfile:
+    def __init__(self, cprofile=False):
+        self.started = datetime.datetime.now().isoformat(timespec='seconds')
+        self.stages = {}
+        self.counters = {}
+        self.seconds = 0.0
+        self.functions = []
+        self.profiler = cProfile.Profile() if cprofile else None
+        self._start = None
+
+    def start(self):
+        self._start = time.perf_counter()
+        if self.profiler is not None:
+            self.profiler.enable()
+
+    def stop(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.functions = top_functions(self.profiler)
+        self.seconds += time.perf_counter() - self._start
+        self._start = None
+
+    @contextmanager
+    def stage(self, name):
+        """Add the wall time of the block to stage name"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            sekundy = time.perf_counter() - start
+            self.stages[name] = self.stages.get(name, 0.0) + sekundy
+            if self._start is None:
+                # Outside start/stop, the run's total does not cover it yet
+                self.seconds += sekundy
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def to_dict(self):
+        return {
+            'started': self.started,
+            'seconds': round(self.seconds, 6),
+            'stages': {name: round(s, 6) for name, s in self.stages.items()},
+            'counters': dict(self.counters),
+            'profile': self.functions
+        }
+
+    @classmethod
+    def from_dict(cls, run):
+        """A finished run back from to_dict"""
+        profile = cls()
+        profile.started = run['started']
+        profile.seconds = run['seconds']
+        profile.stages = dict(run['stages'])
+        profile.counters = dict(run['counters'])
+        profile.functions = list(run['profile'])
+        return profile
+
+    def summary(self):
+        etapy = sorted(self.stages.items(), key=lambda etap: -etap[1])
+        text = f"Run took {self.seconds:.2f} s"
+        if etapy:
+            text += ": " + ", ".join(f"{name} {s:.2f} s" for name, s in etapy)
+        if self.counters:
+            text += " | " + ", ".join(f"{name} {n:,}" for name, n in self.counters.items())
+        return text
+
+    def save(self, path):
+        """Append the run as one JSON line to the log file"""
+        katalog = os.path.dirname(path)
+        if katalog:
+            os.makedirs(katalog, exist_ok=True)
+        with open(path, "a", encoding='utf-8') as plik:
+            plik.write(json.dumps(self.to_dict()) + "\n")
+
+    def dump(self, path):
+        """Write the raw cProfile data, for pstats or snakeviz"""
+        if self.profiler is not None:
+            self.profiler.dump_stats(path)
+
+
+def top_functions(profiler, limit=TOP_FUNCTIONS):
+    """The functions with the most cumulative time, as dicts"""
+    stats = pstats.Stats(profiler).stats
+    ranking = sorted(stats.items(), key=lambda item: -item[1][3])[:limit]
+    return [{
+        'function': f"{os.path.basename(plik)}:{linia}({funkcja})",
+        'calls': nc,
+        'tottime': round(tt, 6),
+        'cumtime': round(ct, 6)
+    } for (plik, linia, funkcja), (cc, nc, tt, ct, callers) in ranking]
@@ -0,0 +1,298 @@
+"""
+Offline road-network distances.
+
+A RoadGraph is a directed graph of road junctions with the length (km) and
+driving time (minutes) of every road segment, converted offline from e.g. an
+OSM extract and stored as .npz, or read from two CSV files:
+
+    nodes:  id, longitude, latitude
+    edges:  from, to, km[, minutes][, oneway]
+
+Stops are snapped to their nearest junction and the access leg is added at
+both ends. road_matrices runs one Dijkstra per distinct source junction that
+stops as soon as every target junction is settled, shortest by km unless
+asked for the fastest paths, and sums both the km and the minutes along the
+paths it finds. The matrices are cached per stop set. Pairs the graph
+cannot connect keep their haversine distance. A RoadAtlas holds the matrices of the distinct
+stops of many stop sets, e.g. a week of order files, as .npy files that
+worker processes memory-map and slice. Convert CSV files with:
+
+    python route_roads.py nodes.csv edges.csv -o silesia.npz
+"""
+import argparse
+import csv
+import hashlib
+import heapq
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from route_distance import distance_matrix, pair_distances
+from route_index import GridIndex
+
+DEFAULT_SPEED = 50  # km/h, for edges and access legs without a time
+
+# The graph and targets of many_to_many in a worker process, see _start_worker
+_ZADANIE = None
+
+
+class RoadGraph:
+    def __init__(self, lon, lat, sources, targets, km, minutes=None, speed=DEFAULT_SPEED):
+        self.lon = np.asarray(lon, dtype=float)
+        self.lat = np.asarray(lat, dtype=float)
+        sources = np.asarray(sources, dtype=np.intp)
+        targets = np.asarray(targets, dtype=np.intp)
+        km = np.asarray(km, dtype=float)
+        if minutes is None:
+            minutes = km / speed * 60
+        minutes = np.asarray(minutes, dtype=float)
+
+        # Adjacency in CSR form: the edges leaving node u are
+        # heads[offsets[u]:offsets[u + 1]]
+        order = np.argsort(sources, kind="stable")
+        self.heads = targets[order]
+        self.km = km[order]
+        self.minutes = minutes[order]
+        self.offsets = np.zeros(len(self.lon) + 1, dtype=np.intp)
+        np.cumsum(np.bincount(sources, minlength=len(self.lon)), out=self.offsets[1:])
+
+        skrot = hashlib.blake2b(digest_size=16)
+        for tablica in (self.lon, self.lat, self.offsets, self.heads, self.km, self.minutes):
+            skrot.update(tablica.tobytes())
+        self.digest = skrot.hexdigest()
+        self.index = GridIndex(self.lon, self.lat)
+
+    def __len__(self):
+        return len(self.lon)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as dane:
+            return cls(dane['lon'], dane['lat'], dane['sources'], dane['targets'],
+                       dane['km'], dane['minutes'])
+
+    @classmethod
+    def from_csv(cls, nodes_path, edges_path, speed=DEFAULT_SPEED):
+        """Graph from node and edge CSV files; edges are two-way unless oneway is 1"""
+        with open(nodes_path, newline='') as plik:
+            wezly = list(csv.DictReader(plik))
+        numer = {w['id']: i for i, w in enumerate(wezly)}
+        lon = [float(w['longitude']) for w in wezly]
+        lat = [float(w['latitude']) for w in wezly]
+
+        sources, targets, km, minutes = [], [], [], []
+        with open(edges_path, newline='') as plik:
+            for krawedz in csv.DictReader(plik):
+                u, v = numer[krawedz['from']], numer[krawedz['to']]
+                d = float(krawedz['km'])
+                t = float(krawedz['minutes']) if krawedz.get('minutes') else d / speed * 60
+                kierunki = [(u, v)] if krawedz.get('oneway', '').strip() in ('1', 'yes', 'true') else [(u, v), (v, u)]
+                for a, b in kierunki:
+                    sources.append(a)
+                    targets.append(b)
+                    km.append(d)
+                    minutes.append(t)
+        return cls(lon, lat, sources, targets, km, minutes, speed)
+
+    def save(self, path):
+        sources = np.repeat(np.arange(len(self.lon)), np.diff(self.offsets))
+        np.savez_compressed(path, lon=self.lon, lat=self.lat, sources=sources,
+                            targets=self.heads, km=self.km, minutes=self.minutes)
+
+    def snap(self, lon, lat):
+        """Nearest junction of every point and the haversine km to it"""
+        lon = np.asarray(lon, dtype=float)
+        lat = np.asarray(lat, dtype=float)
+        wezly = np.array([int(self.index.query_knn(x, y, 1, "haversine")[0])
+                          for x, y in zip(lon.tolist(), lat.tolist())], dtype=np.intp)
+        return wezly, pair_distances(lon, lat, self.lon[wezly], self.lat[wezly])
+
+    def many_to_many(self, sources, targets, weight="km", workers=1):
+        """
+        Shortest paths by weight, "km" or "minutes", from every source to
+        every target node: their (km, minutes) matrices, inf if unreachable
+        """
+        wagi, drugie = (self.km, self.minutes) if weight == "km" else (self.minutes, self.km)
+        graf = (self.offsets.tolist(), self.heads.tolist(), wagi.tolist(), drugie.tolist())
+        sources = [int(s) for s in sources]
+        targets = [int(t) for t in targets]
+        if workers > 1 and len(sources) > 1:
+            # The graph goes to each worker once, tasks only carry a source
+            with ProcessPoolExecutor(max_workers=workers, initializer=_start_worker,
+                                     initargs=(graf, targets)) as pool:
+                wiersze = list(pool.map(_dijkstra_from, sources,
+                                        chunksize=max(len(sources) // (4 * workers), 1)))
+        else:
+            wiersze = [_dijkstra(graf, s, targets) for s in sources]
+        koszt = np.array([w[0] for w in wiersze], dtype=float).reshape(len(sources), len(targets))
+        drugi = np.array([w[1] for w in wiersze], dtype=float).reshape(len(sources), len(targets))
+        return (koszt, drugi) if weight == "km" else (drugi, koszt)
+
+
+def _start_worker(graf, targets):
+    global _ZADANIE
+    _ZADANIE = (graf, targets)
+
+
+def _dijkstra_from(source):
+    graf, targets = _ZADANIE
+    return _dijkstra(graf, source, targets)
+
+
+def _dijkstra(graf, source, targets):
+    # Dijkstra by wagi from source that stops once all targets are settled;
+    # drugie is summed along the same shortest paths
+    offsets, heads, wagi, drugie = graf
+    inf = float('inf')
+    dist = {source: 0.0}
+    suma = {source: 0.0}
+    pozostale = set(targets)
+    znalezione = {}
+    kopiec = [(0.0, source)]
+    while kopiec and pozostale:
+        d, u = heapq.heappop(kopiec)
+        if d > dist.get(u, inf):
+            continue
+        if u in pozostale:
+            pozostale.discard(u)
+            znalezione[u] = (d, suma[u])
+        for k in range(offsets[u], offsets[u + 1]):
+            v = heads[k]
+            nd = d + wagi[k]
+            if nd < dist.get(v, inf):
+                dist[v] = nd
+                suma[v] = suma[u] + drugie[k]
+                heapq.heappush(kopiec, (nd, v))
+    return ([znalezione.get(t, (inf, inf))[0] for t in targets],
+            [znalezione.get(t, (inf, inf))[1] for t in targets])
+
+
+def road_matrices(graph, lon, lat, speed=DEFAULT_SPEED, cache_dir=None, workers=1, weight="km"):
+    """
+    Road km and minutes between all points, row = from, column = to, both
+    along the shortest paths by weight, "km" or "minutes". With cache_dir
+    the matrices of a stop set are computed once and reloaded.
+    """
+    lon = np.asarray(lon, dtype=float)
+    lat = np.asarray(lat, dtype=float)
+    plik = None
+    if cache_dir is not None:
+        skrot = hashlib.blake2b(digest_size=16)
+        skrot.update(graph.digest.encode())
+        skrot.update(np.array([speed], dtype=float).tobytes())
+        skrot.update(weight.encode())
+        skrot.update(lon.tobytes())
+        skrot.update(lat.tobytes())
+        plik = os.path.join(cache_dir, f"{skrot.hexdigest()}.npz")
+        try:
+            with np.load(plik) as dane:
+                return dane['km'], dane['minutes']
+        except (OSError, ValueError, KeyError):
+            pass
+
+    wezly, dojazd = graph.snap(lon, lat)
+    unikalne, pozycja = np.unique(wezly, return_inverse=True)
+    prosto = distance_matrix(lon, lat)
+    dojazd_od = dojazd[:, None] + dojazd[None, :]
+    macierze = []
+    sciezki = graph.many_to_many(unikalne, unikalne, weight, workers)
+    for drogi, dojazd_koszt, zapas in ((sciezki[0], dojazd_od, prosto),
+                                       (sciezki[1], dojazd_od / speed * 60, prosto / speed * 60)):
+        macierz = drogi[np.ix_(pozycja, pozycja)] + dojazd_koszt
+        # Pairs without a road connection fall back to the straight line
+        macierz = np.where(np.isfinite(macierz), macierz, zapas)
+        np.fill_diagonal(macierz, 0.0)
+        macierze.append(macierz)
+    km, minutes = macierze
+
+    if plik is not None:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            tymczasowy = f"{plik}.{os.getpid()}.tmp.npz"
+            np.savez(tymczasowy, km=km, minutes=minutes)
+            os.replace(tymczasowy, plik)
+        except OSError:
+            pass
+    return km, minutes
+
+
+class RoadAtlas:
+    """
+    Road km and minutes between the distinct points of many stop sets,
+    computed once by build and memory-mapped from directory by every process
+    that opens it.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "atlas.json"), encoding='utf-8') as plik:
+            opis = json.load(plik)
+        self.digest = opis['digest']
+        self.speed = opis['speed']
+        lon = np.load(os.path.join(directory, "lon.npy"))
+        lat = np.load(os.path.join(directory, "lat.npy"))
+        self.position = {punkt: i for i, punkt in enumerate(zip(lon.tolist(), lat.tolist()))}
+        self.access = np.load(os.path.join(directory, "access.npy"))
+        self.km = np.load(os.path.join(directory, "km.npy"), mmap_mode='r')
+        self.minutes = np.load(os.path.join(directory, "minutes.npy"), mmap_mode='r')
+
+    def __len__(self):
+        return len(self.position)
+
+    @classmethod
+    def build(cls, graph, lon, lat, directory, speed=DEFAULT_SPEED, cache_dir=None, workers=1):
+        """Atlas of the distinct points among lon, lat, written to directory"""
+        punkty = np.unique(np.column_stack((np.asarray(lon, dtype=float), np.asarray(lat, dtype=float))), axis=0)
+        km, minutes = road_matrices(graph, punkty[:, 0], punkty[:, 1], speed, cache_dir, workers)
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "lon.npy"), punkty[:, 0])
+        np.save(os.path.join(directory, "lat.npy"), punkty[:, 1])
+        np.save(os.path.join(directory, "access.npy"), graph.snap(punkty[:, 0], punkty[:, 1])[1])
+        np.save(os.path.join(directory, "km.npy"), km)
+        np.save(os.path.join(directory, "minutes.npy"), minutes)
+        with open(os.path.join(directory, "atlas.json"), "w", encoding='utf-8') as plik:
+            json.dump({'digest': graph.digest, 'speed': speed}, plik)
+        return cls(directory)
+
+    def matrices(self, graph, lon, lat, speed=DEFAULT_SPEED):
+        """
+        km and minutes between the points like road_matrices, or None when
+        the atlas is of another graph or speed or lacks one of the points
+        """
+        if graph.digest != self.digest or speed != self.speed:
+            return None
+        try:
+            pozycje = np.array([self.position[punkt] for punkt in zip(np.asarray(lon, dtype=float).tolist(),
+                                                                      np.asarray(lat, dtype=float).tolist())],
+                               dtype=np.intp)
+        except KeyError:
+            return None
+        ix = np.ix_(pozycje, pozycje)
+        km, minutes = self.km[ix], self.minutes[ix]
+        # Two stops on the same spot are still the access leg there and back
+        # apart, as in road_matrices
+        razem = pozycje[:, None] == pozycje[None, :]
+        np.fill_diagonal(razem, False)
+        if razem.any():
+            dojazd = np.broadcast_to(2 * self.access[pozycje][:, None], razem.shape)[razem]
+            km[razem] = dojazd
+            minutes[razem] = dojazd / speed * 60
+        return km, minutes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert a road network from CSV to the .npz graph format")
+    parser.add_argument("nodes", help="CSV with id, longitude and latitude columns")
+    parser.add_argument("edges", help="CSV with from, to, km and optional minutes and oneway columns")
+    parser.add_argument("-o", "--output", required=True, help=".npz graph file to write")
+    args = parser.parse_args(argv)
+
+    graph = RoadGraph.from_csv(args.nodes, args.edges)
+    graph.save(args.output)
+    print(f"Saved {len(graph)} junctions and {len(graph.heads)} road segments to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""
+Time-window schedules of routes.
+
+All times are plain numbers in one unit, RouteEngine uses whole
+microseconds since midnight. Service at a stop starts at the later of the
+arrival and its earliest time and has to start by its latest time; the
+vehicle leaves after the stop's service time. Positions are route positions,
+the depot included.
+
+schedule_routes times a whole fleet in one pass over padded (route,
+position) arrays. With a SpeedProfile the driving time of a leg depends on
+the hour it is driven in, e.g. slower in the Katowice rush hours.
+"""
+import numpy as np
+
+# Share of the free-flow speed in each hour of the day, from midnight
+KATOWICE_RUSH_HOURS = ((1.0,) * 6 + (0.8, 0.6, 0.6, 0.8) + (1.0,) * 5
+                       + (0.8, 0.6, 0.6, 0.8) + (1.0,) * 5)
+
+
+class SpeedProfile:
+    """
+    Speed as a share of the free-flow speed for each hour of the day,
+    factors[h] from hour h to h + 1, repeating every len(factors) hours.
+    hour is the length of an hour in schedule units.
+    """
+
+    def __init__(self, factors, hour):
+        self.factors = np.asarray(factors, dtype=float)
+        if len(self.factors) == 0 or not np.all(self.factors > 0):
+            raise ValueError("speed factors must be positive")
+        self.hour = hour
+
+    def travel(self, depart, free):
+        """
+        Driving times of legs left at depart that take free at full speed.
+        A leg is driven hour by hour, so a slow hour only slows the part of
+        the leg driven in it.
+        """
+        depart, free = np.broadcast_arrays(np.asarray(depart, dtype=float), np.asarray(free, dtype=float))
+        t = depart.copy()
+        pozostalo = free.copy()
+        aktywne = np.flatnonzero(pozostalo > 0)
+        while len(aktywne):
+            godzina = np.floor(t[aktywne] / self.hour)
+            f = self.factors[godzina.astype(np.intp) % len(self.factors)]
+            do_granicy = (godzina + 1) * self.hour - t[aktywne]
+            koniec = f * do_granicy >= pozostalo[aktywne]
+            t[aktywne] += np.where(koniec, pozostalo[aktywne] / f, do_granicy)
+            pozostalo[aktywne] = np.where(koniec, 0.0, pozostalo[aktywne] - f * do_granicy)
+            aktywne = aktywne[~koniec]
+        return t - depart
+
+
+def _schedule(travel, earliest, latest, service, start, profile=None):
+    # Begin, arrival, driving and slack of (route, position) arrays; travel
+    # has one column less, each route starts at the depot at start
+    r, n = earliest.shape
+    if profile is None:
+        # begin[k] = max(earliest[k], begin[k-1] + service[k-1] + travel[k-1])
+        # is a running maximum once the cumulative driving time is taken out
+        offset = np.zeros((r, n))
+        np.cumsum(service[:, :-1] + travel, axis=1, out=offset[:, 1:])
+        ready = earliest - offset
+        if n:
+            ready[:, 0] = np.maximum(ready[:, 0], start)
+        begin = offset + np.maximum.accumulate(ready, axis=1)
+    else:
+        # Driving times depend on the departure, so positions go in turn,
+        # every route at once
+        travel = travel.copy()
+        begin = np.empty((r, n))
+        if n:
+            begin[:, 0] = np.maximum(earliest[:, 0], start)
+        for k in range(1, n):
+            depart = begin[:, k - 1] + service[:, k - 1]
+            travel[:, k - 1] = profile.travel(depart, travel[:, k - 1])
+            begin[:, k] = np.maximum(depart + travel[:, k - 1], earliest[:, k])
+    arrival = np.empty((r, n))
+    if n:
+        arrival[:, 0] = start
+        arrival[:, 1:] = begin[:, :-1] + service[:, :-1] + travel
+    wait = begin - arrival
+
+    # slack[k] = min over j >= k of latest[j] - begin[j] plus the waiting
+    # between k and j, which absorbs part of any delay
+    waited = np.cumsum(wait, axis=1)
+    reserve = (latest - begin + waited)[:, ::-1]
+    slack = np.minimum.accumulate(reserve, axis=1)[:, ::-1] - waited
+    return begin, arrival, travel, slack
+
+
+class RouteSchedule:
+    """
+    Service start times and forward time slack of a route. slack[k] is how
+    much service at position k can be pushed back without missing a latest
+    time at k or after it, which makes feasibility checks of route edits
+    O(1) instead of a new pass over the route. With a speed profile travel
+    holds the driving times at the scheduled departures.
+    """
+
+    def __init__(self, travel, earliest, latest, service, start, profile=None):
+        self.earliest = np.asarray(earliest, dtype=float)
+        self.latest = np.asarray(latest, dtype=float)
+        self.service = np.asarray(service, dtype=float)
+        self.profile = profile
+        wiersze = _schedule(np.asarray(travel, dtype=float)[None, :], self.earliest[None, :],
+                            self.latest[None, :], self.service[None, :], start, profile)
+        self.begin, self.arrival, self.travel, self.slack = (w[0] for w in wiersze)
+        self.wait = self.begin - self.arrival
+
+    @classmethod
+    def _from_arrays(cls, earliest, latest, service, profile, begin, arrival, travel, slack):
+        schedule = cls.__new__(cls)
+        schedule.earliest, schedule.latest, schedule.service = earliest, latest, service
+        schedule.profile = profile
+        schedule.begin, schedule.arrival, schedule.travel, schedule.slack = begin, arrival, travel, slack
+        schedule.wait = begin - arrival
+        return schedule
+
+    def __len__(self):
+        return len(self.begin)
+
+    def feasible(self):
+        return bool(np.all(self.begin <= self.latest))
+
+    def late(self):
+        """Positions whose service starts after their latest time"""
+        return np.flatnonzero(self.begin > self.latest)
+
+    def can_delay(self, pos, delta):
+        return delta <= self.slack[pos]
+
+    def insertion_feasible(self, earliest, latest, service, travel_in, travel_out):
+        """
+        Whether a stop fits between positions k-1 and k, for every k from 1
+        to the end. travel_in[k-1] is the time from position k-1 to the stop
+        and travel_out[k-1] from the stop to position k, at full speed. With
+        a speed profile the delay after the stop is taken as it would be
+        without one.
+        """
+        travel_in = np.asarray(travel_in, dtype=float)
+        travel_out = np.asarray(travel_out, dtype=float)
+        depart = self.begin[:-1] + self.service[:-1]
+        if self.profile is not None:
+            travel_in = self.profile.travel(depart, travel_in)
+        begin = np.maximum(depart + travel_in, earliest)
+        if self.profile is not None:
+            travel_out = self.profile.travel(begin + service, travel_out)
+        delay = begin + service + travel_out - self.begin[1:]
+        return (begin <= latest) & (delay <= self.slack[1:])
+
+
+def schedule_routes(travel, earliest, latest, service, start, profile=None):
+    """
+    RouteSchedules of many routes in one pass. travel, earliest, latest and
+    service are lists with one array per route, travel one shorter than the
+    route; routes are padded to the longest one and scheduled together.
+    """
+    if not earliest:
+        return []
+    dlugosci = [len(e) for e in earliest]
+    r, n = len(dlugosci), max(dlugosci)
+    dl = np.array(dlugosci)
+    # Padding neither waits, drives nor limits the slack
+    T = np.zeros((r, max(n - 1, 0)))
+    E = np.full((r, n), -np.inf)
+    L = np.full((r, n), np.inf)
+    S = np.zeros((r, n))
+    maska = np.arange(n) < dl[:, None]
+    E[maska] = np.concatenate(earliest)
+    L[maska] = np.concatenate(latest)
+    S[maska] = np.concatenate(service)
+    T[np.arange(max(n - 1, 0)) < dl[:, None] - 1] = np.concatenate([np.ravel(t) for t in travel])
+    begin, arrival, jazda, slack = _schedule(T, E, L, S, start, profile)
+    return [RouteSchedule._from_arrays(E[k, :m], L[k, :m], S[k, :m], profile, begin[k, :m],
+                                       arrival[k, :m], jazda[k, :max(m - 1, 0)], slack[k, :m])
+            for k, m in enumerate(dlugosci)]
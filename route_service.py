@@ -0,0 +1,318 @@
+"""
+Local HTTP/JSON planning service.
+
+Runs the kategoryzacja -> podziel -> sort2 pipeline and the driver stats for
+stops sent as JSON, on 127.0.0.1 only and without any network access:
+
+    POST /plan    {"stops": [{"longitude": 19.1, "latitude": 50.3, "weight": 120,
+                              "city": "Bytom", "hour": "6:00"}, ...],
+                   "mode": "exact", "split": "sequential", "time_budget": 2.0,
+                   "aggregate": 0.05}
+    GET  /health  queue length, plans running and counters
+
+Stops take the same keys as the CSV columns, including the optional time
+window ones; with aggregate, orders within that many km share a stop and
+the routes still list every order. An empty list or any stop that cannot
+be read gets 400 before the request is queued, and time_budget is capped at
+MAX_TIME_BUDGET seconds. A client that has not sent its whole request
+within READ_TIMEOUT seconds gets 408.
+Up to workers plans run at once and queue more wait, later requests get
+503. Plans run in a pool of worker processes so the event loop only parses
+and answers HTTP. A request identical to one still queued or running
+shares its plan instead of being planned again. Optimal tours are only
+remembered across requests with --tour-cache.
+
+    python route_service.py --port 8765 --workers 4 --queue 64
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+from route_engine import RouteEngine
+from route_store import read_records
+
+HOST = "127.0.0.1"
+MODES = ("exact", "local")
+SPLITS = ("sequential", "sweep", "savings")
+MAX_BODY = 64 * 2**20
+MAX_HEADERS = 100
+MAX_TIME_BUDGET = 60.0
+READ_TIMEOUT = 30.0
+
+
+class RequestError(Exception):
+    def __init__(self, status, message, errors=None):
+        super().__init__(message)
+        self.status = status
+        self.errors = errors
+
+
+def parse_request(body):
+    """The plan request of a JSON body, RequestError 400 if it is not one"""
+    try:
+        request = json.loads(body)
+    except (UnicodeDecodeError, ValueError) as e:
+        raise RequestError(HTTPStatus.BAD_REQUEST, f"invalid JSON: {e}")
+    if not isinstance(request, dict):
+        raise RequestError(HTTPStatus.BAD_REQUEST, "body must be a JSON object")
+    stops = request.get('stops')
+    if not isinstance(stops, list) or not all(isinstance(stop, dict) for stop in stops):
+        raise RequestError(HTTPStatus.BAD_REQUEST, "stops must be a list of objects")
+    if not stops:
+        raise RequestError(HTTPStatus.BAD_REQUEST, "stops is empty, there is nothing to plan")
+    if request.setdefault('mode', "exact") not in MODES:
+        raise RequestError(HTTPStatus.BAD_REQUEST, f"mode must be one of {', '.join(MODES)}")
+    if request.setdefault('split', "sequential") not in SPLITS:
+        raise RequestError(HTTPStatus.BAD_REQUEST, f"split must be one of {', '.join(SPLITS)}")
+    budget = request.setdefault('time_budget', 2.0)
+    if isinstance(budget, bool) or not isinstance(budget, (int, float)) or not budget > 0:
+        raise RequestError(HTTPStatus.BAD_REQUEST, "time_budget must be a positive number of seconds")
+    # A worker is held for the whole budget, so one request cannot hold it for hours
+    request['time_budget'] = min(float(budget), MAX_TIME_BUDGET)
+    radius = request.setdefault('aggregate', None)
+    if radius is not None and (isinstance(radius, bool) or not isinstance(radius, (int, float)) or not radius >= 0):
+        raise RequestError(HTTPStatus.BAD_REQUEST, "aggregate must be null or a distance of 0 km or more")
+    # Bad stops are turned away here, before they take a place in the queue
+    _, errors = read_records(stops, RouteEngine().depot)
+    if errors:
+        raise RequestError(HTTPStatus.BAD_REQUEST, f"{len(errors)} bad stops, nothing was planned",
+                           [{'record': nr, 'reason': powod} for _, nr, powod in errors])
+    return request
+
+
+def request_key(request):
+    """Hash of the stops and options; equal requests get the same plan"""
+    kanoniczny = json.dumps(request, sort_keys=True, separators=(',', ':'))
+    return hashlib.blake2b(kanoniczny.encode(), digest_size=16).hexdigest()
+
+
+def plan(request, tour_cache=None):
+    """
+    Plan one request, in a worker process; returns the HTTP status and the
+    JSON response body. tour_cache is the tour cache file, None for none.
+    """
+    engine = RouteEngine()
+    # Each request gets one worker process, the pool is the parallelism
+    engine.workers = 1
+    engine.tour_cache_path = tour_cache
+    engine.solver_mode = request['mode']
+    engine.split_mode = request['split']
+    engine.time_budget = float(request['time_budget'])
+    if request['aggregate'] is not None:
+        engine.aggregate_radius = float(request['aggregate'])
+    count = engine.load_records(request['stops'])
+    if engine.load_errors:
+        return HTTPStatus.BAD_REQUEST, json.dumps({
+            'error': f"{len(engine.load_errors)} bad stops, nothing was planned",
+            'errors': [{'record': nr, 'reason': powod} for _, nr, powod in engine.load_errors]
+        }).encode()
+    engine.process_all_routes()
+    wynik = {
+        'stops': count,
+        'aggregation': engine.aggregation,
+        'summary': engine.optimality_summary(),
+        'total_km': engine.total_distance(),
+        'split': engine.split_report,
+        'drivers': engine.calculate_driver_stats(),
+        'routes': list(engine.route_records()),
+        'run': engine.last_run.to_dict()
+    }
+    return HTTPStatus.OK, json.dumps(wynik).encode()
+
+
+class PlanningService:
+    def __init__(self, workers=None, queue_size=64, tour_cache=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.tour_cache = tour_cache
+        self.queue = None
+        self.pool = None
+        self.server = None
+        self._consumers = []
+        # Futures of the queued or running plans, by request_key
+        self.in_flight = {}
+        # Plans queued or running; at most workers + queue_size
+        self.admitted = 0
+        self.running = 0
+        self.counters = {'planned': 0, 'coalesced': 0, 'rejected': 0, 'failed': 0}
+
+    async def start(self, port, host=HOST):
+        # Spawned, not forked: a forked worker would inherit the sockets of
+        # open connections and keep them from closing
+        self.pool = ProcessPoolExecutor(max_workers=self.workers,
+                                        mp_context=multiprocessing.get_context("spawn"))
+        self.queue = asyncio.Queue()
+        self._consumers = [asyncio.create_task(self._consume()) for _ in range(self.workers)]
+        self.server = await asyncio.start_server(self._handle, host, port)
+        return self.server
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for consumer in self._consumers:
+            consumer.cancel()
+        await asyncio.gather(*self._consumers, return_exceptions=True)
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def health(self):
+        return {
+            'status': "ok",
+            'workers': self.workers,
+            'queued': self.queue.qsize(),
+            'queue_size': self.queue_size,
+            'running': self.running,
+            **self.counters
+        }
+
+    async def submit(self, request):
+        """(status, body) of a plan request, shared with an equal one in flight"""
+        key = request_key(request)
+        future = self.in_flight.get(key)
+        if future is None:
+            # Counted on admission, before a consumer takes the request off
+            # the queue, so a burst gets a slot on every idle worker too
+            if self.admitted >= self.workers + self.queue_size:
+                self.counters['rejected'] += 1
+                raise RequestError(HTTPStatus.SERVICE_UNAVAILABLE, "planning queue is full, retry later")
+            future = asyncio.get_running_loop().create_future()
+            self.admitted += 1
+            self.queue.put_nowait((key, request, future))
+            self.in_flight[key] = future
+        else:
+            self.counters['coalesced'] += 1
+        # A client that disconnects must not cancel the plan others wait for
+        return await asyncio.shield(future)
+
+    async def _consume(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            key, request, future = await self.queue.get()
+            self.running += 1
+            try:
+                wynik = await loop.run_in_executor(self.pool, plan, request, self.tour_cache)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:
+                self.counters['failed'] += 1
+                future.set_exception(e)
+                # Marked as retrieved: every waiting request answers with it
+                future.exception()
+            else:
+                self.counters['planned'] += 1
+                future.set_result(wynik)
+            finally:
+                self.running -= 1
+                self.admitted -= 1
+                self.in_flight.pop(key, None)
+                self.queue.task_done()
+
+    async def _handle(self, reader, writer):
+        try:
+            try:
+                status, body = await self._respond(reader)
+            except RequestError as e:
+                blad = {'error': str(e)}
+                if e.errors is not None:
+                    blad['errors'] = e.errors
+                status, body = e.status, json.dumps(blad).encode()
+            except (asyncio.IncompleteReadError, ConnectionError):
+                return
+            except Exception as e:
+                status, body = HTTPStatus.INTERNAL_SERVER_ERROR, json.dumps({'error': str(e)}).encode()
+            naglowki = [f"HTTP/1.1 {status.value} {status.phrase}",
+                        "Content-Type: application/json",
+                        f"Content-Length: {len(body)}",
+                        "Connection: close"]
+            if status == HTTPStatus.SERVICE_UNAVAILABLE:
+                naglowki.append("Retry-After: 1")
+            writer.write(("\r\n".join(naglowki) + "\r\n\r\n").encode() + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, reader):
+        try:
+            sciezka, body = await asyncio.wait_for(self._read_request(reader), READ_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise RequestError(HTTPStatus.REQUEST_TIMEOUT, f"request not received within {READ_TIMEOUT:g} s")
+        if sciezka == "/health":
+            return HTTPStatus.OK, json.dumps(self.health()).encode()
+        return await self.submit(parse_request(body))
+
+    async def _read_request(self, reader):
+        # (path, body) of a valid /health or /plan request, the body is None
+        # for /health
+        linia = (await reader.readline()).decode('latin-1').split()
+        if len(linia) != 3 or not linia[2].startswith("HTTP/"):
+            raise RequestError(HTTPStatus.BAD_REQUEST, "malformed request line")
+        metoda, sciezka = linia[0], linia[1].split('?', 1)[0]
+
+        naglowki = {}
+        while True:
+            wiersz = (await reader.readline()).decode('latin-1')
+            if wiersz in ("\r\n", "\n", ""):
+                break
+            if len(naglowki) >= MAX_HEADERS:
+                raise RequestError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "too many headers")
+            nazwa, _, wartosc = wiersz.partition(":")
+            naglowki[nazwa.strip().lower()] = wartosc.strip()
+
+        if sciezka == "/health":
+            if metoda != "GET":
+                raise RequestError(HTTPStatus.METHOD_NOT_ALLOWED, "use GET /health")
+            return sciezka, None
+        if sciezka != "/plan":
+            raise RequestError(HTTPStatus.NOT_FOUND, f"no such endpoint: {sciezka}")
+        if metoda != "POST":
+            raise RequestError(HTTPStatus.METHOD_NOT_ALLOWED, "use POST /plan")
+
+        try:
+            dlugosc = int(naglowki.get('content-length', ''))
+        except ValueError:
+            raise RequestError(HTTPStatus.LENGTH_REQUIRED, "Content-Length is required")
+        if not 0 <= dlugosc <= MAX_BODY:
+            raise RequestError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"body over {MAX_BODY} bytes")
+        return sciezka, await reader.readexactly(dlugosc)
+
+
+async def serve(port, workers=None, queue_size=64, tour_cache=None):
+    service = PlanningService(workers, queue_size, tour_cache)
+    server = await service.start(port)
+    print(f"Planning on http://{HOST}:{port} with {service.workers} workers, "
+          f"queue of {queue_size}", flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve route planning as HTTP/JSON on localhost")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, help="planning processes (default: CPU count)")
+    parser.add_argument("--queue", type=int, default=64,
+                        help="requests that may wait for a worker before new ones get 503")
+    parser.add_argument("--tour-cache", metavar="FILE",
+                        help="remember optimal tours across requests in FILE (default: off)")
+    args = parser.parse_args(argv)
+
+    try:
+        asyncio.run(serve(args.port, args.workers, args.queue, args.tour_cache))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
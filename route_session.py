@@ -0,0 +1,93 @@
+"""
+Binary snapshots of a planning session.
+
+A session is a directory with one .npy file per array and a session.json
+manifest holding the format version, the JSON-able state and the file of
+each array. Opening memory-maps the arrays copy-on-write, so even a 50k-stop
+plan is usable as soon as the manifest is read and later edits never reach
+the files:
+
+    engine.save_session("monday.session")
+    engine.load_session("monday.session")
+
+Every save writes its arrays under new generation-numbered names and
+replaces the manifest last, so a crash while saving leaves the previous
+snapshot intact and processes that still map the old files keep working.
+Arrays marked stable, e.g. the stops and distance matrices, are derived
+from meta['digest'] only and keep their files while it does not change.
+"""
+import datetime
+import json
+import os
+import numpy as np
+
+SESSION_FORMAT = "route-session"
+SESSION_VERSION = 1
+MANIFEST = "session.json"
+
+
+def read_manifest(directory):
+    """The manifest of the session in directory, None if there is none"""
+    try:
+        with open(os.path.join(directory, MANIFEST), encoding='utf-8') as plik:
+            manifest = json.load(plik)
+    except FileNotFoundError:
+        return None
+    if manifest.get('format') != SESSION_FORMAT:
+        raise ValueError(f"{directory} is not a route session")
+    if manifest.get('version') != SESSION_VERSION:
+        raise ValueError(f"{directory} is a version {manifest.get('version')} session, "
+                         f"only version {SESSION_VERSION} can be read")
+    return manifest
+
+
+def write_session(directory, arrays, meta, stable=()):
+    """
+    Save arrays (name -> ndarray) and the JSON-able meta as a session in
+    directory. Returns the manifest.
+    """
+    os.makedirs(directory, exist_ok=True)
+    stary = read_manifest(directory)
+    generation = stary['generation'] + 1 if stary else 0
+    wspolne = stary is not None and stary['meta'].get('digest') == meta.get('digest')
+
+    pliki = {}
+    for name, array in arrays.items():
+        if wspolne and name in stable and name in stary['arrays']:
+            pliki[name] = stary['arrays'][name]
+            continue
+        plik = f"{name}.{generation}.npy"
+        np.save(os.path.join(directory, plik), np.ascontiguousarray(array), allow_pickle=False)
+        pliki[name] = plik
+
+    manifest = {
+        'format': SESSION_FORMAT,
+        'version': SESSION_VERSION,
+        'generation': generation,
+        'saved': datetime.datetime.now().isoformat(timespec='seconds'),
+        'arrays': pliki,
+        'meta': meta
+    }
+    tymczasowy = os.path.join(directory, f"{MANIFEST}.{os.getpid()}.tmp")
+    with open(tymczasowy, "w", encoding='utf-8') as plik:
+        json.dump(manifest, plik)
+    os.replace(tymczasowy, os.path.join(directory, MANIFEST))
+
+    # Files only the previous snapshot used
+    if stary is not None:
+        for plik in set(stary['arrays'].values()) - set(pliki.values()):
+            try:
+                os.remove(os.path.join(directory, plik))
+            except OSError:
+                pass
+    return manifest
+
+
+def read_session(directory):
+    """(arrays, meta) of a session, the arrays memory-mapped copy-on-write"""
+    manifest = read_manifest(directory)
+    if manifest is None:
+        raise FileNotFoundError(f"no session in {directory}")
+    arrays = {name: np.load(os.path.join(directory, plik), mmap_mode='c', allow_pickle=False)
+              for name, plik in manifest['arrays'].items()}
+    return arrays, manifest['meta']
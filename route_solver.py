@@ -0,0 +1,495 @@
+"""
+Sequencing of a single Spodek -> stops -> Spodek sub-route.
+
+Every solver works on a square distance matrix ``dist`` where index 0 is the
+depot and indices 1..n are the stops of the sub-route. Tours are returned as
+lists of stop indices (1..n) without the depot at either end. The matrix may
+be asymmetric, e.g. road distances over one-way streets, so moves that
+reverse part of a tour price the reversed segment in its new direction.
+
+Sub-routes with latest times pass ``windows``, a tuple of (travel matrix,
+earliest, latest, service, start) by the same indices in one time unit.
+Tours are then kept as little late as they can be: moves that would make
+them later are rejected and a late tour is never reported as optimal.
+"""
+import math
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+
+def tour_length(dist, tour):
+    """Length of depot -> tour -> depot"""
+    if not tour:
+        return 0.0
+    length = dist[0][tour[0]] + dist[tour[-1]][0]
+    for i in range(len(tour) - 1):
+        length += dist[tour[i]][tour[i + 1]]
+    return length
+
+
+def lateness(windows, tour):
+    """Total time by which service on depot -> tour -> depot starts after latest times"""
+    travel, earliest, latest, service, start = windows
+    t = max(start, earliest[0])
+    late = max(t - latest[0], 0.0)
+    current = 0
+    for k in list(tour) + [0]:
+        t = max(t + service[current] + travel[current][k], earliest[k])
+        late += max(t - latest[k], 0.0)
+        current = k
+    return late
+
+
+def _no_later(windows, tour):
+    # Whether a path (depot at both ends) may replace one as late as tour
+    if windows is None:
+        return None
+    limit = [lateness(windows, tour) + 1e-9]
+
+    def allowed(path):
+        late = lateness(windows, path[1:-1])
+        if late > limit[0]:
+            return False
+        limit[0] = late + 1e-9
+        return True
+    return allowed
+
+
+def nearest_neighbour(dist):
+    """Greedy tour: always drive to the closest stop not visited yet"""
+    n = len(dist) - 1
+    unvisited = set(range(1, n + 1))
+    tour = []
+    current = 0
+    while unvisited:
+        row = dist[current]
+        current = min(unvisited, key=lambda k: row[k])
+        unvisited.remove(current)
+        tour.append(current)
+    return tour
+
+
+def _reversals(dist, path, i, start=None):
+    # (j, length change) of reversing path[i:j + 1] for every j from start,
+    # by default i + 1; the legs inside the segment are summed in both
+    # directions as j grows
+    a, b = path[i - 1], path[i]
+    inside = 0.0
+    for j in range(i + 1, len(path) - 1):
+        c, d = path[j], path[j + 1]
+        inside += dist[c][path[j - 1]] - dist[path[j - 1]][c]
+        if start is None or j >= start:
+            yield j, dist[a][c] + dist[b][d] - dist[a][b] - dist[c][d] + inside
+
+
+def two_opt(dist, tour, max_rounds=1000):
+    """
+    Reverse tour segments while that makes the tour shorter, for at most
+    max_rounds passes over the tour
+    """
+    path = [0] + list(tour) + [0]
+    improved = True
+    rounds = 0
+    while improved and rounds < max_rounds:
+        improved = False
+        rounds += 1
+        for i in range(1, len(path) - 2):
+            # After a reversal the scan goes on with the next j
+            start = i + 1
+            while start is not None:
+                nastepny = None
+                for j, delta in _reversals(dist, path, i, start):
+                    if delta < -1e-12:
+                        path[i:j + 1] = reversed(path[i:j + 1])
+                        improved = True
+                        nastepny = j + 1
+                        break
+                start = nastepny
+    return path[1:-1]
+
+
+def held_karp(dist):
+    """Exact bitmask dynamic programming, O(2^n * n^2)"""
+    n = len(dist) - 1
+    if n == 0:
+        return [], 0.0
+    full = 1 << n
+    inf = float('inf')
+    dp = [[inf] * n for _ in range(full)]
+    parent = [[-1] * n for _ in range(full)]
+    for j in range(n):
+        dp[1 << j][j] = dist[0][j + 1]
+
+    for mask in range(1, full):
+        row = dp[mask]
+        missing = [k for k in range(n) if not mask & (1 << k)]
+        for j in range(n):
+            cost = row[j]
+            if cost == inf:
+                continue
+            dj = dist[j + 1]
+            for k in missing:
+                nmask = mask | (1 << k)
+                c = cost + dj[k + 1]
+                if c < dp[nmask][k]:
+                    dp[nmask][k] = c
+                    parent[nmask][k] = j
+
+    last_mask = full - 1
+    best, last = min((dp[last_mask][j] + dist[j + 1][0], j) for j in range(n))
+
+    tour = []
+    mask = last_mask
+    while last != -1:
+        tour.append(last + 1)
+        previous = parent[mask][last]
+        mask ^= 1 << last
+        last = previous
+    tour.reverse()
+    return tour, best
+
+
+def branch_and_bound(dist, tour=None, node_limit=1000000, windows=None):
+    """
+    Depth-first branch and bound seeded with an upper bound tour.
+    Returns (tour, length, proven, nodes) where proven is False if the
+    search was cut off by node_limit before the whole tree was explored.
+    With windows only tours without late stops count; tour is None if
+    there is none.
+    """
+    n = len(dist) - 1
+    if n == 0:
+        return [], 0.0, True, 0
+    if tour is None:
+        tour = two_opt(dist, nearest_neighbour(dist))
+    best = [tour_length(dist, tour), list(tour)]
+    if windows is not None:
+        travel, earliest, latest, service, start = windows
+        if lateness(windows, tour) > 0:
+            best = [float('inf'), None]
+
+    # Every stop still has to be left once, so its cheapest outgoing edge
+    # is a valid lower bound on the rest of the tour.
+    min_out = [min(dist[v][u] for u in range(n + 1) if u != v) for v in range(n + 1)]
+    order = [sorted((u for u in range(1, n + 1) if u != v), key=lambda u: dist[v][u])
+             for v in range(n + 1)]
+    visited = [False] * (n + 1)
+    path = []
+    nodes = [0]
+
+    def search(current, cost, remaining_bound, t):
+        nodes[0] += 1
+        if len(path) == n:
+            total = cost + dist[current][0]
+            if windows is not None and t + service[current] + travel[current][0] > latest[0]:
+                return
+            if total < best[0] - 1e-12:
+                best[0] = total
+                best[1] = list(path)
+            return
+        if nodes[0] > node_limit:
+            return
+        for nxt in order[current]:
+            if visited[nxt]:
+                continue
+            c = cost + dist[current][nxt]
+            if c + remaining_bound >= best[0] - 1e-12:
+                # order[current] is sorted, later candidates are no better
+                break
+            begin = t
+            if windows is not None:
+                # A stop served late stays late whatever follows
+                begin = max(t + service[current] + travel[current][nxt], earliest[nxt])
+                if begin > latest[nxt]:
+                    continue
+            visited[nxt] = True
+            path.append(nxt)
+            search(nxt, c, remaining_bound - min_out[nxt], begin)
+            path.pop()
+            visited[nxt] = False
+
+    search(0, 0.0, sum(min_out[1:]), max(start, earliest[0]) if windows is not None else 0.0)
+    return best[1], best[0], nodes[0] <= node_limit, nodes[0]
+
+
+def _canonical(dist, tour, length, windows=None):
+    # Of two equally long directions keep the less late one, then the
+    # lexicographically smaller one, so ties are resolved the same way on
+    # every run
+    reverse = tour[::-1]
+    if tour_length(dist, reverse) > length + 1e-12:
+        return tour
+    if windows is not None:
+        late, late_reverse = lateness(windows, tour), lateness(windows, reverse)
+        if late != late_reverse:
+            return reverse if late_reverse < late else tour
+    return reverse if reverse < tour else tour
+
+
+def _repair(windows, tour, expired):
+    # Relocate single stops while that makes the tour less late, taking the
+    # move that helps most each time
+    tour = list(tour)
+    late = lateness(windows, tour)
+    while late > 0 and not expired():
+        best = None
+        for i in range(len(tour)):
+            rest = tour[:i] + tour[i + 1:]
+            for pos in range(len(tour)):
+                if pos == i:
+                    continue
+                candidate = rest[:pos] + [tour[i]] + rest[pos:]
+                nowe = lateness(windows, candidate)
+                if nowe < late - 1e-9 and (best is None or nowe < best[0]):
+                    best = (nowe, candidate)
+        if best is None:
+            break
+        late, tour = best
+    return tour
+
+
+def _least_late(dist, windows, tour, expired=lambda: False):
+    # tour made as little late as relocations get it, then shortened by
+    # moves that keep it so
+    tour = _repair(windows, tour, expired)
+    return local_descent(dist, tour, expired, windows)
+
+
+def _windowed_result(dist, windows, tour, method, evaluated):
+    # Result of an exact solver whose optimum turned out to be late: the
+    # best tour without late stops if branch and bound finds one
+    tour = _least_late(dist, windows, tour)
+    found, length, proven, nodes = branch_and_bound(dist, tour, windows=windows)
+    if found is not None:
+        found = _canonical(dist, found, length, windows)
+        return {'tour': found, 'length': length, 'method': 'branch-and-bound', 'optimal': proven,
+                'evaluated': evaluated + nodes}
+    return {'tour': tour, 'length': tour_length(dist, tour), 'method': method, 'optimal': False,
+            'evaluated': evaluated + nodes}
+
+
+def solve_exact(dist, held_karp_limit=15, exact_limit=20, node_limit=1000000, windows=None):
+    """
+    Optimal tour for small sub-routes, heuristic above exact_limit.
+    Returns a dict with tour, length, method, whether it is proven optimal
+    and how many partial tours were evaluated.
+    """
+    n = len(dist) - 1
+    if n <= held_karp_limit:
+        tour, length = held_karp(dist)
+        tour = _canonical(dist, tour, length, windows)
+        # Every (subset, last stop) state is extended by every missing stop
+        evaluated = n * (n - 1) * 2 ** max(n - 2, 0)
+        if windows is not None and lateness(windows, tour) > 0:
+            return _windowed_result(dist, windows, tour, 'held-karp', evaluated)
+        return {'tour': tour, 'length': length, 'method': 'held-karp', 'optimal': True,
+                'evaluated': evaluated}
+
+    start = two_opt(dist, nearest_neighbour(dist))
+    if n <= exact_limit:
+        if windows is not None:
+            start = _least_late(dist, windows, start)
+        tour, length, proven, nodes = branch_and_bound(dist, start, node_limit, windows)
+        if tour is None:
+            return {'tour': start, 'length': tour_length(dist, start), 'method': 'branch-and-bound',
+                    'optimal': False, 'evaluated': nodes}
+        tour = _canonical(dist, tour, length, windows)
+        return {'tour': tour, 'length': length, 'method': 'branch-and-bound', 'optimal': proven,
+                'evaluated': nodes}
+
+    if windows is not None:
+        start = _least_late(dist, windows, start)
+    return {'tour': start, 'length': tour_length(dist, start), 'method': 'heuristic', 'optimal': False,
+            'evaluated': 1}
+
+
+def _two_opt_move(dist, path, expired, allowed=None):
+    # First improving segment reversal, path includes the depot at both ends;
+    # allowed(new path) may veto a move
+    for i in range(1, len(path) - 2):
+        if expired():
+            return False
+        for j, delta in _reversals(dist, path, i):
+            if delta < -1e-12:
+                nowa = path[:i] + path[i:j + 1][::-1] + path[j + 1:]
+                if allowed is not None and not allowed(nowa):
+                    continue
+                path[:] = nowa
+                return True
+    return False
+
+
+def _or_opt_move(dist, path, seg_len, expired, allowed=None):
+    # First improving move of seg_len consecutive stops to another position,
+    # seg_len == 1 is a plain relocate
+    for i in range(1, len(path) - seg_len):
+        if expired():
+            return False
+        j = i + seg_len - 1
+        prev, first, last, nxt = path[i - 1], path[i], path[j], path[j + 1]
+        removed = dist[prev][first] + dist[last][nxt] - dist[prev][nxt]
+        # Extra length of driving the segment backwards
+        flipped = sum(dist[path[k + 1]][path[k]] - dist[path[k]][path[k + 1]] for k in range(i, j))
+        for k in range(len(path) - 1):
+            if i - 1 <= k <= j:
+                continue
+            a, b = path[k], path[k + 1]
+            forward = dist[a][first] + dist[last][b]
+            backward = dist[a][last] + dist[first][b] + flipped
+            added = min(forward, backward) - dist[a][b]
+            if added < removed - 1e-12:
+                segment = path[i:j + 1]
+                if backward < forward:
+                    segment.reverse()
+                rest = path[:i] + path[j + 1:]
+                pos = k + 1 if k < i else k + 1 - seg_len
+                nowa = rest[:pos] + segment + rest[pos:]
+                if allowed is not None and not allowed(nowa):
+                    continue
+                path[:] = nowa
+                return True
+    return False
+
+
+def local_descent(dist, tour, expired, windows=None):
+    """
+    Apply 2-opt, relocate and Or-opt moves until none improves the tour
+    or expired() turns true. With windows no move makes the tour later.
+    """
+    path = [0] + list(tour) + [0]
+    allowed = _no_later(windows, tour)
+    improved = True
+    while improved and not expired():
+        improved = (_two_opt_move(dist, path, expired, allowed)
+                    or _or_opt_move(dist, path, 1, expired, allowed)
+                    or _or_opt_move(dist, path, 2, expired, allowed)
+                    or _or_opt_move(dist, path, 3, expired, allowed))
+    return path[1:-1]
+
+
+def solve_local(dist, time_budget=2.0, seed=0, should_stop=None, windows=None):
+    """
+    Anytime optimizer: nearest-neighbour start, local descent, then simulated
+    annealing on 2-opt and relocate moves until time_budget seconds pass,
+    should_stop() turns true or the search stalls. Returns a dict with the
+    best tour found and its improvement history as (elapsed seconds, length)
+    pairs. With windows the least late tour found wins and annealing moves
+    that make the tour later are rejected.
+    """
+    started = time.perf_counter()
+    deadline = started + time_budget
+    n = len(dist) - 1
+
+    def expired():
+        return time.perf_counter() > deadline or (should_stop is not None and should_stop())
+
+    tour = nearest_neighbour(dist)
+    best_len = tour_length(dist, tour)
+    history = [(0.0, best_len)]
+
+    if windows is not None:
+        tour = _repair(windows, tour, expired)
+    tour = local_descent(dist, tour, expired, windows)
+    length = tour_length(dist, tour)
+    if length < best_len - 1e-12:
+        history.append((time.perf_counter() - started, length))
+    # A repaired tour may be longer than the nearest-neighbour one
+    best, best_len = list(tour), length
+    late = best_late = lateness(windows, tour) if windows is not None else 0.0
+
+    iteration = 0
+    if n > 3 and length > 0:
+        rng = random.Random(seed)
+        symmetric = all(dist[u][v] == dist[v][u] for u in range(n + 1) for v in range(u))
+        path = [0] + tour + [0]
+        t0 = 0.1 * length / (n + 1)
+        stall_limit = 5000 * n
+        iteration = last_improvement = 0
+        while iteration - last_improvement < stall_limit:
+            iteration += 1
+            if expired():
+                break
+            now = time.perf_counter()
+            temperature = t0 * 0.001 ** ((now - started) / time_budget)
+
+            i = rng.randint(1, n)
+            j = rng.randint(1, n)
+            if i == j:
+                continue
+            if i > j:
+                i, j = j, i
+            if rng.random() < 0.5:
+                a, b, c, d = path[i - 1], path[i], path[j], path[j + 1]
+                delta = dist[a][c] + dist[b][d] - dist[a][b] - dist[c][d]
+                if not symmetric:
+                    delta += sum(dist[path[k + 1]][path[k]] - dist[path[k]][path[k + 1]]
+                                 for k in range(i, j))
+                if delta < 0 or rng.random() < math.exp(-delta / temperature):
+                    nowa = path[:i] + path[i:j + 1][::-1] + path[j + 1:]
+                else:
+                    continue
+            else:
+                # Move the stop at position i to just after position j
+                prev, stop, nxt = path[i - 1], path[i], path[i + 1]
+                a, b = path[j], path[j + 1]
+                delta = (dist[prev][nxt] - dist[prev][stop] - dist[stop][nxt]
+                         + dist[a][stop] + dist[stop][b] - dist[a][b])
+                if delta < 0 or rng.random() < math.exp(-delta / temperature):
+                    nowa = path[:i] + path[i + 1:j + 1] + [stop] + path[j + 1:]
+                else:
+                    continue
+            if windows is not None:
+                nowe = lateness(windows, nowa[1:-1])
+                if nowe > late + 1e-9:
+                    continue
+                late = nowe
+            path[:] = nowa
+            length += delta
+
+            if late < best_late - 1e-9 or (late <= best_late + 1e-9 and length < best_len - 1e-9):
+                # Polish the new best before recording it
+                candidate = local_descent(dist, path[1:-1], expired, windows)
+                path[:] = [0] + candidate + [0]
+                length = tour_length(dist, candidate)
+                if windows is not None:
+                    late = lateness(windows, candidate)
+                best, best_len, best_late = list(candidate), length, late
+                last_improvement = iteration
+                history.append((time.perf_counter() - started, best_len))
+
+    best_len = tour_length(dist, best)
+    return {'tour': best, 'length': best_len, 'method': 'local-search',
+            'optimal': False, 'history': history, 'evaluated': iteration + 1}
+
+
+def solve(dist, mode="exact", time_budget=2.0, held_karp_limit=15, exact_limit=20,
+          should_stop=None, windows=None):
+    """Sequence one sub-route with the exact or the local optimizer"""
+    if mode == "local":
+        return solve_local(dist, time_budget, should_stop=should_stop, windows=windows)
+    return solve_exact(dist, held_karp_limit, exact_limit, windows=windows)
+
+
+def solve_parallel(dists, workers, budgets, should_stop=None, windows=None, **options):
+    """
+    Sequence independent sub-routes in a process pool, yielding
+    (position in dists, result) pairs as they finish. windows holds the
+    windows of each sub-route or None. Once should_stop() turns true no more
+    results are waited for and queued sub-routes are dropped.
+    """
+    if windows is None:
+        windows = [None] * len(dists)
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = {pool.submit(solve, dist, time_budget=budget, windows=okna, **options): nr
+                   for nr, (dist, budget, okna) in enumerate(zip(dists, budgets, windows))}
+        pending = set(futures)
+        while pending:
+            if should_stop is not None and should_stop():
+                break
+            finished, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+            for future in finished:
+                yield futures[future], future.result()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,242 @@
+"""
+Columnar stop table and streaming order-file loader.
+
+Row 0 of a StopTable is always the Spodek depot and rows 1..n are the loaded
+stops, so one stop index is valid for the table, the distance matrix and the
+spatial index alike. Routes are ROUTE_DTYPE arrays of such indices with
+DEPOT at both ends.
+"""
+import csv
+import gzip
+import math
+import numpy as np
+
+DEPOT = 0
+ROUTE_DTYPE = np.int32
+COLUMNS = ("longitude", "latitude", "weight", "city", "hour")
+# Optional time window columns: earliest and latest "H:MM" start of service
+# and the service time in minutes
+WINDOW_COLUMNS = ("earliest", "latest", "service")
+# Array attributes of a StopTable, one per row
+TABLE_COLUMNS = ("lon", "lat", "weight", "city", "hour", "minutes", "earliest", "latest", "service")
+
+
+def parse_hour(text):
+    """Minutes after midnight of an "H:MM" hour, -1 if it is not one"""
+    try:
+        godziny, minuty = text.strip().split(":")
+        godziny, minuty = int(godziny), int(minuty)
+    except ValueError:
+        return -1
+    if 0 <= godziny < 24 and 0 <= minuty < 60:
+        return godziny * 60 + minuty
+    return -1
+
+
+class StopTable:
+    """
+    Stops as parallel arrays: float64 longitude/latitude/weight, int32 codes
+    into the interned city and hour strings, and the hour parsed to minutes.
+    Time windows are float minutes after midnight, earliest -inf and latest
+    inf when open; without an earliest time a stop may not be served before
+    its hour.
+    """
+
+    def __init__(self, depot):
+        self.names = []
+        self.hours = []
+        self._name_codes = {}
+        self._hour_codes = {}
+        self.lon = np.array([depot[0]], dtype=float)
+        self.lat = np.array([depot[1]], dtype=float)
+        self.weight = np.array([depot[2]], dtype=float)
+        self.city = np.array([self.intern_name(depot[3])], dtype=np.int32)
+        hour = depot[4] if len(depot) > 4 else ""
+        self.hour = np.array([self.intern_hour(hour)], dtype=np.int32)
+        self.minutes = np.array([parse_hour(hour)], dtype=np.int32)
+        self.earliest = np.array([-np.inf])
+        self.latest = np.array([np.inf])
+        self.service = np.zeros(1)
+
+    @classmethod
+    def from_columns(cls, names, hours, columns):
+        """Table of the interned strings and the TABLE_COLUMNS arrays of another"""
+        table = cls.__new__(cls)
+        table.names, table.hours = list(names), list(hours)
+        table._name_codes = {name: i for i, name in enumerate(table.names)}
+        table._hour_codes = {hour: i for i, hour in enumerate(table.hours)}
+        for column in TABLE_COLUMNS:
+            setattr(table, column, columns[column])
+        return table
+
+    def columns(self):
+        return {column: getattr(self, column) for column in TABLE_COLUMNS}
+
+    def __len__(self):
+        return len(self.lon)
+
+    def intern_name(self, name):
+        code = self._name_codes.get(name)
+        if code is None:
+            code = self._name_codes[name] = len(self.names)
+            self.names.append(name)
+        return code
+
+    def intern_hour(self, hour):
+        code = self._hour_codes.get(hour)
+        if code is None:
+            code = self._hour_codes[hour] = len(self.hours)
+            self.hours.append(hour)
+        return code
+
+    def extend(self, chunks):
+        """
+        Append chunks of (lon, lat, weight, city codes, hour codes, earliest,
+        latest, service) arrays; a NaN earliest is taken from the hour.
+        """
+        if not chunks:
+            return
+        lon, lat, weight, city, hour, earliest, latest, service = zip(*chunks)
+        self.lon = np.concatenate((self.lon,) + lon)
+        self.lat = np.concatenate((self.lat,) + lat)
+        self.weight = np.concatenate((self.weight,) + weight)
+        self.city = np.concatenate((self.city,) + city)
+        self.hour = np.concatenate((self.hour,) + hour)
+        parsed = np.array([parse_hour(h) for h in self.hours], dtype=np.int32)
+        self.minutes = parsed[self.hour]
+        earliest = np.concatenate((self.earliest,) + earliest)
+        godzina = np.where(self.minutes >= 0, self.minutes, -np.inf)
+        self.earliest = np.where(np.isnan(earliest), godzina, earliest)
+        self.latest = np.concatenate((self.latest,) + latest)
+        self.service = np.concatenate((self.service,) + service)
+
+    def append_table(self, other):
+        """Append the stops of another table, without its depot; returns their indices"""
+        start = len(self)
+        names = np.array([self.intern_name(n) for n in other.names], dtype=np.int32)
+        hours = np.array([self.intern_hour(h) for h in other.hours], dtype=np.int32)
+        self.extend([(other.lon[1:], other.lat[1:], other.weight[1:],
+                      names[other.city[1:]], hours[other.hour[1:]],
+                      other.earliest[1:], other.latest[1:], other.service[1:])])
+        return np.arange(start, len(self), dtype=ROUTE_DTYPE)
+
+    def name(self, i):
+        return self.names[self.city[i]]
+
+    def hour_text(self, i):
+        return self.hours[self.hour[i]]
+
+    def row(self, i):
+        """Stop i as a (longitude, latitude, weight, city, hour) tuple"""
+        return (float(self.lon[i]), float(self.lat[i]), float(self.weight[i]),
+                self.name(i), self.hour_text(i))
+
+
+def _open(path):
+    with open(path, 'rb') as file:
+        magic = file.read(2)
+    if magic == b'\x1f\x8b':
+        return gzip.open(path, 'rt', newline='')
+    return open(path, 'r', newline='')
+
+
+def read_stops(paths, depot, chunk_size=50000):
+    """
+    Stream one or more order files, plain or gzip'd CSV, into a StopTable.
+    Rows that cannot be parsed are skipped; returns the table and a list of
+    (file, line, reason) for every skipped row.
+    """
+    table = StopTable(depot)
+    errors = []
+    chunks = []
+
+    for path in paths:
+        with _open(path) as file:
+            reader = csv.reader(file)
+            header = next(reader, None)
+            if header is None:
+                continue
+            header = [kolumna.strip().lstrip('\ufeff') for kolumna in header]
+            wiersze = ((reader.line_num, row) for row in reader)
+            _read_rows(table, path, header, wiersze, errors, chunks, chunk_size)
+
+    table.extend(chunks)
+    return table, errors
+
+
+def read_records(records, depot, source="<records>", chunk_size=50000):
+    """
+    StopTable from dicts with the same keys as the CSV columns, e.g. parsed
+    JSON; errors are (source, record number, reason) as in read_stops.
+    """
+    records = list(records)
+    header = list(dict.fromkeys(kolumna for record in records for kolumna in record))
+    wiersze = ((nr, ['' if record.get(kolumna) is None else str(record[kolumna]) for kolumna in header])
+               for nr, record in enumerate(records, 1))
+    table = StopTable(depot)
+    errors = []
+    chunks = []
+    _read_rows(table, source, header, wiersze, errors, chunks, chunk_size)
+    table.extend(chunks)
+    return table, errors
+
+
+def _read_rows(table, source, header, wiersze, errors, chunks, chunk_size):
+    # Parse (line, row) pairs of one source into column chunks of table
+    missing = [kolumna for kolumna in COLUMNS if kolumna not in header]
+    if missing:
+        errors.append((source, 1, f"missing columns: {', '.join(missing)}"))
+        return
+    ix, iy, iw, ic, ih = (header.index(kolumna) for kolumna in COLUMNS)
+    ie, il, isv = (header.index(kolumna) if kolumna in header else None
+                   for kolumna in WINDOW_COLUMNS)
+
+    lon, lat, weight, city, hour, earliest, latest, service = [], [], [], [], [], [], [], []
+    for line, row in wiersze:
+        if not row:
+            continue
+        try:
+            x, y, w = float(row[ix]), float(row[iy]), float(row[iw])
+            c, h = row[ic], row[ih]
+            od = _window(row, ie, math.nan)
+            do = _window(row, il, math.inf)
+            obsluga = float(row[isv]) if isv is not None and row[isv].strip() else 0.0
+        except IndexError:
+            errors.append((source, line, "missing fields"))
+            continue
+        except ValueError as e:
+            errors.append((source, line, str(e)))
+            continue
+        if not (math.isfinite(x) and math.isfinite(y) and math.isfinite(w) and math.isfinite(obsluga)):
+            errors.append((source, line, "non-finite number"))
+            continue
+        lon.append(x)
+        lat.append(y)
+        weight.append(w)
+        city.append(table.intern_name(c))
+        hour.append(table.intern_hour(h))
+        earliest.append(od)
+        latest.append(do)
+        service.append(obsluga)
+        if len(lon) >= chunk_size:
+            chunks.append(_chunk(lon, lat, weight, city, hour, earliest, latest, service))
+            lon, lat, weight, city, hour, earliest, latest, service = [], [], [], [], [], [], [], []
+    if lon:
+        chunks.append(_chunk(lon, lat, weight, city, hour, earliest, latest, service))
+
+
+def _window(row, column, default):
+    # Minutes of an optional "H:MM" time window cell, default when empty
+    if column is None or not row[column].strip():
+        return default
+    minuty = parse_hour(row[column])
+    if minuty < 0:
+        raise ValueError(f"bad time: {row[column]!r}")
+    return float(minuty)
+
+
+def _chunk(lon, lat, weight, city, hour, earliest, latest, service):
+    return (np.array(lon, dtype=float), np.array(lat, dtype=float),
+            np.array(weight, dtype=float), np.array(city, dtype=np.int32),
+            np.array(hour, dtype=np.int32), np.array(earliest, dtype=float),
+            np.array(latest, dtype=float), np.array(service, dtype=float))
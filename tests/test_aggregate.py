@@ -0,0 +1,66 @@
+import math
+import numpy as np
+from route_aggregate import aggregate_orders, order_groups
+from route_engine import RouteEngine
+from route_store import DEPOT, read_records
+
+SPODEK = (19.027401, 50.266247, 0, "Spodek")
+
+
+def orders(rows):
+    # (longitude, latitude, weight, city, earliest, latest) of each order
+    table, errors = read_records([
+        {'longitude': x, 'latitude': y, 'weight': w, 'city': c, 'hour': "6:00", 'earliest': od, 'latest': do}
+        for x, y, w, c, od, do in rows], SPODEK)
+    assert not errors
+    return table
+
+
+def test_orders_at_one_address_share_a_stop():
+    table = orders([
+        (19.10, 50.30, 100, "Bytom 1", "", "9:00"),
+        (19.20, 50.40, 50, "Tychy", "", ""),
+        (19.10, 50.30, 200, "Bytom 2", "7:00", ""),
+        (19.1001, 50.3001, 30, "Bytom 3", "", "8:00"),
+        # Same building, but its window ends before the others' begins
+        (19.10, 50.30, 10, "Bytom 4", "", "6:30"),
+        # Would make either stop heavier than the largest vehicle
+        (19.10, 50.30, 9995, "Bytom 5", "", ""),
+    ])
+    stops, stop_of = aggregate_orders(table, radius=0.05, max_weight=10000)
+    assert stop_of.tolist() == [DEPOT, 1, 2, 1, 1, 3, 4]
+    assert len(stops) == 5
+    assert stops.weight[1:].tolist() == [330.0, 50.0, 10.0, 9995.0]
+    assert stops.name(1) == "Bytom 1 (3 orders)" and stops.name(2) == "Tychy"
+    # The tightest window of the merged orders
+    assert (stops.earliest[1], stops.latest[1]) == (420.0, 480.0)
+    assert (stops.lon[1], stops.lat[1]) == (19.10, 50.30)
+
+    starts, members = order_groups(stop_of, len(stops))
+    assert [members[starts[k]:starts[k + 1]].tolist() for k in range(1, len(stops))] == [[1, 3, 4], [2], [5], [6]]
+
+
+def test_routes_list_every_merged_order():
+    engine = RouteEngine()
+    engine.tour_cache_path = None
+    engine.workers = 1
+    engine.aggregate_radius = 0.0
+    rows = [
+        {'longitude': 19.10, 'latitude': 50.30, 'weight': 40, 'city': "Bytom 1", 'hour': "6:00"},
+        {'longitude': 18.95, 'latitude': 50.35, 'weight': 30, 'city': "Piekary", 'hour': "6:00"},
+        {'longitude': 19.10, 'latitude': 50.30, 'weight': 20, 'city': "Bytom 2", 'hour': "6:00"},
+        {'longitude': 19.00, 'latitude': 50.15, 'weight': 10, 'city': "Tychy", 'hour': "6:00"},
+    ]
+    assert engine.load_records(rows) == 4
+    assert engine.aggregation == {'radius': 0.0, 'orders': 4, 'stops': 3}
+    engine.process_all_routes()
+
+    dostawy = [(name, i, engine.orders.name(order)) for name in "ABC"
+               for i in range(len(engine.category_routes(name)))
+               for _, order, _ in engine.route_orders(name, i)]
+    assert sorted(nazwa for _, _, nazwa in dostawy) == ["Bytom 1", "Bytom 2", "Piekary", "Tychy"]
+    # Both Bytom orders are delivered together, on one route at one time
+    bytom = {(name, i) for name, i, nazwa in dostawy if nazwa.startswith("Bytom")}
+    assert len(bytom) == 1
+    assert math.isclose(sum(s['weight'] for s in engine.calculate_driver_stats()), 100.0)
+    assert np.isclose(engine.orders.weight[1:].sum(), engine.stops.weight[1:].sum())
@@ -0,0 +1,34 @@
+import os
+import shutil
+from route_batch import day_name, day_names, order_files, plan_batch, summary_text
+
+CITIES = os.path.join(os.path.dirname(__file__), "..", "cities_data.csv")
+
+
+def test_day_is_the_date_in_the_file_name():
+    assert day_name("orders/zamowienia_2024-05-01.csv.gz") == "2024-05-01"
+    assert day_name("orders/poniedzialek.CSV") == "poniedzialek"
+
+
+def test_days_with_the_same_date_get_their_own_names():
+    nazwy = day_names(["a/2024-05-01.csv", "b/rano_2024-05-01.csv.gz", "a/2024-05-02.csv",
+                       "c/2024-05-01.csv", "wtorek.csv"])
+    assert nazwy == ["2024-05-01", "rano_2024-05-01", "2024-05-02", "2024-05-01_2", "wtorek"]
+    assert len(set(nazwy)) == len(nazwy)
+
+
+def test_batch_writes_a_report_per_day(tmp_path):
+    wejscie = tmp_path / "orders"
+    for podkatalog in ("rano", "wieczor"):
+        (wejscie / podkatalog).mkdir(parents=True)
+        shutil.copy(CITIES, wejscie / podkatalog / "2024-05-01.csv")
+    (wejscie / "rano" / "notes.txt").write_text("not orders", encoding='utf-8')
+    pliki = order_files([str(wejscie / "*" / "*.csv")])
+    assert len(pliki) == 2
+
+    days = plan_batch(pliki, str(tmp_path / "out"), workers=1)
+    assert [d['day'] for d in days] == ["2024-05-01", "2024-05-01_2"]
+    assert all('error' not in d and d['total_km'] == 597.28 for d in days)
+    assert sorted(os.listdir(tmp_path / "out")) == ["Trasa_2024-05-01.txt", "Trasa_2024-05-01_2.txt"]
+    tekst = summary_text(days)
+    assert "2024-05-01_2" in tekst and "1194.56" in tekst
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+from route_distance import DistanceMatrix, distance_matrix, leg_distances, pair_distances
+
+
+def random_points(seed, n):
+    # Stops within about a degree of Spodek
+    rng = np.random.default_rng(seed)
+    return 19.03 + rng.uniform(-1, 1, n), 50.27 + rng.uniform(-1, 1, n)
+
+
+def test_blocks_and_legs_come_from_the_matrices():
+    lon, lat = random_points(0, 30)
+    pelne = DistanceMatrix(lon, lat)
+    na_zadanie = DistanceMatrix(lon, lat, full_limit=10)
+    assert sorted(pelne.matrices) == ["euclidean", "haversine"] and not na_zadanie.matrices
+    idx = [0, 7, 3, 29, 12]
+    for metric in ("haversine", "euclidean"):
+        oczekiwane = distance_matrix(lon[idx], lat[idx], metric)
+        assert np.allclose(pelne.block(idx, metric), oczekiwane)
+        assert np.allclose(na_zadanie.block(idx, metric), oczekiwane)
+        assert np.allclose(pelne.legs(idx, metric), leg_distances(lon[idx], lat[idx], metric))
+
+
+def test_extend_grows_or_drops_the_matrices():
+    lon, lat = random_points(1, 12)
+    distances = DistanceMatrix(lon[:8], lat[:8], full_limit=10)
+    distances.matrices["road"] = np.ones((8, 8))
+    distances.extend(lon[8:10], lat[8:10])
+    assert sorted(distances.matrices) == ["euclidean", "haversine"] and distances.stale == {"road"}
+    for metric in ("haversine", "euclidean"):
+        assert np.allclose(distances.matrices[metric], distance_matrix(lon[:10], lat[:10], metric))
+
+    # Past the limit nothing is kept, road matrices included
+    distances.matrices["road"] = distances.matrices["road_time"] = np.ones((10, 10))
+    distances.extend(lon[10:], lat[10:])
+    assert not distances.matrices and distances.stale == {"road", "road_time"}
+    assert len(distances) == 12
+    assert np.allclose(distances.block([0, 11, 5]), distance_matrix(lon[[0, 11, 5]], lat[[0, 11, 5]]))
+
+
+def test_road_distances_need_the_graph():
+    lon, lat = random_points(2, 2)
+    with pytest.raises(ValueError):
+        pair_distances(lon[0], lat[0], lon[1], lat[1], "road")
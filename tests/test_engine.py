@@ -0,0 +1,107 @@
+import csv
+import os
+from route_engine import RouteEngine, main
+
+CITIES = os.path.join(os.path.dirname(__file__), "..", "cities_data.csv")
+
+# The plan of cities_data.csv before the distance matrices, the columnar
+# stops and the new solvers: stops, arrival times and km of every driver
+BASELINE = {
+    ('A', 1): (["Bedzin", "Myszkow", "Ruda Slaska"], ["06:10", "06:48", "07:42"], 96.72),
+    ('B', 1): (["Dabrowa Gornicza", "Zawiercie", "Jaworzno", "Tychy"],
+               ["06:19", "06:44", "07:24", "07:51"], 109.54),
+    ('B', 2): (["Katowice", "Chorzow", "Piekary Slaskie", "Siemianowice Slaskie"],
+               ["06:02", "06:10", "06:20", "06:32"], 31.22),
+    ('B', 3): (["Zabrze", "Knurow", "Gliwice", "Tarnowskie Gory"],
+               ["06:21", "06:39", "06:52", "07:15"], 92.46),
+    ('B', 4): (["Czestochowa", "Pszczyna"], ["07:12", "09:04"], 186.59),
+    ('C', 1): (["Sosnowiec", "Bytom"], ["06:09", "06:58"], 80.75),
+}
+
+
+def planner():
+    # An engine that leaves the home directory alone
+    engine = RouteEngine()
+    engine.tour_cache_path = None
+    engine.workers = 1
+    return engine
+
+
+def test_cli_plans_cities_data_like_the_baseline(tmp_path, monkeypatch):
+    # The tour cache and run log default to the home directory
+    monkeypatch.setenv("HOME", str(tmp_path))
+    eksport = tmp_path / "routes.csv"
+    assert main([CITIES, "-o", str(tmp_path / "Trasa.txt"), "--export", str(eksport)]) == 0
+
+    trasy = {}
+    with open(eksport, newline='', encoding='utf-8') as plik:
+        for wiersz in csv.DictReader(plik):
+            miasta, godziny, km = trasy.setdefault((wiersz['category'], int(wiersz['driver'])),
+                                                   ([], [], float(wiersz['route_distance'])))
+            miasta.append(wiersz['city'])
+            godziny.append(wiersz['arrival'])
+    assert trasy == BASELINE
+    assert round(sum(km for _, _, km in trasy.values()), 2) == 597.28
+    assert (tmp_path / "Trasa.txt").exists()
+
+
+def test_loading_orders_drops_the_previous_plan(tmp_path):
+    engine = planner()
+    engine.load_csv([CITIES])
+    engine.process_all_routes()
+    assert len(engine.kategoriaB) == 4 and engine.route_reports['B']
+
+    mniej = tmp_path / "mniej.csv"
+    with open(CITIES, encoding='utf-8') as plik:
+        mniej.write_text("".join(plik.readlines()[:6]), encoding='utf-8')
+    assert engine.load_csv([mniej]) == 5
+    assert (engine.kategoriaA, engine.kategoriaB, engine.kategoriaC) == ([], [], [])
+    assert engine.route_reports == {'A': [], 'B': [], 'C': []}
+    assert engine.calculate_driver_stats() == []
+    engine.process_all_routes()
+    assert sorted(int(i) for trasa in engine.kategoriaA + engine.kategoriaB + engine.kategoriaC
+                  for i in trasa if i) == [1, 2, 3, 4, 5]
+
+
+def test_swapping_stops_updates_the_cached_stats():
+    engine = planner()
+    engine.load_csv([CITIES])
+    engine.process_all_routes()
+    engine.calculate_driver_stats()
+    przed = engine.route_arrivals('B', 0)
+
+    engine.swap_stops('B', 0, 1, 3)
+    engine.swap_stops('B', 0, 2, 4)
+    zmienione = {(s['category'], s['driver']): s for s in engine.calculate_driver_stats()}
+    assert engine.route_arrivals('B', 0) != przed
+    engine.invalidate_stats()
+    od_nowa = {(s['category'], s['driver']): s for s in engine.calculate_driver_stats()}
+    assert zmienione == od_nowa
+    assert zmienione[('B', 1)]['distance'] != BASELINE[('B', 1)][2]
+
+
+def test_late_orders_join_routes_without_a_replan(tmp_path):
+    engine = planner()
+    engine.load_csv([CITIES])
+    engine.process_all_routes()
+    przed = {(s['category'], s['driver'] - 1): s['distance'] for s in engine.calculate_driver_stats()}
+    spoznione = tmp_path / "late.csv"
+    spoznione.write_text("longitude,latitude,weight,city,hour\n"
+                         "19.05,50.3,50,LateA,6:00\n"
+                         "19.5,50.9,400,LateB,6:00\n"
+                         "19.0,50.27,9000,Huge,6:00\n", encoding='utf-8')
+
+    delty = engine.insert_csv(spoznione)
+    po = {(s['category'], s['driver'] - 1): s for s in engine.calculate_driver_stats()}
+    for key, delta in delty.items():
+        # Both distances are rounded to 2 decimals
+        assert abs(po[key]['distance'] - przed.get(key, 0.0) - delta) <= 0.011
+    for (name, i), stat in po.items():
+        assert stat['weight'] <= engine.capacities[name]
+    nowe = [engine.stops.name(int(p)) for name in "ABC" for trasa in engine.category_routes(name)
+            for p in trasa if engine.stops.name(int(p)) in ("LateA", "LateB", "Huge")]
+    assert sorted(nowe) == ["Huge", "LateA", "LateB"]
+    # Nothing else moved, and the cached lengths match a full recompute
+    engine.invalidate_stats()
+    assert {key: s['distance'] for key, s in po.items()} == \
+        {(s['category'], s['driver'] - 1): s['distance'] for s in engine.calculate_driver_stats()}
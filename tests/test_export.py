@@ -0,0 +1,57 @@
+import csv
+import json
+import os
+from route_engine import RouteEngine
+from route_export import format_for
+
+CITIES = os.path.join(os.path.dirname(__file__), "..", "cities_data.csv")
+
+
+def planned():
+    engine = RouteEngine()
+    engine.tour_cache_path = None
+    engine.workers = 1
+    engine.load_csv([CITIES])
+    engine.process_all_routes()
+    return engine
+
+
+def test_format_follows_the_extension():
+    assert [format_for(f"Trasa{e}") for e in (".txt", ".CSV", ".json", ".geojson", ".dat")] == \
+        ["text", "csv", "json", "geojson", "text"]
+
+
+def test_every_format_holds_the_same_routes(tmp_path):
+    engine = planned()
+    kierowcy = [(s['category'], s['driver'], s['distance']) for s in engine.calculate_driver_stats()]
+    przystanki = len(engine.stops) - 1
+    for rozszerzenie in (".txt", ".csv", ".json", ".geojson"):
+        engine.export_routes(str(tmp_path / f"Trasa{rozszerzenie}"))
+
+    tekst = (tmp_path / "Trasa.txt").read_text(encoding='utf-8')
+    assert tekst.startswith("=== Route Management System Report ===")
+    assert tekst.count("\nDriver #") == len(kierowcy)
+    assert tekst.count("Google Maps Link:") == len(kierowcy)
+
+    with open(tmp_path / "Trasa.csv", newline='', encoding='utf-8') as plik:
+        wiersze = list(csv.DictReader(plik))
+    assert len(wiersze) == przystanki
+    assert sorted({(w['category'], int(w['driver']), float(w['route_distance'])) for w in wiersze}) == sorted(kierowcy)
+
+    with open(tmp_path / "Trasa.json", encoding='utf-8') as plik:
+        trasy = json.load(plik)['routes']
+    assert [(t['category'], t['driver'], t['distance']) for t in trasy] == kierowcy
+    assert sum(len(t['stops']) for t in trasy) == przystanki
+    assert [s['city'] for s in trasy[0]['stops']] == [w['city'] for w in wiersze[:len(trasy[0]['stops'])]]
+
+    with open(tmp_path / "Trasa.geojson", encoding='utf-8') as plik:
+        cechy = json.load(plik)['features']
+    linie = [c for c in cechy if c['geometry']['type'] == "LineString"]
+    punkty = [c for c in cechy if c['geometry']['type'] == "Point"]
+    assert [(c['properties']['category'], c['properties']['driver'], c['properties']['distance_km'])
+            for c in linie] == kierowcy
+    assert len(punkty) == przystanki
+    # Routes start and end at the depot
+    for linia in linie:
+        assert linia['geometry']['coordinates'][0] == linia['geometry']['coordinates'][-1] == \
+            [engine.depot[0], engine.depot[1]]
@@ -0,0 +1,74 @@
+import json
+import os
+import numpy as np
+from route_memo import TourCache
+
+SPODEK = (19.027401, 50.266247)
+
+
+def sub_route(seed, n):
+    # Depot first, then n stops around Katowice
+    rng = np.random.default_rng(seed)
+    return (np.concatenate(([SPODEK[0]], 19.0 + rng.random(n))),
+            np.concatenate(([SPODEK[1]], 50.2 + rng.random(n) / 2)))
+
+
+def test_cached_tour_follows_the_stops_in_any_order(tmp_path):
+    path = tmp_path / "tours.json"
+    lon, lat = sub_route(0, 5)
+    cache = TourCache(path, "euclidean")
+    assert cache.get(lon, lat) is None
+    cache.put(lon, lat, [3, 1, 5, 2, 4])
+    cache.save()
+
+    # The same stops in another order map the tour onto the new positions
+    kolejnosc = [0, 4, 2, 5, 1, 3]
+    ponownie = TourCache(path, "euclidean")
+    tour = ponownie.get(lon[kolejnosc], lat[kolejnosc])
+    assert [kolejnosc[p] for p in tour] == [3, 1, 5, 2, 4]
+    assert ponownie.get(*sub_route(1, 5)) is None
+    assert (ponownie.hits, ponownie.misses) == (1, 1)
+
+
+def test_hits_do_not_rewrite_the_file(tmp_path):
+    path = tmp_path / "tours.json"
+    cache = TourCache(path, "euclidean")
+    for seed in range(3):
+        cache.put(*sub_route(seed, 4), [1, 2, 3, 4])
+    cache.save()
+    zapisany = os.stat(path).st_mtime_ns
+
+    ponownie = TourCache(path, "euclidean")
+    assert ponownie.get(*sub_route(0, 4)) == [1, 2, 3, 4]
+    ponownie.save()
+    assert os.stat(path).st_mtime_ns == zapisany
+    # The hit is the most recently used tour once something new is saved
+    ponownie.put(*sub_route(3, 4), [4, 3, 2, 1])
+    ponownie.max_entries = 3
+    ponownie.save()
+    assert TourCache(path, "euclidean").get(*sub_route(0, 4)) == [1, 2, 3, 4]
+    assert TourCache(path, "euclidean").get(*sub_route(1, 4)) is None
+
+
+def test_another_metric_starts_empty(tmp_path):
+    path = tmp_path / "tours.json"
+    cache = TourCache(path, "euclidean")
+    cache.put(*sub_route(0, 4), [1, 2, 3, 4])
+    cache.save()
+    drogi = TourCache(path, "road:abc")
+    assert len(drogi) == 0 and drogi.get(*sub_route(0, 4)) is None
+    drogi.save()
+    with open(path, encoding='utf-8') as plik:
+        assert json.load(plik)['metric'] == "road:abc"
+
+
+def test_saving_keeps_the_tours_another_process_saved(tmp_path):
+    path = tmp_path / "tours.json"
+    pierwszy, drugi = TourCache(path, "euclidean"), TourCache(path, "euclidean")
+    pierwszy.put(*sub_route(0, 4), [1, 2, 3, 4])
+    drugi.put(*sub_route(1, 4), [4, 3, 2, 1])
+    pierwszy.save()
+    drugi.save()
+    wspolny = TourCache(path, "euclidean")
+    assert wspolny.get(*sub_route(0, 4)) == [1, 2, 3, 4]
+    assert wspolny.get(*sub_route(1, 4)) == [4, 3, 2, 1]
@@ -0,0 +1,84 @@
+import math
+import random
+import numpy as np
+from route_schedule import KATOWICE_RUSH_HOURS, RouteSchedule, SpeedProfile, schedule_routes
+
+
+def random_route(rng, n):
+    # Minutes: a depot and n stops, some with windows and service times
+    travel = [rng.uniform(5, 40) for _ in range(n)]
+    earliest = [-math.inf] + [rng.uniform(360, 480) if rng.random() < 0.5 else -math.inf for _ in range(n)]
+    latest = [math.inf] + [rng.uniform(420, 600) if rng.random() < 0.4 else math.inf for _ in range(n)]
+    service = [0.0] + [rng.choice([0.0, 5.0, 10.0]) for _ in range(n)]
+    return travel, earliest, latest, service
+
+
+def reference(travel, earliest, latest, service, start, profile=None):
+    # One position after another, driving each leg minute by minute
+    begin = [max(earliest[0], start)]
+    for k in range(1, len(earliest)):
+        t = begin[-1] + service[k - 1]
+        if profile is None:
+            t += travel[k - 1]
+        else:
+            pozostalo = travel[k - 1]
+            while pozostalo > 1e-9:
+                f = profile.factors[int(t // profile.hour) % len(profile.factors)]
+                krok = min((t // profile.hour + 1) * profile.hour - t, pozostalo / f)
+                t += krok
+                pozostalo -= krok * f
+        begin.append(max(t, earliest[k]))
+    return begin
+
+
+def test_fleet_pass_matches_route_by_route_schedules():
+    rng = random.Random(3)
+    trasy = [random_route(rng, n) for n in (0, 1, 4, 9, 6)]
+    for profile in (None, SpeedProfile(KATOWICE_RUSH_HOURS, 60.0)):
+        for trasa, schedule in zip(trasy, schedule_routes(*zip(*trasy), 360.0, profile)):
+            assert np.allclose(schedule.begin, reference(*trasa, 360.0, profile))
+            pojedynczo = RouteSchedule(*trasa, 360.0, profile)
+            for pole in ("begin", "arrival", "travel", "slack"):
+                assert np.allclose(getattr(schedule, pole), getattr(pojedynczo, pole))
+
+
+def test_slack_is_the_largest_delay_that_stays_on_time():
+    rng = random.Random(5)
+    for _ in range(30):
+        travel, earliest, latest, service = random_route(rng, 6)
+        schedule = RouteSchedule(travel, earliest, latest, service, 360.0)
+        if not schedule.feasible():
+            continue
+        for k in range(1, len(earliest)):
+            if math.isinf(schedule.slack[k]):
+                continue
+            # Pushing the start at k back by exactly the slack just fits
+            for opoznienie, na_czas in ((schedule.slack[k], True), (schedule.slack[k] + 0.01, False)):
+                begin = list(schedule.begin[:k]) + [schedule.begin[k] + opoznienie]
+                for j in range(k + 1, len(earliest)):
+                    begin.append(max(begin[-1] + service[j - 1] + travel[j - 1], earliest[j]))
+                assert all(b <= l + 1e-9 for b, l in zip(begin, latest)) == na_czas
+
+
+def test_insertion_check_agrees_with_a_new_schedule():
+    rng = random.Random(8)
+    for _ in range(30):
+        travel, earliest, latest, service = random_route(rng, 5)
+        schedule = RouteSchedule(travel, earliest, latest, service, 360.0)
+        if not schedule.feasible():
+            continue
+        od, do, obsluga = rng.uniform(360, 420), rng.uniform(420, 540), 5.0
+        przyjazd = [rng.uniform(5, 30) for _ in travel]
+        odjazd = [rng.uniform(5, 30) for _ in travel]
+        mozliwe = schedule.insertion_feasible(od, do, obsluga, przyjazd, odjazd)
+        for k in range(1, len(earliest)):
+            nowa = RouteSchedule(travel[:k - 1] + [przyjazd[k - 1], odjazd[k - 1]] + travel[k:],
+                                 earliest[:k] + [od] + earliest[k:], latest[:k] + [do] + latest[k:],
+                                 service[:k] + [obsluga] + service[k:], 360.0)
+            assert bool(mozliwe[k - 1]) == nowa.feasible()
+
+
+def test_slow_hours_only_slow_the_part_driven_in_them():
+    profile = SpeedProfile([1.0, 0.5], 60.0)
+    # 30 minutes at full speed, then 30 at half: 20 free-flow minutes left
+    assert np.allclose(profile.travel([30.0, 60.0, 0.0], [50.0, 20.0, 0.0]), [70.0, 40.0, 0.0])
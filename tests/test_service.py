@@ -0,0 +1,52 @@
+import asyncio
+import json
+from http import HTTPStatus
+import pytest
+import route_service
+from route_service import MAX_TIME_BUDGET, PlanningService, RequestError, parse_request
+
+STOP = {'longitude': 19.1, 'latitude': 50.3, 'weight': 120, 'city': "Bytom", 'hour': "6:00"}
+
+
+def rejected(body):
+    with pytest.raises(RequestError) as blad:
+        parse_request(json.dumps(body) if not isinstance(body, bytes) else body)
+    assert blad.value.status == HTTPStatus.BAD_REQUEST
+    return blad.value
+
+
+def test_request_defaults_and_budget_cap():
+    request = parse_request(json.dumps({'stops': [STOP], 'time_budget': 1e9}))
+    assert request['mode'] == "exact" and request['split'] == "sequential"
+    assert request['time_budget'] == MAX_TIME_BUDGET and request['aggregate'] is None
+
+
+def test_bad_requests_get_400_before_planning():
+    assert "invalid JSON" in str(rejected(b"{"))
+    assert "stops is empty" in str(rejected({'stops': []}))
+    assert "list of objects" in str(rejected({'stops': [1, 2]}))
+    assert "mode" in str(rejected({'stops': [STOP], 'mode': "fast"}))
+    assert "time_budget" in str(rejected({'stops': [STOP], 'time_budget': True}))
+    blad = rejected({'stops': [STOP, dict(STOP, weight="heavy"), dict(STOP, latitude=None)]})
+    assert str(blad) == "2 bad stops, nothing was planned"
+    assert [e['record'] for e in blad.errors] == [2, 3]
+
+
+def test_idle_client_gets_408(monkeypatch):
+    monkeypatch.setattr(route_service, "READ_TIMEOUT", 0.2)
+
+    async def run():
+        service = PlanningService(workers=1, queue_size=1)
+        server = await service.start(0)
+        try:
+            reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+            writer.write(b"POST /plan HTTP/1.1\r\n")
+            await writer.drain()
+            odpowiedz = await reader.read()
+            writer.close()
+            return odpowiedz
+        finally:
+            await service.close()
+
+    odpowiedz = asyncio.run(run())
+    assert odpowiedz.startswith(b"HTTP/1.1 408 ")
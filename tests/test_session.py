@@ -0,0 +1,40 @@
+import os
+from route_engine import RouteEngine
+
+CITIES = os.path.join(os.path.dirname(__file__), "..", "cities_data.csv")
+SETTINGS = {
+    'capacities': {'A': 400, 'B': 1500, 'C': 9000},
+    'aggregate_radius': 0.0,
+    'solver_mode': "heuristic",
+    'split_mode': "sweep",
+    'compare_split': True,
+    'time_budget': 0.5,
+}
+
+
+def planner():
+    # An engine that leaves the home directory alone
+    engine = RouteEngine()
+    engine.tour_cache_path = None
+    engine.workers = 1
+    return engine
+
+
+def test_session_keeps_the_plan_and_its_settings(tmp_path):
+    engine = planner()
+    for name, value in SETTINGS.items():
+        setattr(engine, name, value)
+    engine.load_csv([CITIES])
+    engine.process_all_routes()
+    engine.save_session(str(tmp_path / "sesja"))
+
+    wczytany = planner()
+    assert wczytany.load_session(str(tmp_path / "sesja")) == len(engine.orders) - 1
+    for name, value in SETTINGS.items():
+        assert getattr(wczytany, name) == value
+    assert wczytany.split_report == engine.split_report and engine.split_report
+    assert wczytany.calculate_driver_stats() == engine.calculate_driver_stats()
+    assert wczytany.total_distance() == engine.total_distance()
+    for name in "ABC":
+        assert [t.tolist() for t in wczytany.category_routes(name)] == \
+            [t.tolist() for t in engine.category_routes(name)]
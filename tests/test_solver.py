@@ -0,0 +1,80 @@
+import itertools
+import math
+import random
+from route_solver import lateness, nearest_neighbour, solve_exact, solve_local, tour_length, two_opt
+
+
+def asymmetric_matrix(seed, n):
+    # Straight-line distances with detours on some legs, like one-way streets
+    rng = random.Random(seed)
+    punkty = [(rng.random(), rng.random()) for _ in range(n + 1)]
+    return [[0.0 if i == j else math.dist(punkty[i], punkty[j]) * (1 + 2 * rng.random() * (rng.random() < 0.3))
+             for j in range(n + 1)] for i in range(n + 1)]
+
+
+def windows_for(dist, seed, n):
+    # Driving minutes as the distances, a few stops with a latest time
+    rng = random.Random(seed)
+    latest = [math.inf] + [rng.uniform(0.3, 2.0) if rng.random() < 0.4 else math.inf for _ in range(n)]
+    return dist, [-math.inf] * (n + 1), latest, [0.0] * (n + 1), 0.0
+
+
+def test_exact_solver_picks_the_direction_that_is_on_time():
+    # Both directions are equally long, only one reaches stop 1 in time
+    dist = [[0, 1, 2, 1], [1, 0, 1, 2], [2, 1, 0, 1], [1, 2, 1, 0]]
+    windows = (dist, [-math.inf] * 4, [math.inf, 1.5, math.inf, math.inf], [0.0] * 4, 0.0)
+    wynik = solve_exact(dist, windows=windows)
+    assert wynik['tour'] == [1, 2, 3]
+    assert wynik['optimal']
+    assert solve_exact(dist)['tour'] == [1, 2, 3]
+    windows[2][1], windows[2][3] = math.inf, 1.5
+    assert solve_exact(dist, windows=windows)['tour'] == [3, 2, 1]
+
+
+def test_exact_solver_finds_the_shortest_tour_on_time():
+    for seed in range(40):
+        dist = asymmetric_matrix(seed, 6)
+        windows = windows_for(dist, seed, 6)
+        na_czas = [tour_length(dist, list(p)) for p in itertools.permutations(range(1, 7))
+                   if lateness(windows, p) == 0]
+        for limits in ({'held_karp_limit': 6}, {'held_karp_limit': 0, 'exact_limit': 6}):
+            wynik = solve_exact(dist, windows=windows, **limits)
+            if na_czas:
+                assert wynik['optimal']
+                assert lateness(windows, wynik['tour']) == 0
+                assert abs(wynik['length'] - min(na_czas)) < 1e-9
+            else:
+                assert not wynik['optimal']
+
+
+def test_local_search_is_never_later_than_nearest_neighbour():
+    for seed in range(30):
+        dist = asymmetric_matrix(seed, 12)
+        windows = windows_for(dist, seed, 12)
+        wynik = solve_local(dist, time_budget=0.05, seed=seed, windows=windows)
+        assert sorted(wynik['tour']) == list(range(1, 13))
+        assert lateness(windows, wynik['tour']) <= lateness(windows, nearest_neighbour(dist)) + 1e-9
+
+
+def test_two_opt_never_lengthens_an_asymmetric_tour():
+    for seed in range(100):
+        dist = asymmetric_matrix(seed, 25)
+        start = nearest_neighbour(dist)
+        assert tour_length(dist, two_opt(dist, start)) <= tour_length(dist, start) + 1e-9
+
+
+def test_local_search_beats_nearest_neighbour_on_asymmetric_matrices():
+    for seed in range(60):
+        dist = asymmetric_matrix(seed, 20)
+        wynik = solve_local(dist, time_budget=0.05, seed=seed)
+        assert abs(wynik['length'] - tour_length(dist, wynik['tour'])) < 1e-9
+        assert wynik['length'] <= tour_length(dist, nearest_neighbour(dist)) + 1e-9
+
+
+def test_exact_solver_agrees_with_held_karp_on_asymmetric_matrices():
+    for seed in range(20):
+        dist = asymmetric_matrix(seed, 12)
+        held_karp = solve_exact(dist, held_karp_limit=12)
+        bnb = solve_exact(dist, held_karp_limit=0, exact_limit=12)
+        assert bnb['optimal']
+        assert abs(bnb['length'] - held_karp['length']) < 1e-9
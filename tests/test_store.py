@@ -0,0 +1,42 @@
+import gzip
+import os
+import numpy as np
+from route_store import DEPOT, read_records, read_stops
+
+CITIES = os.path.join(os.path.dirname(__file__), "..", "cities_data.csv")
+SPODEK = (19.027401, 50.266247, 0, "Spodek")
+
+
+def test_plain_and_gzip_files_stream_into_one_table(tmp_path):
+    with open(CITIES, encoding='utf-8') as plik:
+        naglowek, *wiersze = plik.read().splitlines()
+    pierwszy = tmp_path / "rano.csv"
+    pierwszy.write_text("\n".join([naglowek] + wiersze[:10]) + "\n", encoding='utf-8')
+    drugi = tmp_path / "poludnie.csv.gz"
+    zepsuty = "19.1,50.3,heavy,Bytom,6:00"
+    with gzip.open(drugi, "wt", encoding='utf-8') as plik:
+        plik.write("\n".join([naglowek, zepsuty] + wiersze[10:]) + "\n")
+
+    table, errors = read_stops([pierwszy, drugi], SPODEK, chunk_size=3)
+    calosc, bez_bledow = read_stops([CITIES], SPODEK)
+    assert not bez_bledow
+    assert len(table) == len(calosc) == len(wiersze) + 1
+    assert table.row(DEPOT) == (19.027401, 50.266247, 0.0, "Spodek", "")
+    for column in ("lon", "lat", "weight", "minutes", "earliest", "latest", "service"):
+        assert np.array_equal(getattr(table, column), getattr(calosc, column))
+    assert [table.row(i) for i in range(len(table))] == [calosc.row(i) for i in range(len(calosc))]
+    assert errors == [(drugi, 2, "could not convert string to float: 'heavy'")]
+
+
+def test_records_take_the_csv_columns_and_time_windows():
+    table, errors = read_records([
+        {'longitude': 19.1, 'latitude': 50.3, 'weight': 120, 'city': "Bytom", 'hour': "6:00"},
+        {'longitude': 19.2, 'latitude': 50.4, 'weight': 80, 'city': "Tychy", 'hour': "7:30",
+         'earliest': "8:00", 'latest': "9:15", 'service': 10},
+        {'longitude': "nan", 'latitude': 50.4, 'weight': 80, 'city': "Gliwice", 'hour': "7:30"},
+    ], SPODEK)
+    assert errors == [("<records>", 3, "non-finite number")]
+    assert len(table) == 3
+    assert table.earliest[1:].tolist() == [360.0, 480.0]
+    assert table.latest[1:].tolist() == [np.inf, 555.0]
+    assert table.service[1:].tolist() == [0.0, 10.0]